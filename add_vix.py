@@ -7,8 +7,13 @@ import os
 import re
 from pathlib import Path
 import pandas as pd
-from data_fetcher import get_price_data
-from config import DATA_PATH, SYMBOLS, START_DATE
+from datetime import datetime
+from data_fetcher import get_price_data, is_current
+from config import DATA_PATH, SYMBOLS, START_DATE, PROCESSED_PATH
+from data_store import has_frame, list_frames, read_frame, read_manifest, append_frame, write_columns
+from utils.tracing import traced
+
+VIX_FRAME = "VIX_daily"
 
 
 def fetch_vix_data(start_date=START_DATE):
@@ -22,9 +27,7 @@ def fetch_vix_data(start_date=START_DATE):
 
 
 def save_vix_data(vix_data, data_dir=DATA_PATH):
-    """Save cleaned VIX to canonical filename `VIX_daily.csv` in data_dir."""
-    os.makedirs(data_dir, exist_ok=True)
-    out = Path(data_dir) / "VIX_daily.csv"
+    """Save cleaned VIX to the canonical `VIX_daily` frame in data_dir."""
     # ensure index name
     if vix_data is not None and not vix_data.empty:
         # ensure datetime index
@@ -72,7 +75,8 @@ def save_vix_data(vix_data, data_dir=DATA_PATH):
         # write with explicit Date index label and canonical column order
         df_out.index.name = "Date"
         df_out = df_out[["Close", "High", "Low", "Open", "Volume"]]
-        df_out.to_csv(out, index_label="Date")
+        # 与已有数据重叠的日期被覆盖，其余只追加
+        append_frame(data_dir, VIX_FRAME, df_out, meta={"fetched_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")})
     else:
         print("⚠️ vix_data empty, nothing saved")
 
@@ -118,20 +122,28 @@ def _read_vix_file(path: Path) -> pd.DataFrame:
     return df
 
 
-def update_processed_with_vix(processed_dir="processed", data_dir=DATA_PATH):
-    """Inject VIX values into processed daily CSVs in-place.
+def _load_vix(data_dir):
+    """读取 VIX：优先列式存储，其次兼容旧版（可能带杂乱表头的）VIX_daily.csv。"""
+    if has_frame(data_dir, VIX_FRAME):
+        return read_frame(data_dir, VIX_FRAME)
+    vix_path = Path(data_dir) / "VIX_daily.csv"
+    if vix_path.exists():
+        return _read_vix_file(vix_path)
+    return None
+
+
+def update_processed_with_vix(processed_dir=PROCESSED_PATH, data_dir=DATA_PATH):
+    """Inject VIX values into processed daily frames in-place.
 
-    - Reads `data/VIX_daily.csv` (robust to messy headers).
+    - Reads the `VIX_daily` frame (or a legacy, possibly messy `VIX_daily.csv`).
     - Picks column preference: 'Adj Close' -> 'Close' -> 'Price' -> first numeric.
-    - Aligns by date (date-only), forward-fills, writes back processed files.
+    - Aligns by date (date-only), forward-fills, rewrites only the VIX column.
     """
-    vix_path = Path(data_dir) / "VIX_daily.csv"
-    if not vix_path.exists():
-        print("⚠️ VIX 数据文件不存在 (VIX_daily.csv)。请先运行数据获取。")
+    vix_df = _load_vix(data_dir)
+    if vix_df is None:
+        print("⚠️ VIX 数据不存在 (VIX_daily)。请先运行数据获取。")
         return
-
-    vix_df = _read_vix_file(vix_path)
-    if vix_df is None or vix_df.empty:
+    if vix_df.empty:
         print("⚠️ 无法读取 VIX 数据或数据为空。")
         return
 
@@ -150,37 +162,35 @@ def update_processed_with_vix(processed_dir="processed", data_dir=DATA_PATH):
         print("⚠️ 找不到可用的 VIX 数值列。文件列名：", vix_df.columns.tolist())
         return
 
-    # create a date->value mapping (date objects)
-    vix_series = vix_df[vix_col].copy()
-    vix_series.index = pd.to_datetime(vix_series.index).date
+    # date -> value 映射（按日期对齐，同一天保留最后一条）
+    vix_series = pd.Series(vix_df[vix_col].to_numpy(), index=pd.DatetimeIndex(vix_df.index).normalize())
+    vix_series = vix_series[~vix_series.index.duplicated(keep="last")]
 
-    processed_p = Path(processed_dir)
-    if not processed_p.exists():
+    if not os.path.isdir(processed_dir):
         print(f"⚠️ 目录 {processed_dir} 不存在。")
         return
 
-    for f in sorted(processed_p.glob("*_daily_clean.csv")):
-        try:
-            df = pd.read_csv(f, parse_dates=[0], engine="python", on_bad_lines="skip")
-        except Exception:
-            df = pd.read_csv(f, engine="python", on_bad_lines="skip")
-        if "Date" not in df.columns:
-            print(f"⚠️ 文件 {f.name} 缺少 Date 列，跳过。")
-            continue
-
-        dates = df["Date"].dt.date
+    for name in list_frames(processed_dir, suffix="_daily_clean"):
+        df = read_frame(processed_dir, name, columns=[])
         # map vix values; use ffill on the mapped series
-        mapped = pd.Series([vix_series.get(d, pd.NA) for d in dates], index=df.index)
-        mapped = mapped.ffill()
-        df["VIX"] = mapped.values
-        df.to_csv(f, index=False)
-        print(f"✅ 已更新 {f.name}，共 {len(df)} 行，VIX 注入完成。")
+        mapped = vix_series.reindex(df.index.normalize()).ffill()
+        write_columns(processed_dir, name, {"VIX": mapped.to_numpy(dtype=float, na_value=float("nan"))})
+        print(f"✅ 已更新 {name}，共 {len(df)} 行，VIX 注入完成。")
 
 
+@traced("vix")
 def add_allVix():
-    vix_data = fetch_vix_data()
-    save_vix_data(vix_data)
-    update_processed_with_vix(processed_dir="processed", data_dir=DATA_PATH)
+    # 按 manifest 只下载缺失区间；已是最新时不联网
+    manifest = read_manifest(DATA_PATH, VIX_FRAME)
+    last = pd.Timestamp(manifest["last"]) if manifest and manifest.get("last") else None
+    fetched_at = manifest.get("meta", {}).get("fetched_at") if manifest else None
+    if is_current(last, fetched_at, "1d"):
+        print("✅ VIX 已是最新数据")
+    else:
+        start = last.strftime("%Y-%m-%d") if last is not None else START_DATE
+        vix_data = fetch_vix_data(start_date=start)
+        save_vix_data(vix_data)
+    update_processed_with_vix(processed_dir=PROCESSED_PATH, data_dir=DATA_PATH)
 
 
 if __name__ == "__main__":
@@ -2,14 +2,28 @@
 import os
 import json
 import time
+import asyncio
+import threading
 import pandas as pd
 from datetime import datetime
-from utils.api_helper import call_deepseek_api
+from utils.api_helper import call_deepseek_api, call_deepseek_api_stream
+from utils.json_stream import JSONArrayStreamParser
 from config import AI_MODEL, AGENT_SYSTEM_PROMPT, DATA_PATH
 # ai_agent.py (新增部分)
 from signal_validator import SignalValidator
 from config import Signals_path
+from config import SIGNAL_AUDIT, SIGNAL_AUDIT_ASYNC, SIGNAL_TAPE, SIGNAL_TAPE_PATH
+from signal_queue import SignalAuditLog, SIGNAL_COLUMNS, TAPE_COLUMNS
+from price_index import PriceIndex
 from config import API_LOG_PATH
+from config import SIGNAL_FANOUT, SIGNAL_SHARD_SIZE, SIGNAL_MAX_IN_FLIGHT
+from config import PROMPT_FORMAT, INTRADAY_INTERVALS
+from config import SIGNAL_STREAMING, SIGNAL_STREAM_MAX_CHARS
+from prompt_encoder import encode_with_budget, encode_positions
+from utils.tracing import span, traced
+
+# 分片并发时多个线程同时写 API 日志
+_api_log_lock = threading.Lock()
 
 def _write_api_log(request_payload, response_text):
     import json
@@ -22,8 +36,10 @@ def _write_api_log(request_payload, response_text):
     }
 
     os.makedirs(os.path.dirname(API_LOG_PATH), exist_ok=True)
-    with open(API_LOG_PATH, "a", encoding="utf-8") as f:
-        f.write(json.dumps(entry, ensure_ascii=False, indent=2) + "\n")
+    text = json.dumps(entry, ensure_ascii=False, indent=2) + "\n"
+    with _api_log_lock:
+        with open(API_LOG_PATH, "a", encoding="utf-8") as f:
+            f.write(text)
 
 
 class AIAgent:
@@ -41,37 +57,208 @@ class AIAgent:
 # 🤖 AI 智能交易 Agent
 # ==========================================================
 class AIAgent:
-    def __init__(self):
+    def __init__(self, fanout=SIGNAL_FANOUT, shard_size=SIGNAL_SHARD_SIZE, max_in_flight=SIGNAL_MAX_IN_FLIGHT,
+                 prompt_format=PROMPT_FORMAT, streaming=SIGNAL_STREAMING, stream_max_chars=SIGNAL_STREAM_MAX_CHARS):
         self.model = AI_MODEL
         self.prompt = AGENT_SYSTEM_PROMPT
-        # Use the centralized Signals_path as the single file for both logs and executor input
+        # 流式输出：逐个解析、验证信号；超过 stream_max_chars 个字符时取消生成
+        self.streaming = streaming
+        self.stream_max_chars = stream_max_chars
+        # "compact": 表格编码；"json": 原 indent=2 JSON
+        self.prompt_format = prompt_format
+        # 分片并发设置：fanout=True 且股票数超过 shard_size 时按组并发请求
+        self.fanout = fanout
+        self.shard_size = max(1, int(shard_size))
+        self.max_in_flight = max(1, int(max_in_flight))
+        # Signals_path 只作为审计日志（只追加），执行器不再从中读取
         self.log_path = Signals_path
-        # ensure directory exists for Signals_path
-        dirpath = os.path.dirname(Signals_path)
-        if dirpath:
-            os.makedirs(dirpath, exist_ok=True)
+        self.audit = SignalAuditLog(Signals_path, async_write=SIGNAL_AUDIT_ASYNC) if SIGNAL_AUDIT else None
+        # 信号带：记录验证前的原始信号，sweep.py 按不同参数重放
+        self.tape = SignalAuditLog(SIGNAL_TAPE_PATH, async_write=SIGNAL_AUDIT_ASYNC, columns=TAPE_COLUMNS) if SIGNAL_TAPE else None
+        # (symbol, date) -> 成交价，回测时由控制器注入
+        self.price_index = None
 
     # ------------------------------------------------------
     # 每日生成交易信号
     # ------------------------------------------------------
 
         
-    def generate_signals(self, daily_data: dict, positions: dict):
+    @traced("agent.generate_signals")
+    def generate_signals(self, daily_data: dict, positions: dict, on_signal=None):
         """
         daily_data: {symbol: {指标...}}
         positions: 当前持仓信息
+        on_signal: 流式模式下每条信号通过验证时立即回调 on_signal(signal_dict)
         """
         print("🤖 正在调用 AI 模型生成交易信号...")
+        today = self._today(daily_data)
+        # 只接受本次提示词里出现过的股票
+        validator = SignalValidator(positions, universe=daily_data.keys())
+
+        if self.streaming:
+            def fetch(user_prompt, n_symbols):
+                return self._stream_signals(user_prompt, today, validator, n_symbols, on_signal)
+        else:
+            def fetch(user_prompt, n_symbols):
+                return self._request_signals(user_prompt, today)
+
+        if self.fanout and len(daily_data) > self.shard_size:
+            df = self._generate_sharded(today, daily_data, positions, fetch)
+        else:
+            user_prompt = self._build_user_prompt(today, daily_data, positions)
+            df = fetch(user_prompt, len(daily_data))
+
+        # === 验证信号 ===（流式模式下每条信号在到达时已验证）
+        if self.streaming:
+            df_valid = df
+            print(f"✅ {len(df_valid)} 个信号通过验证")
+            # 通过的 + 被过滤的 = 模型的全部原始输出
+            frames = [f for f in (df, validator.rejected) if not f.empty]
+            raw = pd.concat(frames, ignore_index=True) if frames else df
+        else:
+            raw = df
+            with span("agent.validate", signals=len(df)):
+                df_valid = validator.validate_signals(df)
+
+        if self.tape is not None and not raw.empty:
+            self.tape.write(raw.assign(Date=today))
+
+        print("✅ 最终可执行信号:")
+        print(df_valid)
+        return df_valid
+
+    # ------------------------------------------------------
+    # 分片并发：按股票分组，每组单独请求，最多 max_in_flight 个同时在途
+    # ------------------------------------------------------
+    def _generate_sharded(self, today, daily_data, positions, fetch):
+        symbols = list(daily_data)
+        shards = [symbols[i:i + self.shard_size] for i in range(0, len(symbols), self.shard_size)]
+        print(f"🔀 分片请求：{len(symbols)} 只股票分为 {len(shards)} 组，最多 {self.max_in_flight} 组并发")
+
+        prompts = []
+        for shard in shards:
+            wanted = {sym.upper() for sym in shard}
+            shard_data = {sym: daily_data[sym] for sym in shard}
+            # 每个分片只带上本组股票的持仓
+            shard_positions = {sym: pos for sym, pos in (positions or {}).items() if str(sym).upper() in wanted}
+            prompts.append((self._build_user_prompt(today, shard_data, shard_positions), len(shard)))
+
+        async def fan_out():
+            semaphore = asyncio.Semaphore(self.max_in_flight)
+
+            async def run(prompt, n_symbols):
+                async with semaphore:
+                    # call_deepseek_api 是阻塞调用，放到线程里执行
+                    return await asyncio.to_thread(fetch, prompt, n_symbols)
+
+            return await asyncio.gather(*(run(p, n) for p, n in prompts))
+
+        frames = [df for df in asyncio.run(fan_out()) if not df.empty]
+        if not frames:
+            return pd.DataFrame(columns=["symbol", "action", "confidence", "reason", "Date"])
+        return pd.concat(frames, ignore_index=True)
+
+    # ------------------------------------------------------
+    # 流式：边接收边解析 JSON 数组，每个对象闭合后立即验证
+    # ------------------------------------------------------
+    @traced("agent.stream")
+    def _stream_signals(self, user_prompt, today, validator, n_symbols, on_signal=None):
+        """返回已通过验证的信号 DataFrame。
+
+        输出的对象数超过股票数的 2 倍，或输出字符数超过 stream_max_chars 时提前取消生成。
+        """
+        parser = JSONArrayStreamParser()
+        received = []
+        valid_rows = []
+        n_objects = 0
+        cancelled = None
+        start = time.time()
+
+        stream = call_deepseek_api_stream(
+            model=self.model,
+            system_prompt=self.prompt,
+            user_prompt=user_prompt,
+            timeout=300,
+            retries=3,
+            verbose=False
+        )
+        try:
+            for text in stream:
+                received.append(text)
+                for obj in parser.feed(text):
+                    n_objects += 1
+                    obj["Date"] = today
+                    signal = validator.validate_signal(obj)
+                    if signal is not None:
+                        if not valid_rows:
+                            print(f"⚡ 首个可执行信号用时 {time.time() - start:.2f}s")
+                        print(f"⚡ {signal['symbol']} {signal['action']} ({signal['confidence']:.2f})")
+                        valid_rows.append(signal)
+                        if on_signal is not None:
+                            on_signal(signal)
+
+                # 数组闭合后不主动断开，让剩余内容（代码块结尾、[DONE]）读完，完整输出才会写入缓存
+                if n_objects > 2 * n_symbols:
+                    cancelled = f"输出了 {n_objects} 个信号，超过股票数 {n_symbols} 的 2 倍"
+                    break
+                if sum(len(t) for t in received) > self.stream_max_chars:
+                    cancelled = f"输出超过 {self.stream_max_chars} 个字符"
+                    break
+        finally:
+            # 关闭生成器会同时关闭 HTTP 连接
+            stream.close()
+
+        response = "".join(received)
+        if cancelled:
+            print(f"🛑 提前取消生成：{cancelled}")
+        if parser.errors:
+            print(f"❌ {len(parser.errors)} 个信号对象解析失败")
+        if not response.strip():
+            print("❌ API 返回空响应（长度为0或仅空白）。这可能表示模型返回了空内容，或服务器返回了空体。")
+
+        # ✅ 写入 API 输入 & 输出日志
+        _write_api_log(
+            request_payload={
+                "model": self.model,
+                "system_prompt": self.prompt,
+                "user_prompt": user_prompt,
+                "stream": True,
+            },
+            response_text=response
+        )
+        return pd.DataFrame(valid_rows, columns=["symbol", "action", "confidence", "reason", "Date"])
+
+    # ------------------------------------------------------
+    # Prompt 构建 / 请求与解析
+    # ------------------------------------------------------
+    @staticmethod
+    def _today(daily_data):
         # normalize today to a string to avoid Timestamp serialization issues
         today = list(daily_data.values())[0]["daily"]["Date"]
         if isinstance(today, (pd.Timestamp, datetime)):
-            today = today.strftime("%Y-%m-%d")
-        else:
-            try:
-                # if it's an array-like (e.g. numpy), try to convert
-                today = str(today)
-            except Exception:
-                today = ""
+            return today.strftime("%Y-%m-%d")
+        try:
+            # if it's an array-like (e.g. numpy), try to convert
+            return str(today)
+        except Exception:
+            return ""
+
+    @traced("agent.prompt_build")
+    def _build_user_prompt(self, today, daily_data, positions):
+        if self.prompt_format == "compact":
+            formatted_positions = encode_positions(positions)
+
+            def render(market_text):
+                return self._render_user_prompt(
+                    today,
+                    "Below is today's stock data, one table per timeframe "
+                    "(first row is the header, empty cells are missing values):",
+                    market_text,
+                    formatted_positions,
+                )
+
+            user_prompt, _ = encode_with_budget(daily_data, render)
+            return user_prompt
 
         formatted = {}
         for sym, data in daily_data.items():
@@ -79,6 +266,7 @@ class AIAgent:
                 "daily": {k: v for k, v in data["daily"].items() if k not in ["Open", "High", "Low"]},
                 "weekly": data["weekly"],
                 "monthly": data["monthly"],
+                **{tf: data.get(tf, {}) for tf in INTRADAY_INTERVALS},
             }
 
         # JSON can't serialize pandas.Timestamp/datetime objects by default.
@@ -86,7 +274,7 @@ class AIAgent:
         def _make_serializable(obj):
             # pandas Timestamp
             if isinstance(obj, (pd.Timestamp, datetime)):
-                return obj.strftime("%Y-%m-%d")
+                return obj.strftime("%Y-%m-%d %H:%M" if obj.hour or obj.minute else "%Y-%m-%d")
             # numpy scalar types
             try:
                 import numpy as _np
@@ -110,13 +298,24 @@ class AIAgent:
         formatted_data = json.dumps(formatted_safe, indent=2, ensure_ascii=False)
         formatted_positions = json.dumps(positions_safe, indent=2, ensure_ascii=False)
 
+        return self._render_user_prompt(
+            today,
+            "Below is today's stock data (read from the processed CSV files):",
+            formatted_data,
+            formatted_positions,
+        )
+
+    @staticmethod
+    def _render_user_prompt(today, data_intro, formatted_data, formatted_positions):
         # Build the user prompt without using an f-string to avoid accidental
         # interpolation of literal JSON braces in the sample output block.
-        user_prompt = (
+        return (
             "Here is the information you need:\n"
             "Today is "
             + str(today)
-            + ".\nBelow is today's stock data (read from the processed CSV files):\n\n"
+            + ".\n"
+            + data_intro
+            + "\n\n"
             + formatted_data
             + "\n\nCurrent positions are as follows:\n"
             + formatted_positions
@@ -131,15 +330,18 @@ class AIAgent:
             + "          ]\n"
         )
 
+    def _request_signals(self, user_prompt, today):
+        """调用模型并把输出解析为未验证的信号 DataFrame。"""
         # ❌ 不再打印 verbose
-        response = call_deepseek_api(
-            model=self.model,
-            system_prompt=self.prompt,
-            user_prompt=user_prompt,
-            timeout=300,
-            retries=3,
-            verbose=False
-        )
+        with span("agent.api_call", prompt_chars=len(user_prompt)):
+            response = call_deepseek_api(
+                model=self.model,
+                system_prompt=self.prompt,
+                user_prompt=user_prompt,
+                timeout=300,
+                retries=3,
+                verbose=False
+            )
 
         # ✅ 写入 API 输入 & 输出日志
         _write_api_log(
@@ -151,50 +353,39 @@ class AIAgent:
             response_text=response
         )
 
-
         # 如果响应为空字符串或仅包含空白，给出更明确的诊断并跳过解析
         if not response or (isinstance(response, str) and response.strip() == ""):
             print("❌ API 返回空响应（长度为0或仅空白）。这可能表示模型返回了空内容，或服务器返回了空体。")
-            df = pd.DataFrame(columns=["symbol", "action", "confidence", "reason", "Date"])
-        else:
-            # 尝试解析 API 返回的 JSON；若解析失败（例如 API 错误或余额不足），创建空的 signals DataFrame
-            try:
+            return pd.DataFrame(columns=["symbol", "action", "confidence", "reason", "Date"])
+
+        # 尝试解析 API 返回的 JSON；若解析失败（例如 API 错误或余额不足），创建空的 signals DataFrame
+        try:
+            with span("agent.parse", chars=len(response)):
                 parsed = json.loads(response)
                 df = pd.DataFrame(parsed)
                 df["Date"] = today
-                print("✅ AI 决策输出 (parsed JSON raw):")
-                try:
-                    # print the parsed JSON array in full
-                    print(json.dumps(parsed, ensure_ascii=False, indent=2))
-                except Exception:
-                    print(repr(parsed))
-
-                # print("✅ AI 决策输出 (DataFrame, full):")
-                # try:
-                #     # print full dataframe without pandas truncation
-                #     print(df.to_string(index=False))
-                # except Exception:
-                #     print(df)
-            except Exception as e:
-                print("❌ AI 输出解析失败:", e)
-                # 打印原始响应全文以便排查
-                df = pd.DataFrame(columns=["symbol", "action", "confidence", "reason", "Date"])
-
-        # === 验证信号 ===
-        validator = SignalValidator(positions)
-        df_valid = validator.validate_signals(df)
-
-        print("✅ 最终可执行信号:")
-        print(df_valid)
-        return df_valid
+            print("✅ AI 决策输出 (parsed JSON raw):")
+            try:
+                # print the parsed JSON array in full
+                print(json.dumps(parsed, ensure_ascii=False, indent=2))
+            except Exception:
+                print(repr(parsed))
+            return df
+        except Exception as e:
+            print("❌ AI 输出解析失败:", e)
+            return pd.DataFrame(columns=["symbol", "action", "confidence", "reason", "Date"])
 
     # ------------------------------------------------------
     # 保存信号日志
     # ------------------------------------------------------
+    @traced("agent.save_signals")
     def save_signals(self, df):
+        """把已验证的信号转换为执行器输入（补上当日收盘价），写入审计日志并返回。"""
         # If nothing to save, skip
         if df.empty:
-            return
+            return pd.DataFrame(columns=SIGNAL_COLUMNS)
+
+        price_index = self._get_price_index(df["symbol"])
 
         # Build executor-ready rows from incoming df (which is the validated signals)
         out_rows = []
@@ -208,26 +399,8 @@ class AIAgent:
             reason = row.get("reason", "") or ""
             date = row.get("Date", "")
 
-            price = None
-            # Try to fetch Close price for the given date from processed CSV
-            try:
-                proc_path = os.path.join("processed", f"{symbol.lower()}_daily_clean.csv")
-                if os.path.exists(proc_path):
-                    dfp = pd.read_csv(proc_path, parse_dates=["Date"]) 
-                    # match by date; allow date string or Timestamp
-                    if isinstance(date, str):
-                        match_date = pd.to_datetime(date).date()
-                    elif hasattr(date, "date"):
-                        match_date = pd.to_datetime(date).date()
-                    else:
-                        match_date = None
-
-                    if match_date is not None:
-                        rowp = dfp[dfp["Date"].dt.date == match_date]
-                        if not rowp.empty and "Close" in rowp.columns:
-                            price = float(rowp.iloc[-1]["Close"])
-            except Exception:
-                price = None
+            # 按 (symbol, date) 从价格索引查成交价（口径见 config.FILL_PRICE）
+            price = price_index.price(symbol, date) if date is not None and str(date) != "" else None
 
             out_rows.append({
                 "Symbol": symbol,
@@ -238,38 +411,25 @@ class AIAgent:
                 "Price": price
             })
 
-        df_signals = pd.DataFrame(out_rows)
-
-        # Normalize text columns
-        if not df_signals.empty:
-            df_signals["Symbol"] = df_signals["Symbol"].astype(str).str.upper()
-            df_signals["Action"] = df_signals["Action"].astype(str).str.upper()
-
-        # Merge with existing Signals_path (single source of truth) and dedupe by Symbol/Action/Date keeping latest
-        try:
-            if os.path.exists(Signals_path):
-                existing = pd.read_csv(Signals_path)
-                combined = pd.concat([existing, df_signals], ignore_index=True)
-            else:
-                combined = df_signals
-
-            # Normalize before dedupe
-            if not combined.empty:
-                if "Symbol" in combined.columns:
-                    combined["Symbol"] = combined["Symbol"].astype(str).str.upper()
-                if "Action" in combined.columns:
-                    combined["Action"] = combined["Action"].astype(str).str.upper()
-
-                # Drop duplicates keeping the latest occurrence
-                combined = combined.drop_duplicates(subset=["Symbol", "Action", "Date"], keep="last")
-
-            combined.to_csv(Signals_path, index=False)
-            written = len(combined)
-        except Exception:
-            # On any failure, fallback to writing only the new batch
-            df_signals.to_csv(Signals_path, index=False)
-            written = len(df_signals)
-
-        print(f"📝 已写入合并信号文件: {Signals_path} (共 {written} 条)")
+        df_signals = pd.DataFrame(out_rows, columns=SIGNAL_COLUMNS)
+
+        # 只追加到审计日志（后台写入），执行器直接使用返回的这一批
+        if self.audit is not None:
+            self.audit.write(df_signals)
+        return df_signals
+
+    def _get_price_index(self, symbols):
+        """回测中由 BacktestController 注入；单独使用时按需从 processed/ 构建一次。"""
+        symbols = {str(s).upper() for s in symbols}
+        if self.price_index is None or any(s not in self.price_index for s in symbols):
+            known = set(self.price_index.symbols) if self.price_index is not None else set()
+            self.price_index = PriceIndex.from_store(sorted(known | symbols))
+        return self.price_index
+
+    def close(self):
+        """等待信号审计日志和信号带写完。"""
+        for log in (self.audit, self.tape):
+            if log is not None:
+                log.close()
 
 
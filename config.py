@@ -1,19 +1,87 @@
 # config.py
+import os
 # SYMBOLS = ["AAPL", "MSFT", "NVDA","AMZN","GOOGL"]
 SYMBOLS = ["tssi", "bbai","tqqq","nvda"]
 START_DATE = "2025-01-01"
+# 日内 K 线：在日/周/月线之外额外抓取、预处理并放进回测快照的周期，可选 "1h" / "15m" / "5m"，例如 ["1h"]
+INTRADAY_INTERVALS = []
+# yfinance 日内数据最多能回溯的天数（1h 约 730 天，15m / 5m 约 60 天），超出部分无法补抓
+INTRADAY_LOOKBACK_DAYS = {"1h": 729, "15m": 59, "5m": 59}
+# 交易所时区：日内 bar 统一转换为交易所当地时间后去掉时区存储
+MARKET_TZ = "America/New_York"
+# 预处理分块：每只股票每次最多读入这么多行，块之间传递指标递推状态（峰值内存约为 股票数 × 块行数）
+PREPROCESS_CHUNK_ROWS = 20000
 DATA_PATH = "data/"
+PROCESSED_PATH = "processed/"
 Signals_path="logs/ai_signals_log.csv"
+# 信号审计日志：每天的信号追加写入 Signals_path（执行器直接从内存接收当天信号）
+SIGNAL_AUDIT = True
+SIGNAL_AUDIT_ASYNC = True       # 后台线程写入，不阻塞回测主循环
+# 信号带：模型每天的原始输出（验证前），供 sweep.py 离线重放
+SIGNAL_TAPE = True
+SIGNAL_TAPE_PATH = "logs/signal_tape.csv"
 FINNHUB_API_KEY = ""
 API_LOG_PATH = "logs/api_debug_log.jsonl"
 
+# 行情抓取并发设置
+FETCH_MAX_WORKERS = 8      # Finnhub 线程池 / yfinance 下载线程上限
+FETCH_BATCH_SIZE = 50      # 每次 yf.download 请求的股票数
+
+# Finnhub 本地缓存（按接口设置过期时间，单位秒）
+FINNHUB_CACHE_DIR = "cache/finnhub"
+FINNHUB_CACHE_TTL = {
+    "company_basic_financials": 7 * 24 * 3600,   # 流通股本最多按季度变化
+    "news_sentiment": 12 * 3600,
+    "stock_option_expiration": 24 * 3600,
+}
+FINNHUB_CACHE_MAX_ENTRIES = 5000
+
 
 # AI 模型配置
 DEEPSEEK_API_KEY = ""
-DEEPSEEK_API_URL = "https://api.deepseek.com"
+# 可用环境变量指向本地模拟服务，例如 DEEPSEEK_API_URL=http://127.0.0.1:8765（见 utils/mock_deepseek_server.py）
+DEEPSEEK_API_URL = os.environ.get("DEEPSEEK_API_URL", "https://api.deepseek.com")
 AI_MODEL = "deepseek-chat"  
 Model_Temperature = 0.2
 Model_Max_Tokens = 2500
+
+# Prompt 编码："compact" 为每个周期一张表（表头 + 固定小数位数值行），"json" 为原 indent=2 JSON
+PROMPT_FORMAT = "compact"
+# 每个周期发送哪些列，None 表示全部（日线默认去掉 Open/High/Low），例如 {"daily": ["Date", "Close", "RSI"]}
+PROMPT_COLUMNS = None
+PROMPT_DECIMALS = 3
+# 估算 token 超出预算时的处理："warn" 只警告，"trim" 依次去掉日内/monthly/weekly 表；None 不检查
+PROMPT_TOKEN_BUDGET = 12000
+PROMPT_BUDGET_ACTION = "warn"
+
+# 信号分片并发：股票数超过 SIGNAL_SHARD_SIZE 时按组拆成多个请求并发发送
+SIGNAL_FANOUT = False
+SIGNAL_SHARD_SIZE = 10
+SIGNAL_MAX_IN_FLIGHT = 4
+
+# 流式输出：边接收边解析信号，输出字符数超过上限时取消生成
+SIGNAL_STREAMING = False
+SIGNAL_STREAM_MAX_CHARS = 20000
+
+# HTTP 客户端：连接池、退避重试、限流与熔断
+HTTP_POOL_SIZE = 10
+HTTP_BACKOFF_BASE = 1.0          # 指数退避基数（秒），实际等待在 [0, base * 2^(n-1)] 内随机
+HTTP_BACKOFF_MAX = 60.0          # 单次等待上限（秒），同时限制 Retry-After
+HTTP_RATE_LIMIT = 2.0            # 每秒最多请求数，None 表示不限流
+HTTP_RATE_BURST = 4
+CIRCUIT_FAILURE_THRESHOLD = 5    # 连续失败多少次后熔断
+CIRCUIT_RESET_TIMEOUT = 60       # 熔断多少秒后放行试探请求
+
+# 链路追踪：各阶段 span 写入 JSONL，可用 python -m utils.tracing 导出为 Chrome trace
+TRACE_ENABLED = True
+TRACE_PATH = "logs/trace.jsonl"
+TRACE_FLUSH_EVERY = 200
+
+# 模型响应缓存：off / readwrite / replay（replay 只读，未命中直接报错）
+LLM_CACHE_MODE = "readwrite"
+LLM_CACHE_DIR = "cache/llm"
+LLM_CACHE_MAX_ENTRIES = 20000
+LLM_CACHE_MAX_AGE = 180 * 24 * 3600   # 秒；None 表示不过期
 AGENT_SYSTEM_PROMPT = """
         You are a stock fundamental analysis trading assistant.
 
@@ -45,5 +113,27 @@ AGENT_SYSTEM_PROMPT = """
         """
 Min_confidence=0.6
 
-# 手续费设置
+# 信号来源："llm" 调用模型（AIAgent）/ "rules" 确定性规则策略（strategies.RuleBasedStrategy）
+STRATEGY = "llm"
+# 规则策略参数
+RULE_RSI_OVERBOUGHT = 70
+RULE_RSI_OVERSOLD = 30
+RULE_VIX_MAX = 30
+
+# 成交价口径："close" 当天收盘价 / "next_open" 下一交易日开盘价 / "vwap" 当天 (H+L+C)/3
+FILL_PRICE = "close"
+
+# 单笔买入最多占用现金的比例
+MAX_ALLOCATION = 0.20
+
+# 参数扫描（sweep.py）：共享价格矩阵的存放目录与结果表
+SWEEP_CACHE_DIR = "cache/sweep"
+SWEEP_RESULTS_PATH = "logs/sweep_results.csv"
+
+# 手续费设置：每笔固定费用 + 按成交金额比例的佣金，成交时从现金中扣除
 TRADE_FEE = 2.0
+COMMISSION_RATE = 0.0
+
+# 交易 / 持仓日志落盘策略："trade" 每笔立即写 / "day" 每个交易日结束写 / "exit" 退出时写
+JOURNAL_FLUSH = "day"
+JOURNAL_MAX_ROWS = 5000   # 缓冲超过这么多行时提前写入
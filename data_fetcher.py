@@ -1,11 +1,16 @@
 # data_fetcher.py
-import os
 import ast
 import pandas as pd
 import yfinance as yf
 import finnhub
-from datetime import datetime, timedelta
-from config import SYMBOLS, START_DATE, DATA_PATH, FINNHUB_API_KEY
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from config import SYMBOLS, START_DATE, DATA_PATH, FINNHUB_API_KEY, FETCH_MAX_WORKERS, FETCH_BATCH_SIZE
+from config import INTRADAY_INTERVALS, INTRADAY_LOOKBACK_DAYS, MARKET_TZ
+from config import FINNHUB_CACHE_DIR, FINNHUB_CACHE_TTL, FINNHUB_CACHE_MAX_ENTRIES
+from data_store import read_frame, write_frame, append_frame, read_manifest, get_meta
+from utils.disk_cache import DiskCache
+from utils.tracing import span, traced
 
 # 初始化 finnhub 客户端
 finnhub_client = finnhub.Client(api_key=FINNHUB_API_KEY)
@@ -14,43 +19,156 @@ finnhub_client = finnhub.Client(api_key=FINNHUB_API_KEY)
 # ---------------------- #
 # 从 yfinance 获取 K 线数据
 # ---------------------- #
+def _to_market_time(index):
+    """日内 bar 的时间戳带时区（多只股票一起下载时可能是 UTC），统一转成交易所当地时间并去掉时区。"""
+    if getattr(index, "tz", None) is None:
+        return index
+    return index.tz_convert(MARKET_TZ).tz_localize(None)
+
+
 def get_price_data(symbol: str, start: str, interval: str):
     """从 Yahoo Finance 获取指定周期的K线"""
     df = yf.download(symbol, start=start, interval=interval, progress=False)
     if df.empty:
         print(f"⚠️ 无法获取 {symbol} {interval} 数据")
         return pd.DataFrame()
+    df.index = _to_market_time(df.index)
     df.index.name = "Date"
     return df
 
 
+def get_price_data_batch(symbols, start, interval, batch_size=FETCH_BATCH_SIZE, max_workers=FETCH_MAX_WORKERS):
+    """一次 yf.download 请求多只股票（按 batch_size 分批），拆回单只股票的 DataFrame。
+
+    返回 (frames, failures)：frames 为 {symbol: df}，failures 为 {symbol: 原因}。
+    单只股票没有数据或整批请求异常都只记入 failures，不影响其它股票。
+    """
+    frames, failures = {}, {}
+    symbols = list(symbols)
+    for i in range(0, len(symbols), batch_size):
+        batch = symbols[i:i + batch_size]
+        try:
+            with span("fetch.download", interval=interval, start=str(start), symbols=len(batch)):
+                data = yf.download(
+                    [s.upper() for s in batch], start=start, interval=interval,
+                    group_by="ticker", threads=max_workers, progress=False,
+                )
+        except Exception as e:
+            for sym in batch:
+                failures[sym] = f"下载异常: {e}"
+            continue
+
+        for sym in batch:
+            if data is None or data.empty:
+                failures[sym] = "无数据"
+                continue
+            if getattr(data.columns, "nlevels", 1) > 1:
+                tickers = data.columns.get_level_values(0)
+                if sym.upper() not in tickers:
+                    failures[sym] = "无数据"
+                    continue
+                df = data[sym.upper()]
+            else:
+                df = data
+            df = df.dropna(how="all")
+            if df.empty:
+                failures[sym] = "无数据"
+                continue
+            df = df.copy()
+            df.columns.name = None
+            df.index = _to_market_time(df.index)
+            df.index.name = "Date"
+            frames[sym] = df
+    return frames, failures
+
+
 # ---------------------- #
 # 从 Finnhub 获取基本面数据
 # ---------------------- #
-def get_finnhub_metrics(symbol):
-    shares_outstanding = None
-    long_short_ratio = None
-    option_events = None
+_finnhub_cache = None
+
 
+def get_finnhub_cache():
+    """进程内共享的 Finnhub 磁盘缓存，首次使用时才创建（导入本模块不建目录）。"""
+    global _finnhub_cache
+    if _finnhub_cache is None:
+        _finnhub_cache = DiskCache(FINNHUB_CACHE_DIR, max_entries=FINNHUB_CACHE_MAX_ENTRIES)
+    return _finnhub_cache
+
+
+def _cached_finnhub(endpoint, symbol, fetch):
+    """按 (endpoint, symbol) 读取缓存，过期才请求 Finnhub；请求失败时回退到过期缓存。
+
+    返回 (value, fetched_at)，fetched_at 为获取时间的 Unix 时间戳；完全取不到时返回 (None, None)。
+    """
+    cache = get_finnhub_cache()
+    key = [endpoint, symbol.upper()]
+    entry = cache.get_entry(key)
+    if DiskCache.is_fresh(entry, FINNHUB_CACHE_TTL.get(endpoint)):
+        cache.record_hit()
+        return entry["value"], entry["fetched_at"]
+
+    cache.record_miss()
     try:
+        with span("fetch.finnhub", endpoint=endpoint, symbol=symbol.upper()):
+            value = fetch()
+    except Exception:
+        if entry is not None:
+            print(f"⚠️ Finnhub {endpoint} {symbol} 请求失败，使用 {_fmt_ts(entry['fetched_at'])} 的缓存")
+            return entry["value"], entry["fetched_at"]
+        return None, None
+
+    entry = cache.set(key, value)
+    return value, entry["fetched_at"]
+
+
+def _fmt_ts(ts):
+    return datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S") if ts else None
+
+
+def get_finnhub_metrics_detail(symbol):
+    """返回 {指标名: (值, 获取时间戳)}，用于记录派生列的输入来源。"""
+    def basic_financials():
         metrics = finnhub_client.company_basic_financials(symbol, 'all')
-        shares_outstanding = metrics['metric'].get('shares_outstanding', None)
-    except:
-        pass
+        return metrics['metric'].get('shares_outstanding', None)
 
-    try:
-        sentiment = finnhub_client.news_sentiment(symbol)
-        long_short_ratio = sentiment["sentiment"].get("bullishPercent", 0) / 100
-    except:
-        pass
+    def sentiment():
+        data = finnhub_client.news_sentiment(symbol)
+        return data["sentiment"].get("bullishPercent", 0) / 100
 
-    try:
+    def option_expirations():
         option_data = finnhub_client.stock_option_expiration(symbol)
-        option_events = len(option_data.get("expirationDates", []))
-    except:
-        pass
+        return len(option_data.get("expirationDates", []))
+
+    return {
+        "shares_outstanding": _cached_finnhub("company_basic_financials", symbol, basic_financials),
+        "long_short_ratio": _cached_finnhub("news_sentiment", symbol, sentiment),
+        "option_events": _cached_finnhub("stock_option_expiration", symbol, option_expirations),
+    }
+
 
-    return shares_outstanding, long_short_ratio, option_events
+def get_finnhub_metrics(symbol):
+    detail = get_finnhub_metrics_detail(symbol)
+    return detail["shares_outstanding"][0], detail["long_short_ratio"][0], detail["option_events"][0]
+
+
+def get_finnhub_metrics_all(symbols, max_workers=FETCH_MAX_WORKERS):
+    """在有界线程池中并发获取所有股票的 Finnhub 指标。
+
+    返回 (metrics, failures)：metrics 为 {symbol: get_finnhub_metrics_detail(symbol)}。
+    """
+    empty = {"shares_outstanding": (None, None), "long_short_ratio": (None, None), "option_events": (None, None)}
+    metrics, failures = {}, {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(get_finnhub_metrics_detail, sym): sym for sym in symbols}
+        for future in as_completed(futures):
+            sym = futures[future]
+            try:
+                metrics[sym] = future.result()
+            except Exception as e:
+                failures[sym] = f"Finnhub 异常: {e}"
+                metrics[sym] = dict(empty)
+    return metrics, failures
 
 
 def _normalize_columns(df, symbol=None):
@@ -98,49 +216,142 @@ def _normalize_columns(df, symbol=None):
 
 
 # ---------------------- #
-# 保存或更新数据
+# 增量抓取计划
 # ---------------------- #
-def save_data(symbol, interval,name, df):
-    os.makedirs(DATA_PATH, exist_ok=True)
-    file_path = os.path.join(DATA_PATH, f"{symbol}_{name}.csv")
+INTERVALS = [("1d", "daily"), ("1wk", "weekly"), ("1mo", "monthly")]
+
+# 日内周期：存储名直接用周期本身（data/tssi_1h、processed/tssi_1h_clean）
+INTRADAY_STEPS = {
+    "1h": pd.Timedelta(hours=1),
+    "15m": pd.Timedelta(minutes=15),
+    "5m": pd.Timedelta(minutes=5),
+}
+
+# 常规交易时段（交易所当地时间）
+SESSION_OPEN = pd.Timedelta(hours=9, minutes=30)
+SESSION_CLOSE = pd.Timedelta(hours=16)
+
+# 每根 bar 覆盖的时长（yfinance 周线/月线以周期起始日标记，日内 bar 以开始时刻标记）
+BAR_STEPS = {
+    "1d": pd.DateOffset(days=1),
+    "1wk": pd.DateOffset(weeks=1),
+    "1mo": pd.DateOffset(months=1),
+    **INTRADAY_STEPS,
+}
+
+
+def active_intervals(intraday=INTRADAY_INTERVALS):
+    """要抓取的 (interval, 存储名) 列表：日/周/月线 + config 中开启的日内周期。"""
+    unknown = [iv for iv in intraday if iv not in INTRADAY_STEPS]
+    if unknown:
+        raise ValueError(f"不支持的日内周期: {unknown}，可选 {list(INTRADAY_STEPS)}")
+    return INTERVALS + [(iv, iv) for iv in intraday]
+
+
+def _next_bar_start(last, interval):
+    if interval == "1d":
+        return last + pd.offsets.BDay(1)
+    if interval in INTRADAY_STEPS:
+        # 当天收盘后的下一根 bar 在下一个交易日开盘
+        nxt = last + INTRADAY_STEPS[interval]
+        if nxt - nxt.normalize() >= SESSION_CLOSE:
+            nxt = last.normalize() + pd.offsets.BDay(1) + SESSION_OPEN
+        return nxt
+    return last + BAR_STEPS[interval]
+
+
+def _earliest_start(interval, now=None):
+    """yfinance 日内数据可回溯的最早日期（日/周/月线不受限，返回 None）。"""
+    if interval not in INTRADAY_STEPS:
+        return None
+    now = pd.Timestamp(now or datetime.now())
+    return (now - pd.Timedelta(days=INTRADAY_LOOKBACK_DAYS[interval])).normalize()
+
+
+def _market_clock(ts):
+    """本机时间（manifest 中的 fetched_at、datetime.now()）-> 交易所当地时间（去掉时区）。"""
+    ts = pd.Timestamp(ts)
+    if ts.tz is None:
+        ts = ts.tz_localize(datetime.now().astimezone().tzinfo)
+    return ts.tz_convert(MARKET_TZ).tz_localize(None)
+
+
+def _bar_end(last, interval):
+    """最后一根 bar 走完的时刻（交易所当地时间）：日线 / 日内 bar 以当天收盘为界。"""
+    close = last.normalize() + SESSION_CLOSE
+    if interval == "1d":
+        return close
+    if interval in INTRADAY_STEPS:
+        return min(last + INTRADAY_STEPS[interval], close)
+    return last + BAR_STEPS[interval]
+
+
+def is_current(last, fetched_at, interval, now=None):
+    """根据 manifest 判断是否无需联网。
+
+    - 下一根 bar 可能已经开始（起点 <= 今天）-> 需要抓取
+    - 最后一根 bar 在上次抓取时已走完（日线 / 日内 bar 以收盘时刻为界）-> 已是最新；
+      盘中抓到的最后一根 bar 还会变化，收盘后必须重新抓取
+    - 周线 / 月线尚未走完时，今天已经抓取过也算最新（每天最多抓一次）
+    """
+    if last is None or not fetched_at:
+        return False
+    now = _market_clock(now or datetime.now())
+    last, fetched_at = pd.Timestamp(last), _market_clock(fetched_at)
+    if _next_bar_start(last, interval).normalize() <= now.normalize():
+        return False
+    if fetched_at >= _bar_end(last, interval):
+        return True
+    if interval == "1d" or interval in INTRADAY_STEPS:
+        return False
+    return fetched_at.normalize() == now.normalize()
+
+
+def plan_fetch(symbols, interval, name, now=None):
+    """根据各 symbol 的 manifest 生成抓取计划 {起始日期: [symbol, ...]}。
+
+    - 没有本地数据：从 START_DATE 开始
+    - 已有数据：从最后一根 bar 当天开始（覆盖可能未收盘的最后一根）
+    - 已是最新：不出现在计划中
+    - 日内周期：起始日期不早于 yfinance 允许回溯的范围（超出部分会留下缺口）
+    """
+    plan = {}
+    earliest = _earliest_start(interval, now)
+    for sym in symbols:
+        frame_name = f"{sym}_{name}"
+        manifest = read_manifest(DATA_PATH, frame_name)
+        if manifest is None:
+            # 旧版 CSV 先迁移到列式存储，避免重新下载全量历史
+            legacy = read_frame(DATA_PATH, frame_name)
+            if not legacy.empty:
+                write_frame(DATA_PATH, frame_name, legacy)
+                manifest = read_manifest(DATA_PATH, frame_name)
+
+        if manifest is None or not manifest.get("last"):
+            start = START_DATE
+        else:
+            last = pd.Timestamp(manifest["last"])
+            if is_current(last, manifest.get("meta", {}).get("fetched_at"), interval, now):
+                continue
+            start = last.strftime("%Y-%m-%d")
+        if earliest is not None and pd.Timestamp(start) < earliest:
+            if start != START_DATE:
+                print(f"⚠️ {frame_name} 上次数据截至 {start}，超出 {interval} 可回溯范围，{earliest:%Y-%m-%d} 之前会有缺口")
+            start = earliest.strftime("%Y-%m-%d")
+        plan.setdefault(start, []).append(sym)
+    return plan
 
-    today = datetime.now().date()
-    start_date = START_DATE
 
-    if os.path.exists(file_path):
-        # Try reading existing file with a couple of common parse strategies to be robust
-        try:
-            df_old = pd.read_csv(file_path, parse_dates=["Date"], index_col="Date")
-        except ValueError:
-            # Fallback: parse the first column as dates and use it as index
-            df_old = pd.read_csv(file_path, parse_dates=True, index_col=0)
-            # ensure index is named 'Date'
-            df_old.index.name = "Date"
-        # Ensure index is datetime-like
-        try:
-            df_old.index = pd.to_datetime(df_old.index, errors="coerce")
-        except Exception:
-            df_old.index = pd.to_datetime(df_old.index.astype(str), errors="coerce")
-        # Drop rows where index couldn't be parsed as datetime
-        df_old = df_old[~df_old.index.isna()]
-        last_date = df_old.index[-1].date()
-
-        if last_date < today:
-            print(f"🔄 更新 {symbol} {name} 从 {last_date} 到 {today}")
-            df_new = get_price_data(symbol, start=(last_date + timedelta(days=1)).strftime("%Y-%m-%d"), interval=interval)
-            # 判断last_date和df_new是否有重叠日期,如果重叠则替换旧数据
-            if not df_new.empty:
-                # Remove overlapping dates from old data
-                df_old = df_old[~df_old.index.isin(df_new.index)]
-                df = pd.concat([df_old, df_new]).sort_index()
-            else:
-                df = df_old
-        else:
-            print(f"✅ {symbol} {name} 已是最新数据")
-            df = df_old
-    else:
-        print(f"⬇️ 下载 {symbol} {name} 从 {start_date} 到 {today}")
-        df = get_price_data(symbol, start=start_date, interval=interval)
+# ---------------------- #
+# 保存或更新数据
+# ---------------------- #
+def save_data(symbol, interval,name, df, derived_inputs=None):
+    """把新抓取的 bar 合并进本地存储：与已有数据重叠的日期被新数据覆盖，其余只追加。
+
+    derived_inputs: 计算 Turnover 等派生列所用的 Finnhub 值及其获取时间，
+    按本次写入的起始日期追加到 manifest["meta"]["derived_inputs"]，以便复现历史行。
+    """
+    frame_name = f"{symbol}_{name}"
 
     # Normalize columns to avoid malformed headers like "('Close', 'SOFI')" and duplicated groups
     try:
@@ -148,49 +359,94 @@ def save_data(symbol, interval,name, df):
     except Exception:
         pass
 
-    # Write CSV with Date as first column (index may be DatetimeIndex)
-    try:
-        # ensure index has a name
-        if df.index.name is None:
-            df.index.name = "Date"
-        df.to_csv(file_path)
-    except Exception:
-        # Fallback: reset index and write
-        df.reset_index().to_csv(file_path, index=False)
-    print(f"✅ {symbol} {name} 数据已保存 ({len(df)} 条)")
+    if df is None or df.empty:
+        print(f"⚠️ {symbol} {name} 无数据可保存")
+        return df
+
+    if df.index.name is None:
+        df.index.name = "Date"
+    meta = {"fetched_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+    if derived_inputs is not None:
+        start = str(pd.Timestamp(df.index.min()))
+        # 被本次覆盖的区间对应的旧记录作废
+        history = [h for h in get_meta(DATA_PATH, frame_name).get("derived_inputs", []) if h["from"] < start]
+        meta["derived_inputs"] = history + [dict(derived_inputs, **{"from": start})]
+    rows = append_frame(DATA_PATH, frame_name, df, meta=meta)
+    print(f"✅ {symbol} {name} 数据已保存 (新增/更新 {len(df)} 条，共 {rows} 条)")
     return df
 
 
 # ---------------------- #
 # 主入口函数
 # ---------------------- #
-def initialize_all_data():
-    for symbol in SYMBOLS:
-        # 获取 finnhub 数据
-        shares_outstanding, long_short_ratio, option_events = get_finnhub_metrics(symbol)
-
-        # 获取日、周、月线
-        for interval, name in [("1d", "daily"), ("1wk", "weekly"), ("1mo", "monthly")]:
-            df = get_price_data(symbol, START_DATE, interval)
-            if df.empty:
-                continue
-
-            # 计算换手率、多空比、期权活动
-            if shares_outstanding:
-                df["Turnover"] = df["Volume"] / shares_outstanding
-            else:
-                df["Turnover"] = None
+@traced("fetch")
+def initialize_all_data(symbols=SYMBOLS):
+    """按 manifest 增量抓取所有股票的日/周/月线（以及 config 中开启的日内周期）与 Finnhub 指标。
 
-            df["LongShortRatio"] = long_short_ratio
-            df["OptionEvents"] = option_events
-
-            # ✅ 保存时传入 interval，而不是 name
-            save_data(symbol, interval,name, df)
-
-            # # ✅ 另外保存一份文件名友好的版本
-            # renamed_path = os.path.join(DATA_PATH, f"{symbol}_{name}.csv")
-            # df.to_csv(renamed_path)
-            # print(f"📁 {symbol} {name} 数据已保存 ({len(df)} 条)")
+    只下载缺失的区间（按起始日期分组批量请求），已是最新的股票完全不联网；
+    Turnover / LongShortRatio / OptionEvents 只写入新抓取的行。
+    单只股票失败只记录，不中断整体。返回 {symbol: [失败原因, ...]}。
+    """
+    symbols = list(symbols)
+    failures = {}
+
+    plans = {(interval, name): plan_fetch(symbols, interval, name) for interval, name in active_intervals()}
+    pending = sorted({sym for plan in plans.values() for group in plan.values() for sym in group})
+    if not pending:
+        print("✅ 所有数据已是最新，无需联网")
+        return failures
+
+    # 获取 finnhub 数据（只针对需要更新的股票）
+    metrics, finnhub_failures = get_finnhub_metrics_all(pending)
+    for sym, reason in finnhub_failures.items():
+        failures.setdefault(sym, []).append(reason)
+
+    # 获取日、周、月线和日内 bar（同一周期、同一起始日期的股票合并为一次批量请求）
+    for (interval, name), plan in plans.items():
+        for start, group in plan.items():
+            print(f"⬇️ 下载 {name} 从 {start}：{len(group)} 只股票")
+            frames, price_failures = get_price_data_batch(group, start, interval)
+            for sym, reason in price_failures.items():
+                failures.setdefault(sym, []).append(f"{name}: {reason}")
+
+            for symbol in group:
+                df = frames.get(symbol)
+                if df is None or df.empty:
+                    continue
+                detail = metrics.get(symbol, {})
+                shares_outstanding, so_time = detail.get("shares_outstanding", (None, None))
+                long_short_ratio, lsr_time = detail.get("long_short_ratio", (None, None))
+                option_events, oe_time = detail.get("option_events", (None, None))
+                derived_inputs = {
+                    "shares_outstanding": shares_outstanding,
+                    "shares_outstanding_fetched_at": _fmt_ts(so_time),
+                    "long_short_ratio": long_short_ratio,
+                    "long_short_ratio_fetched_at": _fmt_ts(lsr_time),
+                    "option_events": option_events,
+                    "option_events_fetched_at": _fmt_ts(oe_time),
+                }
+
+                # 计算换手率、多空比、期权活动（仅新行）
+                if shares_outstanding:
+                    df["Turnover"] = df["Volume"] / shares_outstanding
+                else:
+                    df["Turnover"] = None
+
+                df["LongShortRatio"] = long_short_ratio
+                df["OptionEvents"] = option_events
+
+                # ✅ 保存时传入 interval，而不是 name
+                try:
+                    with span("fetch.save", symbol=symbol, interval=interval, rows=len(df)):
+                        save_data(symbol, interval, name, df, derived_inputs=derived_inputs)
+                except Exception as e:
+                    failures.setdefault(symbol, []).append(f"{name}: 保存失败 {e}")
+
+    if failures:
+        print(f"⚠️ {len(failures)} 只股票部分数据获取失败：")
+        for sym, reasons in failures.items():
+            print(f"   {sym}: {'; '.join(reasons)}")
+    return failures
 
 
 if __name__ == "__main__":
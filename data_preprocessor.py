@@ -3,68 +3,30 @@ import os
 import pandas as pd
 import numpy as np
 import yfinance as yf
-from ta.trend import EMAIndicator, MACD
-from ta.momentum import RSIIndicator
-from ta.volatility import BollingerBands, AverageTrueRange
-from config import SYMBOLS, DATA_PATH
+from config import SYMBOLS, DATA_PATH, PROCESSED_PATH, INTRADAY_INTERVALS, PREPROCESS_CHUNK_ROWS
+from data_store import read_frame, write_frame, append_frame, read_manifest, get_meta
+import indicators
+from utils.tracing import span, traced
 
-PROCESSED_PATH = "processed/"
+PERIODS = ["daily", "weekly", "monthly"]
+# 开启的日内周期（存储名即周期，例如 tssi_1h），与日/周/月线走同一条分块流水线
+INTRADAY_PERIODS = list(INTRADAY_INTERVALS)
 
 
 # ------------------------------ #
 # 技术指标计算函数
 # ------------------------------ #
 def add_technical_indicators(df, period="daily"):
+    """单只股票整段计算 EMA20 / RSI / MACD / ATR / 布林带（批量内核 S=1 的特例）。"""
     df = df.copy()
-    n = len(df)
-
-    # EMA20 (require at least 20 periods)
-    if n >= 20:
-        ema = EMAIndicator(close=df["Close"], window=20)
-        df["EMA20"] = ema.ema_indicator()
-    else:
-        df["EMA20"] = np.nan
-
-    # RSI (require at least 14 periods)
-    if n >= 14:
-        rsi = RSIIndicator(close=df["Close"], window=14)
-        df["RSI"] = rsi.rsi()
-    else:
-        df["RSI"] = np.nan
-
-    # MACD (requires a reasonable number of periods; default slow=26)
-    if n >= 26:
-        macd = MACD(close=df["Close"])
-        df["MACD"] = macd.macd()
-        df["MACD_Signal"] = macd.macd_signal()
-        df["MACD_Hist"] = macd.macd_diff()
-    else:
-        df["MACD"] = np.nan
-        df["MACD_Signal"] = np.nan
-        df["MACD_Hist"] = np.nan
-
-    # ATR（波动率） (require at least 14 periods)
-    if n >= 14:
-        atr = AverageTrueRange(high=df["High"], low=df["Low"], close=df["Close"], window=14)
-        df["ATR"] = atr.average_true_range()
-    else:
-        df["ATR"] = np.nan
-
-    # 布林带 (require at least 20 periods)
-    if n >= 20:
-        bb = BollingerBands(close=df["Close"], window=20, window_dev=2)
-        df["BB_Upper"] = bb.bollinger_hband()
-        df["BB_Lower"] = bb.bollinger_lband()
-        df["BB_Width"] = df["BB_Upper"] - df["BB_Lower"]
-    else:
-        df["BB_Upper"] = np.nan
-        df["BB_Lower"] = np.nan
-        df["BB_Width"] = np.nan
-        
+    values, _ = indicators.compute(df["High"], df["Low"], df["Close"])
+    for col in indicators.INDICATOR_COLUMNS:
+        df[col] = values[col]
+
     # VIX is injected separately after preprocessing of all daily files.
     # This keeps indicator computation focused and prevents repeated VIX
     # downloads during per-symbol processing. Processed daily files will
-    # be updated with VIX by a separate utility (scripts/fetch_and_inject_vix.py).
+    # be updated with VIX by a separate utility (add_vix.py).
     if period != "daily":
         # Ensure monthly/weekly do not contain a VIX column
         if "VIX" in df.columns:
@@ -73,6 +35,52 @@ def add_technical_indicators(df, period="daily"):
     return df
 
 
+def _stack(frames, column):
+    """多个 DataFrame 的同名列左对齐拼成 (T, S) 数组，尾部补 NaN。"""
+    T = max((len(f) for f in frames), default=0)
+    out = np.full((T, len(frames)), np.nan)
+    for j, f in enumerate(frames):
+        out[:len(f), j] = f[column].to_numpy(dtype=float)
+    return out
+
+
+def compute_indicators_batch(frames, checkpoints):
+    """对整个股票池一次性计算指标。
+
+    frames: 已清洗、待计算的 DataFrame 列表（整段历史，或 checkpoint 之后的新 bar）
+    checkpoints: 与 frames 对应的递推状态（None 表示从头整段计算）
+    返回 [(values, new_checkpoint)]，values 为 {列名: 与 frame 等长的数组}；
+    new_checkpoint 停在每个 frame 的倒数第二根 bar（最后一根下次可能被修正）。
+    """
+    bodies = [f.iloc[:-1] for f in frames]
+    lasts = [f.iloc[-1:] for f in frames]
+
+    state = indicators.state_from_dicts(checkpoints)
+    body_values, body_state = indicators.extend(
+        state, _stack(bodies, "High"), _stack(bodies, "Low"), _stack(bodies, "Close")
+    )
+    last_values, final_state = indicators.extend(
+        body_state, _stack(lasts, "High"), _stack(lasts, "Low"), _stack(lasts, "Close")
+    )
+
+    results = []
+    for j, f in enumerate(frames):
+        m = len(f) - 1
+        values = {col: np.concatenate([body_values[col][:m, j], last_values[col][:1, j]]) for col in indicators.INDICATOR_COLUMNS}
+        # 整段计算时按总长度套用最短长度规则（增量时历史必然 >= MIN_HISTORY）
+        for col, min_len in indicators.MIN_LENGTHS.items():
+            if final_state["n"][j] < min_len:
+                values[col][:] = np.nan
+
+        checkpoint = indicators.state_to_dict(body_state, j)
+        if m > 0:
+            checkpoint["date"] = str(f.index[m - 1])
+        else:
+            checkpoint["date"] = (checkpoints[j] or {}).get("date")
+        results.append((values, checkpoint))
+    return results
+
+
 # ------------------------------ #
 # 清洗与时间格式化
 # ------------------------------ #
@@ -135,31 +143,128 @@ def clean_dataframe(df):
 
 
 # ------------------------------ #
-# 处理单个周期的数据
+# 指标递推状态（增量更新用）
 # ------------------------------ #
-def process_single(symbol, period):
-    file_path = os.path.join(DATA_PATH, f"{symbol}_{period}.csv")
-    if not os.path.exists(file_path):
-        print(f"⚠️ 找不到 {symbol}_{period}.csv，跳过。")
-        return
+def _can_extend(raw, checkpoint):
+    """checkpoint 之前的原始数据未被改写（行数、最后收盘价一致）时才能增量更新。"""
+    if not checkpoint or checkpoint.get("n", 0) < indicators.MIN_HISTORY or not checkpoint.get("date"):
+        return False
+    n = checkpoint["n"]
+    if len(raw) < n or raw.index[n - 1] != pd.Timestamp(checkpoint["date"]):
+        return False
+    last_close = raw["Close"].iloc[n - 1]
+    return bool(np.isclose(last_close, checkpoint["last_close"], rtol=1e-9, atol=0.0))
+
 
-    df = pd.read_csv(file_path)
-    df = clean_dataframe(df)
-    df = add_technical_indicators(df, period)
+# ------------------------------ #
+# 按周期批量处理（分块）
+# ------------------------------ #
+def _read_chunk(raw_name, dates, pos, chunk_rows):
+    """读取原始数据第 [pos, pos + chunk_rows) 行并清洗；pos > 0 时带上前一行作为 ffill 的上下文，清洗后再去掉。
+
+    按日期区间读取（列式存储里是二分查找 + 内存映射切片），不会把整段历史读进内存。
+    返回 (清洗后的块, 是否已读到末尾)。
+    """
+    lo = max(pos - 1, 0)
+    hi = min(pos + chunk_rows, len(dates))
+    raw = read_frame(DATA_PATH, raw_name, start=dates[lo], end=dates[hi - 1])
+    chunk = clean_dataframe(raw.reset_index())
+    if pos > 0:
+        chunk = chunk.iloc[1:]
+    return chunk, hi >= len(dates)
+
+
+def _save_chunk(out_name, period, df, values, new_checkpoint, fresh):
+    """把一块指标结果写入 processed/：fresh=True 时整表重写，否则追加（与已有的最后一行重叠的部分被覆盖）。"""
+    df = df.copy()
+    for col in indicators.INDICATOR_COLUMNS:
+        df[col] = values[col]
+    if period != "daily" and "VIX" in df.columns:
+        df = df.drop(columns=["VIX"])
 
-    os.makedirs(PROCESSED_PATH, exist_ok=True)
-    save_path = os.path.join(PROCESSED_PATH, f"{symbol}_{period}_clean.csv")
-    df.to_csv(save_path)
-    print(f"✅ 已处理并保存 {symbol}_{period}_clean.csv ({len(df)} 条)")
+    if fresh:
+        return write_frame(PROCESSED_PATH, out_name, df, meta={"indicator_state": new_checkpoint})
+
+    # 保持与已存储列一致（VIX 由 add_vix 之后注入）
+    stored = [c["name"] for c in read_manifest(PROCESSED_PATH, out_name)["columns"]]
+    if "VIX" in stored and "VIX" not in df.columns:
+        df["VIX"] = np.nan
+    return append_frame(PROCESSED_PATH, out_name, df, meta={"indicator_state": new_checkpoint})
+
+
+def process_period(symbols, period, full=False, chunk_rows=PREPROCESS_CHUNK_ROWS):
+    """处理一组股票的同一周期（日/周/月线或日内 bar）。
+
+    已有指标状态且历史未被改写的股票只计算新增 bar，其余整段重算；full=True 强制整段重算。
+    原始数据按每只股票 chunk_rows 行一块读取，所有股票同一轮的块拼成一个 (时间 × 股票) 数组，
+    由指标内核一次算完；块尾的递推状态作为下一块的 checkpoint，第一块写入（或追加到已有表），
+    之后逐块追加。内存只与块大小有关，与历史长度无关，结果与整段计算相同。
+    """
+    chunk_rows = max(int(chunk_rows), indicators.MIN_HISTORY + 1)
+    cursors = {}
+    for symbol in symbols:
+        raw_name, out_name = f"{symbol}_{period}", f"{symbol}_{period}_clean"
+        # 只映射日期和收盘价，用于定位续算位置
+        index = read_frame(DATA_PATH, raw_name, columns=["Close"])
+        if index.empty:
+            print(f"⚠️ 找不到 {raw_name} 数据，跳过。")
+            continue
+
+        checkpoint = get_meta(PROCESSED_PATH, out_name).get("indicator_state")
+        if not full and _can_extend(index, checkpoint):
+            if checkpoint["n"] >= len(index):
+                print(f"✅ {out_name} 已是最新")
+                continue
+            pos, fresh = checkpoint["n"], False
+        else:
+            pos, checkpoint, fresh = 0, None, True
+        cursors[symbol] = {"dates": index.index, "start": pos, "pos": pos, "checkpoint": checkpoint,
+                           "fresh": fresh, "full": fresh, "chunks": 0}
+
+    while cursors:
+        jobs = []
+        for symbol, cur in cursors.items():
+            chunk, done = _read_chunk(f"{symbol}_{period}", cur["dates"], cur["pos"], chunk_rows)
+            jobs.append((symbol, chunk, done))
+
+        with span("preprocess.indicators", period=period, symbols=len(jobs), rows=sum(len(df) for _, df, _ in jobs)):
+            results = compute_indicators_batch([df for _, df, _ in jobs], [cursors[sym]["checkpoint"] for sym, _, _ in jobs])
+
+        for (symbol, df, done), (values, new_checkpoint) in zip(jobs, results):
+            cur = cursors[symbol]
+            out_name = f"{symbol}_{period}_clean"
+            rows = _save_chunk(out_name, period, df, values, new_checkpoint, cur["fresh"])
+            cur["chunks"] += 1
+            if not done:
+                # 下一块从 checkpoint 之后开始（本块最后一根 bar 会被重算并覆盖）
+                cur["pos"] = int(cur["dates"].searchsorted(pd.Timestamp(new_checkpoint["date"]))) + 1
+                cur["checkpoint"] = new_checkpoint
+                cur["fresh"] = False
+                continue
+
+            chunks = f"，分 {cur['chunks']} 块" if cur["chunks"] > 1 else ""
+            if cur["full"]:
+                print(f"✅ 已处理并保存 {out_name} ({rows} 条{chunks})")
+            else:
+                print(f"✅ 增量更新 {out_name}：新增/修正 {len(cur['dates']) - cur['start']} 条，共 {rows} 条{chunks}")
+            del cursors[symbol]
+
+
+# ------------------------------ #
+# 处理单个周期的数据
+# ------------------------------ #
+def process_single(symbol, period, full=False):
+    process_period([symbol], period, full=full)
 
 
 # ------------------------------ #
 # 主函数
 # ------------------------------ #
-def preprocess_all():
-    for symbol in SYMBOLS:
-        for period in ["daily", "weekly", "monthly"]:
-            process_single(symbol, period)
+@traced("preprocess")
+def preprocess_all(symbols=SYMBOLS, full=False):
+    for period in PERIODS + INTRADAY_PERIODS:
+        with span("preprocess.period", period=period, symbols=len(symbols)):
+            process_period(symbols, period, full=full)
 
 
 if __name__ == "__main__":
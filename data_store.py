@@ -0,0 +1,369 @@
+# data_store.py
+# 列式行情存储：每个 (symbol, period) 一个目录，每列一个二进制文件 + manifest.json
+#
+#   data/tssi_daily/
+#       manifest.json      # 列名、dtype、行数、首末日期、附加元信息
+#       Date.bin           # datetime64[ns]
+#       Close.bin          # float64
+#       ...
+#
+# 读取时用 np.memmap 映射，DataFrame 直接引用映射内存，不做 CSV 解析和日期解析；
+# 追加 / 截尾只改动文件尾部，manifest 最后原子替换，作为提交点。
+import os
+import json
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+MANIFEST_NAME = "manifest.json"
+STORE_VERSION = 1
+INDEX_NAME = "Date"
+
+
+# ---------------------- #
+# 路径与 manifest
+# ---------------------- #
+def frame_dir(base_dir, name):
+    return os.path.join(base_dir, name)
+
+
+def _column_file(col):
+    # 列名可能含空格（例如 "Adj Close"），文件名统一替换
+    return str(col).replace(" ", "_").replace(os.sep, "_") + ".bin"
+
+
+def read_manifest(base_dir, name):
+    """返回 manifest 字典；不存在时返回 None。"""
+    path = os.path.join(frame_dir(base_dir, name), MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_manifest(base_dir, name, manifest):
+    path = os.path.join(frame_dir(base_dir, name), MANIFEST_NAME)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def has_frame(base_dir, name):
+    return read_manifest(base_dir, name) is not None
+
+
+def list_frames(base_dir, suffix=""):
+    """列出 base_dir 下所有已存储的表名（可按后缀过滤，例如 "_daily_clean"）。"""
+    if not os.path.isdir(base_dir):
+        return []
+    names = []
+    for entry in sorted(os.listdir(base_dir)):
+        if entry.endswith(suffix) and os.path.exists(os.path.join(base_dir, entry, MANIFEST_NAME)):
+            names.append(entry)
+    return names
+
+
+def last_index(base_dir, name):
+    """只读 manifest 获取最后一个 bar 的时间，不加载任何列。"""
+    manifest = read_manifest(base_dir, name)
+    if not manifest or not manifest.get("last"):
+        return None
+    return pd.Timestamp(manifest["last"])
+
+
+def get_meta(base_dir, name):
+    manifest = read_manifest(base_dir, name)
+    return dict(manifest.get("meta", {})) if manifest else {}
+
+
+# ---------------------- #
+# 类型规整
+# ---------------------- #
+def _to_column_array(series):
+    """把一列转换成定长 dtype 的 numpy 数组（数值 -> float64/int64/bool，其余 -> 定长 unicode）。"""
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        s = series
+        if getattr(s.dt, "tz", None) is not None:
+            s = s.dt.tz_localize(None)
+        return s.to_numpy(dtype="datetime64[ns]")
+    if pd.api.types.is_bool_dtype(series.dtype):
+        return series.to_numpy(dtype=bool)
+    if pd.api.types.is_integer_dtype(series.dtype) and not series.isna().any():
+        return series.to_numpy(dtype=np.int64)
+    if pd.api.types.is_numeric_dtype(series.dtype):
+        return series.to_numpy(dtype=np.float64, na_value=np.nan)
+
+    # object 列：能整体转成数值（例如全是 None 的 Turnover）就按 float64 存
+    numeric = pd.to_numeric(series, errors="coerce")
+    if numeric.notna().sum() == series.notna().sum():
+        return numeric.to_numpy(dtype=np.float64, na_value=np.nan)
+    return series.fillna("").astype(str).to_numpy(dtype=str)
+
+
+def _prepare_frame(df):
+    """规整为 Date 索引、升序、去重的 DataFrame。"""
+    df = df.copy()
+    if INDEX_NAME in df.columns:
+        df = df.set_index(INDEX_NAME)
+    df.index = pd.to_datetime(df.index, errors="coerce")
+    if getattr(df.index, "tz", None) is not None:
+        df.index = df.index.tz_localize(None)
+    df = df[~df.index.isna()]
+    df = df[~df.index.duplicated(keep="last")].sort_index()
+    df.index.name = INDEX_NAME
+    # 扁平化 MultiIndex 列（yfinance 的 (Price, Ticker)）
+    if getattr(df.columns, "nlevels", 1) > 1:
+        df.columns = df.columns.get_level_values(0)
+    df = df.loc[:, ~pd.Index(df.columns).duplicated()]
+    df.columns = [str(c) for c in df.columns]
+    return df
+
+
+def _column_arrays(df):
+    arrays = {INDEX_NAME: df.index.to_numpy(dtype="datetime64[ns]")}
+    for col in df.columns:
+        arrays[col] = _to_column_array(df[col])
+    return arrays
+
+
+def _build_manifest(arrays, rows, meta):
+    columns = [{"name": col, "dtype": arr.dtype.str, "file": _column_file(col)} for col, arr in arrays.items()]
+    dates = arrays[INDEX_NAME]
+    return {
+        "version": STORE_VERSION,
+        "index": INDEX_NAME,
+        "rows": int(rows),
+        "columns": columns,
+        "first": str(pd.Timestamp(dates[0])) if rows else None,
+        "last": str(pd.Timestamp(dates[rows - 1])) if rows else None,
+        "updated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "meta": meta or {},
+    }
+
+
+# ---------------------- #
+# 写入
+# ---------------------- #
+def write_frame(base_dir, name, df, meta=None):
+    """整表覆盖写入。df 以 Date 为索引（或含 Date 列）。
+
+    meta: 附加信息（例如抓取时间、流通股本），合并进 manifest["meta"]。
+    """
+    df = _prepare_frame(df)
+    path = frame_dir(base_dir, name)
+    os.makedirs(path, exist_ok=True)
+
+    old = read_manifest(base_dir, name)
+    merged_meta = dict(old.get("meta", {})) if old else {}
+    merged_meta.update(meta or {})
+
+    arrays = _column_arrays(df)
+    for col, arr in arrays.items():
+        file_path = os.path.join(path, _column_file(col))
+        tmp = file_path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(np.ascontiguousarray(arr).tobytes())
+        os.replace(tmp, file_path)
+
+    _write_manifest(base_dir, name, _build_manifest(arrays, len(df), merged_meta))
+
+    # 清理已不存在的旧列文件
+    if old:
+        keep = {_column_file(c) for c in arrays}
+        for c in old["columns"]:
+            if c["file"] not in keep:
+                try:
+                    os.remove(os.path.join(path, c["file"]))
+                except OSError:
+                    pass
+    return len(df)
+
+
+def write_columns(base_dir, name, columns):
+    """原地替换/新增若干列（行数必须与已有数据一致），其余列不动。"""
+    manifest = read_manifest(base_dir, name)
+    if manifest is None:
+        raise FileNotFoundError(f"{name} 不存在于 {base_dir}")
+    path = frame_dir(base_dir, name)
+    rows = manifest["rows"]
+    entries = {c["name"]: c for c in manifest["columns"]}
+    for col, values in columns.items():
+        arr = _to_column_array(pd.Series(values))
+        if len(arr) != rows:
+            raise ValueError(f"列 {col} 长度 {len(arr)} 与已有行数 {rows} 不一致")
+        file_path = os.path.join(path, _column_file(col))
+        tmp = file_path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(np.ascontiguousarray(arr).tobytes())
+        os.replace(tmp, file_path)
+        if col in entries:
+            entries[col]["dtype"] = arr.dtype.str
+        else:
+            entry = {"name": col, "dtype": arr.dtype.str, "file": _column_file(col)}
+            manifest["columns"].append(entry)
+            entries[col] = entry
+    manifest["updated_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    _write_manifest(base_dir, name, manifest)
+
+
+def truncate_frame(base_dir, name, before):
+    """删除 Date >= before 的尾部行（只截断文件，不重写）。返回剩余行数。"""
+    manifest = read_manifest(base_dir, name)
+    if manifest is None:
+        return 0
+    path = frame_dir(base_dir, name)
+    rows = manifest["rows"]
+    dates = _open_column(path, manifest, INDEX_NAME, rows)
+    keep = int(np.searchsorted(dates, np.datetime64(pd.Timestamp(before)), side="left"))
+    del dates
+    if keep == rows:
+        return rows
+
+    for c in manifest["columns"]:
+        itemsize = np.dtype(c["dtype"]).itemsize
+        with open(os.path.join(path, c["file"]), "r+b") as f:
+            f.truncate(keep * itemsize)
+    manifest["rows"] = keep
+    if keep:
+        last = _open_column(path, manifest, INDEX_NAME, keep)[keep - 1]
+        manifest["last"] = str(pd.Timestamp(last))
+    else:
+        manifest["first"] = manifest["last"] = None
+    manifest["updated_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    _write_manifest(base_dir, name, manifest)
+    return keep
+
+
+def append_frame(base_dir, name, df, meta=None):
+    """在尾部追加新行（只写新增部分）。
+
+    - 新数据中与已有数据重叠的日期（>= 新数据首日）会先被截掉再追加，
+      用于覆盖 yfinance 当天/当周尚未收盘的 bar。
+    - 列顺序不同会按已存储顺序重排；列集合不同或 dtype 无法无损转换时退化为整表重写。
+    返回写入后总行数。
+    """
+    manifest = read_manifest(base_dir, name)
+    df = _prepare_frame(df)
+    if manifest is None or manifest["rows"] == 0:
+        return write_frame(base_dir, name, df, meta=meta)
+    if df.empty:
+        if meta:
+            manifest["meta"].update(meta)
+            _write_manifest(base_dir, name, manifest)
+        return manifest["rows"]
+
+    truncate_frame(base_dir, name, df.index[0])
+    manifest = read_manifest(base_dir, name)
+
+    arrays = _column_arrays(df)
+    stored = {c["name"]: c for c in manifest["columns"]}
+    compatible = set(arrays) == set(stored)
+    if compatible:
+        # 按已存储的列顺序排列；能无损转换的 dtype（例如 int64 -> float64）直接转换
+        ordered = {}
+        for c in manifest["columns"]:
+            arr, dtype = arrays[c["name"]], np.dtype(c["dtype"])
+            if arr.dtype != dtype:
+                if not np.can_cast(arr.dtype, dtype, casting="safe"):
+                    compatible = False
+                    break
+                arr = arr.astype(dtype)
+            ordered[c["name"]] = arr
+        arrays = ordered
+    if not compatible:
+        old = read_frame(base_dir, name, mmap=False)
+        combined = pd.concat([old, df])
+        combined = combined[~combined.index.duplicated(keep="last")].sort_index()
+        return write_frame(base_dir, name, combined, meta=meta)
+
+    path = frame_dir(base_dir, name)
+    rows = manifest["rows"]
+    for col, arr in arrays.items():
+        c = stored[col]
+        with open(os.path.join(path, c["file"]), "r+b") as f:
+            # 丢弃上次中断残留的半截数据，再追加
+            f.truncate(rows * arr.dtype.itemsize)
+            f.seek(0, os.SEEK_END)
+            f.write(np.ascontiguousarray(arr).tobytes())
+
+    rows += len(df)
+    manifest["rows"] = rows
+    if not manifest.get("first"):
+        manifest["first"] = str(df.index[0])
+    manifest["last"] = str(df.index[-1])
+    manifest["updated_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    manifest["meta"].update(meta or {})
+    _write_manifest(base_dir, name, manifest)
+    return rows
+
+
+# ---------------------- #
+# 读取
+# ---------------------- #
+def _open_column(path, manifest, col, rows, mmap=True):
+    c = next(c for c in manifest["columns"] if c["name"] == col)
+    dtype = np.dtype(c["dtype"])
+    file_path = os.path.join(path, c["file"])
+    if rows == 0:
+        return np.empty(0, dtype=dtype)
+    if mmap:
+        return np.memmap(file_path, dtype=dtype, mode="r", shape=(rows,))
+    return np.fromfile(file_path, dtype=dtype, count=rows)
+
+
+def _read_legacy_csv(base_dir, name):
+    """兼容旧版 CSV 文件（data/{name}.csv），首次读取后由调用方重写为列式存储。"""
+    csv_path = os.path.join(base_dir, f"{name}.csv")
+    if not os.path.exists(csv_path):
+        return None
+    try:
+        df = pd.read_csv(csv_path, parse_dates=[INDEX_NAME], index_col=INDEX_NAME)
+    except ValueError:
+        df = pd.read_csv(csv_path, parse_dates=True, index_col=0)
+    return _prepare_frame(df)
+
+
+def read_frame(base_dir, name, columns=None, start=None, end=None, mmap=True):
+    """读取一张表，返回以 Date 为索引的 DataFrame；不存在时返回空 DataFrame。
+
+    - columns: 只映射需要的列
+    - start / end: 按日期切片（二分查找，不扫描整列）
+    - mmap: True 时列直接引用内存映射（只读）
+    """
+    manifest = read_manifest(base_dir, name)
+    if manifest is None:
+        df = _read_legacy_csv(base_dir, name)
+        if df is None:
+            return pd.DataFrame()
+        if columns is not None:
+            df = df[[c for c in columns if c in df.columns]]
+        if start is not None:
+            df = df[df.index >= pd.Timestamp(start)]
+        if end is not None:
+            df = df[df.index <= pd.Timestamp(end)]
+        return df
+
+    path = frame_dir(base_dir, name)
+    rows = manifest["rows"]
+    dates = _open_column(path, manifest, INDEX_NAME, rows, mmap=mmap)
+    lo, hi = 0, rows
+    if start is not None:
+        lo = int(np.searchsorted(dates, np.datetime64(pd.Timestamp(start)), side="left"))
+    if end is not None:
+        hi = int(np.searchsorted(dates, np.datetime64(pd.Timestamp(end)), side="right"))
+
+    stored = [c["name"] for c in manifest["columns"] if c["name"] != INDEX_NAME]
+    wanted = stored if columns is None else [c for c in columns if c in stored]
+    data = {col: _open_column(path, manifest, col, rows, mmap=mmap)[lo:hi] for col in wanted}
+    index = pd.DatetimeIndex(dates[lo:hi], name=INDEX_NAME)
+    return pd.DataFrame(data, index=index, columns=wanted, copy=False)
+
+
+def delete_frame(base_dir, name):
+    path = frame_dir(base_dir, name)
+    if not os.path.isdir(path):
+        return
+    for entry in os.listdir(path):
+        os.remove(os.path.join(path, entry))
+    os.rmdir(path)
@@ -0,0 +1,201 @@
+# indicators.py
+# 批量技术指标内核：输入 (时间 × 股票) 的 high/low/close 二维数组，一次性计算整个股票池，
+# 并保存每个指标的递推状态，新 bar 到来时只计算尾部。
+#
+# 计算口径与 ta 库保持一致（见 scripts/check_indicator_parity.py）：
+#   EMA20        close.ewm(span=20, adjust=False)，前 19 根为 NaN
+#   RSI(14)      Wilder 平滑（ewm alpha=1/14, adjust=False），首根 diff 记为 0，前 13 根为 NaN
+#   MACD         EMA12 - EMA26，前 25 根为 NaN；Signal 为 MACD 的 EMA9（从首个有效 MACD 起算）
+#   ATR(14)      前 13 根为 0，第 14 根为前 14 个 TR 的均值，之后 Wilder 递推
+#   BB(20, 2)    20 日均值 ± 2 倍总体标准差 (ddof=0)
+#
+# 每一列独立计数：列 j 只在 close 非 NaN 的行上推进，因此不同长度的股票
+# 左对齐、尾部用 NaN 补齐即可放进同一个数组。
+import numpy as np
+
+EMA_WINDOW = 20
+RSI_WINDOW = 14
+MACD_FAST = 12
+MACD_SLOW = 26
+MACD_SIGN = 9
+ATR_WINDOW = 14
+BB_WINDOW = 20
+BB_DEV = 2
+
+INDICATOR_COLUMNS = [
+    "EMA20", "RSI", "MACD", "MACD_Signal", "MACD_Hist",
+    "ATR", "BB_Upper", "BB_Lower", "BB_Width",
+]
+
+# 整段计算时的最短长度规则（与原 add_technical_indicators 一致）
+MIN_LENGTHS = {
+    "EMA20": EMA_WINDOW,
+    "RSI": RSI_WINDOW,
+    "MACD": MACD_SLOW,
+    "MACD_Signal": MACD_SLOW,
+    "MACD_Hist": MACD_SLOW,
+    "ATR": ATR_WINDOW,
+    "BB_Upper": BB_WINDOW,
+    "BB_Lower": BB_WINDOW,
+    "BB_Width": BB_WINDOW,
+}
+
+# 增量更新要求的最短历史：低于该长度时结果还取决于总长度，只能整段重算
+MIN_HISTORY = max(MIN_LENGTHS.values())
+
+_SCALAR_KEYS = ["last_close", "ema20", "rsi_up", "rsi_down", "macd_fast", "macd_slow", "macd_signal", "atr", "tr_sum"]
+_COUNT_KEYS = ["n", "macd_count"]
+
+
+# ------------------------------ #
+# 状态
+# ------------------------------ #
+def new_state(n_symbols=1):
+    """空状态（尚未处理任何 bar），每个字段都是长度为 n_symbols 的数组。"""
+    state = {key: np.full(n_symbols, np.nan) for key in _SCALAR_KEYS}
+    state["tr_sum"] = np.zeros(n_symbols)
+    for key in _COUNT_KEYS:
+        state[key] = np.zeros(n_symbols, dtype=np.int64)
+    # 最近 BB_WINDOW 个收盘价，按时间顺序，最新的在最后一列
+    state["bb_window"] = np.full((n_symbols, BB_WINDOW), np.nan)
+    return state
+
+
+def state_to_dict(state, j=0):
+    """取出第 j 列的状态，转成可写入 manifest 的 JSON 字典。"""
+    out = {key: float(state[key][j]) for key in _SCALAR_KEYS}
+    out.update({key: int(state[key][j]) for key in _COUNT_KEYS})
+    out["bb_window"] = [float(x) for x in state["bb_window"][j]]
+    return out
+
+
+def state_from_dicts(dicts):
+    """把若干单列状态字典拼成批量状态；None 表示从头开始。"""
+    state = new_state(len(dicts))
+    for j, d in enumerate(dicts):
+        if not d:
+            continue
+        for key in _SCALAR_KEYS + _COUNT_KEYS:
+            state[key][j] = d[key]
+        state["bb_window"][j] = d["bb_window"]
+    return state
+
+
+def _as_2d(arr):
+    arr = np.asarray(arr, dtype=float)
+    return arr.reshape(-1, 1) if arr.ndim == 1 else arr
+
+
+# ------------------------------ #
+# 内核
+# ------------------------------ #
+def extend(state, high, low, close):
+    """从 state 出发推进一段 bar。
+
+    high / low / close: (T, S) 数组（或长度 T 的一维数组，视为 S=1）；close 为 NaN 的位置不推进
+    返回 (columns, new_state)：columns 为 {列名: 与输入同形状的数组}，new_state 不与入参共享内存。
+    """
+    one_d = np.ndim(close) == 1
+    high, low, close = _as_2d(high), _as_2d(low), _as_2d(close)
+    T, S = close.shape
+
+    st = {key: val.copy() for key, val in state.items()}
+    out = {col: np.full((T, S), np.nan) for col in INDICATOR_COLUMNS}
+
+    a_ema = 2 / (EMA_WINDOW + 1)
+    a_fast = 2 / (MACD_FAST + 1)
+    a_slow = 2 / (MACD_SLOW + 1)
+    a_sign = 2 / (MACD_SIGN + 1)
+    a_rsi = 1 / RSI_WINDOW
+
+    def ema(prev, x, alpha, first):
+        return np.where(first, x, (1 - alpha) * prev + alpha * x)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for t in range(T):
+            c, h, lo = close[t], high[t], low[t]
+            active = ~np.isnan(c)
+            if not active.any():
+                continue
+            k = st["n"]
+            first = k == 0
+            prev_c = st["last_close"]
+
+            def commit(key, value):
+                st[key] = np.where(active, value, st[key])
+
+            # EMA20
+            commit("ema20", ema(st["ema20"], c, a_ema, first))
+            out["EMA20"][t] = np.where(active & (k >= EMA_WINDOW - 1), st["ema20"], np.nan)
+
+            # RSI：首根 diff 为 NaN，按 0 参与平滑
+            diff = np.where(first, 0.0, c - prev_c)
+            commit("rsi_up", ema(st["rsi_up"], np.maximum(diff, 0.0), a_rsi, first))
+            commit("rsi_down", ema(st["rsi_down"], np.maximum(-diff, 0.0), a_rsi, first))
+            rsi = np.where(st["rsi_down"] == 0, 100.0, 100 - 100 / (1 + st["rsi_up"] / st["rsi_down"]))
+            out["RSI"][t] = np.where(active & (k >= RSI_WINDOW - 1), rsi, np.nan)
+
+            # MACD
+            commit("macd_fast", ema(st["macd_fast"], c, a_fast, first))
+            commit("macd_slow", ema(st["macd_slow"], c, a_slow, first))
+            macd_on = active & (k >= MACD_SLOW - 1)
+            macd = st["macd_fast"] - st["macd_slow"]
+            st["macd_signal"] = np.where(macd_on, ema(st["macd_signal"], macd, a_sign, st["macd_count"] == 0), st["macd_signal"])
+            st["macd_count"] = st["macd_count"] + macd_on
+            signal_on = macd_on & (st["macd_count"] >= MACD_SIGN)
+            out["MACD"][t] = np.where(macd_on, macd, np.nan)
+            out["MACD_Signal"][t] = np.where(signal_on, st["macd_signal"], np.nan)
+            out["MACD_Hist"][t] = np.where(signal_on, macd - st["macd_signal"], np.nan)
+
+            # ATR：前 14 个 TR 取均值作为种子，之后 Wilder 递推
+            tr = np.where(first, h - lo, np.maximum(h - lo, np.maximum(np.abs(h - prev_c), np.abs(lo - prev_c))))
+            seeding = k < ATR_WINDOW
+            commit("tr_sum", np.where(seeding, st["tr_sum"] + tr, st["tr_sum"]))
+            atr = np.where(
+                k == ATR_WINDOW - 1,
+                st["tr_sum"] / ATR_WINDOW,
+                (st["atr"] * (ATR_WINDOW - 1) + tr) / ATR_WINDOW,
+            )
+            commit("atr", np.where(k >= ATR_WINDOW - 1, atr, st["atr"]))
+            out["ATR"][t] = np.where(active, np.where(k >= ATR_WINDOW - 1, st["atr"], 0.0), np.nan)
+
+            # 布林带：窗口左移一格，最新收盘价放在最后
+            shifted = np.concatenate([st["bb_window"][:, 1:], c[:, None]], axis=1)
+            st["bb_window"] = np.where(active[:, None], shifted, st["bb_window"])
+            bb_on = active & (k >= BB_WINDOW - 1)
+            if bb_on.any():
+                window = st["bb_window"]
+                mean = window.sum(axis=1) / BB_WINDOW
+                std = np.sqrt(((window - mean[:, None]) ** 2).sum(axis=1) / BB_WINDOW)
+                upper = mean + BB_DEV * std
+                lower = mean - BB_DEV * std
+                out["BB_Upper"][t] = np.where(bb_on, upper, np.nan)
+                out["BB_Lower"][t] = np.where(bb_on, lower, np.nan)
+                out["BB_Width"][t] = np.where(bb_on, upper - lower, np.nan)
+
+            commit("last_close", c)
+            st["n"] = k + active
+
+    if one_d:
+        out = {col: arr[:, 0] for col, arr in out.items()}
+    return out, st
+
+
+def compute(high, low, close):
+    """整段计算（从空状态开始），并按每列的有效长度套用最短长度规则。
+
+    与原 add_technical_indicators 一致：长度不足 20/14/26 的股票，对应指标整列为 NaN。
+    """
+    one_d = np.ndim(close) == 1
+    close2 = _as_2d(close)
+    out, state = extend(new_state(close2.shape[1]), high, low, close)
+    lengths = state["n"]
+    for col, min_len in MIN_LENGTHS.items():
+        short = lengths < min_len
+        if not short.any():
+            continue
+        if one_d:
+            out[col][:] = np.nan
+        else:
+            out[col][:, short] = np.nan
+    return out, state
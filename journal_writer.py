@@ -0,0 +1,71 @@
+# journal_writer.py
+# 交易 / 持仓日志的缓冲写入：行先放在内存里，按策略批量追加到 CSV（csv 模块，不经过 pandas，换行符与 DataFrame.to_csv 相同）。
+#
+# 落盘策略（config.JOURNAL_FLUSH）：
+#   trade   每条记录立即写入（与旧实现一致，最稳妥）
+#   day     每个交易日结束时（end_of_day）写入
+#   exit    只在 close() / 进程退出时写入
+# 任何策略下缓冲超过 max_rows 行都会提前写入，避免长回测占用过多内存。
+import os
+import csv
+import atexit
+import threading
+from config import JOURNAL_FLUSH, JOURNAL_MAX_ROWS
+
+FLUSH_POLICIES = ("trade", "day", "exit")
+
+
+class JournalWriter:
+    def __init__(self, path, columns, policy=JOURNAL_FLUSH, max_rows=JOURNAL_MAX_ROWS):
+        if policy not in FLUSH_POLICIES:
+            raise ValueError(f"未知的日志落盘策略: {policy}，可选 {FLUSH_POLICIES}")
+        self.path = path
+        self.columns = list(columns)
+        self.policy = policy
+        self.max_rows = max_rows
+        self._buf = []
+        self._lock = threading.Lock()
+
+        dirpath = os.path.dirname(path)
+        if dirpath:
+            os.makedirs(dirpath, exist_ok=True)
+        # 新文件先写表头（已有文件直接追加）
+        if not os.path.exists(path):
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                csv.writer(f, lineterminator=os.linesep).writerow(self.columns)
+        atexit.register(self.flush)
+
+    def __len__(self):
+        return len(self._buf)
+
+    def write(self, row):
+        """追加一行，row 的顺序与 columns 一致。"""
+        with self._lock:
+            self._buf.append(row)
+            if self.policy == "trade" or len(self._buf) >= self.max_rows:
+                self._flush_locked()
+
+    def write_many(self, rows):
+        with self._lock:
+            self._buf.extend(rows)
+            if self.policy == "trade" or len(self._buf) >= self.max_rows:
+                self._flush_locked()
+
+    def end_of_day(self):
+        if self.policy in ("trade", "day"):
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._buf:
+            return
+        with open(self.path, "a", newline="", encoding="utf-8") as f:
+            csv.writer(f, lineterminator=os.linesep).writerows(self._buf)
+        self._buf = []
+
+    def close(self):
+        self.flush()
+        atexit.unregister(self.flush)
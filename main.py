@@ -1,33 +1,43 @@
 # main.py
-import os
 import pandas as pd
 from datetime import datetime
-from ai_agent import AIAgent
-from portfolio_manager import PortfolioManager
+from portfolio_manager import PortfolioManager, max_drawdown
 from trade_executor import TradeExecutor
-from config import SYMBOLS, TRADE_FEE
+from config import SYMBOLS, PROCESSED_PATH, STRATEGY, INTRADAY_INTERVALS
+from strategies import make_strategy
+from data_store import read_frame
+from market_panel import MarketPanel
+from price_index import PriceIndex
 from data_fetcher import initialize_all_data
 from data_preprocessor import preprocess_all
 from add_vix import add_allVix
+from utils.api_helper import get_llm_cache
+from utils.tracing import span, traced, flush as flush_traces
+from signal_queue import SignalQueue
 
 # ==========================================================
 # 🧩 回测控制器
 # ==========================================================
 class BacktestController:
-    def __init__(self, start_date=None, end_date=None):
+    def __init__(self, start_date=None, end_date=None, agent=None, symbols=None):
         self.start_date = start_date
         self.end_date = end_date
+        self.symbols = symbols or SYMBOLS
         self.portfolio = PortfolioManager(initial_cash=100000)
-        self.agent = AIAgent()
+        # agent 可替换为任何实现了 generate_signals / save_signals 的对象（例如规则策略、基准测试中的桩）
+        self.agent = agent or make_strategy(STRATEGY)
         self.executor = TradeExecutor(self.portfolio)
+        # 当天信号由 agent 直接交给执行器，不再经由 CSV 文件
+        self.signal_queue = SignalQueue()
 
     # ------------------------------------------------------
     # 初始化数据
     # ------------------------------------------------------
+    @traced("initialize_data")
     def initialize_data(self):
         print("\n🚀 正在初始化数据...")
-        initialize_all_data()
-        preprocess_all()
+        initialize_all_data(self.symbols)
+        preprocess_all(self.symbols)
         add_allVix()
         print("✅ 数据初始化完成！")
 
@@ -36,25 +46,29 @@ class BacktestController:
     # ------------------------------------------------------
     def load_all_data(self):
         all_data = {}
-        for sym in SYMBOLS:
-            daily_path = f"processed/{sym}_daily_clean.csv"
-            weekly_path = f"processed/{sym}_weekly_clean.csv"
-            monthly_path = f"processed/{sym}_monthly_clean.csv"
-
-            if os.path.exists(daily_path):
-                df_daily = pd.read_csv(daily_path, parse_dates=["Date"]).sort_values("Date")
-            else:
+        start = pd.Timestamp(self.start_date) - pd.Timedelta(days=7) if self.start_date else None
+        end = pd.Timestamp(self.end_date) + pd.Timedelta(days=1) if self.end_date else None
+        for sym in self.symbols:
+            df_daily = read_frame(PROCESSED_PATH, f"{sym}_daily_clean")
+            if df_daily.empty:
                 print(f"⚠️ 缺少 {sym} 日线数据")
                 continue
+            df_daily = df_daily.reset_index()
 
-            df_weekly = pd.read_csv(weekly_path, parse_dates=["Date"]).sort_values("Date") if os.path.exists(weekly_path) else pd.DataFrame()
-            df_monthly = pd.read_csv(monthly_path, parse_dates=["Date"]).sort_values("Date") if os.path.exists(monthly_path) else pd.DataFrame()
+            df_weekly = read_frame(PROCESSED_PATH, f"{sym}_weekly_clean")
+            df_weekly = df_weekly.reset_index() if not df_weekly.empty else pd.DataFrame()
+            df_monthly = read_frame(PROCESSED_PATH, f"{sym}_monthly_clean")
+            df_monthly = df_monthly.reset_index() if not df_monthly.empty else pd.DataFrame()
 
             all_data[sym] = {
                 "daily": df_daily,
                 "weekly": df_weekly,
                 "monthly": df_monthly
             }
+            # 日内 bar 行数是日线的几十倍，只读回测区间（前面多留几天，供第一天 as-of 取值）
+            for interval in INTRADAY_INTERVALS:
+                df_intraday = read_frame(PROCESSED_PATH, f"{sym}_{interval}_clean", start=start, end=end)
+                all_data[sym][interval] = df_intraday.reset_index() if not df_intraday.empty else pd.DataFrame()
         return all_data
 
     # ------------------------------------------------------
@@ -74,80 +88,85 @@ class BacktestController:
     # ------------------------------------------------------
     # 主回测循环
     # ------------------------------------------------------
-    def run(self):
-        self.initialize_data()
-        all_data = self.load_all_data()
-        all_days = self.get_trading_days({sym: d["daily"] for sym, d in all_data.items()})
-
-        for current_day in all_days:
-            print(f"\n📅 日期: {current_day} --------------------")
-
-            # 组合多周期数据
-            daily_data = {}
-            for sym, dfs in all_data.items():
-                df_d = dfs["daily"]
-                df_w = dfs["weekly"]
-                df_m = dfs["monthly"]
-
-                # 获取当日行
-                row_d = df_d[df_d["Date"].dt.date == current_day]
-                if row_d.empty:
-                    continue
-                row_d = row_d.iloc[-1].to_dict()
-
-                # 获取最新周/月线（不晚于当天）
-                row_w = df_w[df_w["Date"].dt.date <= current_day]
-                row_w = row_w.iloc[-1].to_dict() if not row_w.empty else {}
-                row_m = df_m[df_m["Date"].dt.date <= current_day]
-                row_m = row_m.iloc[-1].to_dict() if not row_m.empty else {}
-
-                # 打包传入 agent
-                daily_data[sym] = {
-                    "daily": row_d,
-                    "weekly": row_w,
-                    "monthly": row_m,
-                }
-
-            if not daily_data:
-                continue
+    def run(self, refresh_data=True):
+        if refresh_data:
+            self.initialize_data()
+        with span("backtest.load", symbols=len(self.symbols)):
+            all_data = self.load_all_data()
+            all_days = self.get_trading_days({sym: d["daily"] for sym, d in all_data.items()})
+
+        # 预先构建时点对齐面板：日线行 + 截至当天已完成的周/月线 bar
+        with span("backtest.panel", symbols=len(all_data), days=len(all_days)):
+            panel = MarketPanel(all_data, all_days)
+            # 成交价索引用全部历史构建（窗口最后一天的 next_open 也能取到），agent 与执行器共用
+            self.price_index = PriceIndex.from_frames({sym: d["daily"] for sym, d in all_data.items()})
+            self.executor.price_index = self.price_index
+            # 持仓数组与面板列对齐，净值曲线按回测天数预分配
+            self.portfolio.set_universe(panel.symbols, len(panel.days))
+            if hasattr(self.agent, "price_index"):
+                self.agent.price_index = self.price_index
+            # 规则策略等可以在这里对整个面板一次性预计算信号
+            if hasattr(self.agent, "prepare"):
+                self.agent.prepare(panel)
+
+        for day_idx, current_day in enumerate(panel.days):
+            with span("backtest.day", day=str(current_day)):
+                self._run_day(panel, day_idx, current_day)
+                self.portfolio.mark_to_market(date=current_day)
 
-            # === AI 生成信号 ===
-            signals = self.agent.generate_signals(daily_data, self.portfolio.positions)
-            if signals.empty:
-                continue
-            self.agent.save_signals(signals)
+        print("\n✅ 回测完成！")
+        if hasattr(self.agent, "close"):
+            self.agent.close()
+        self.portfolio.close()
+        self.final_report()
+        flush_traces()
 
-            # === 执行交易 ===
-            self.executor.run()
+    def _run_day(self, panel, day_idx, current_day):
+        print(f"\n📅 日期: {current_day} --------------------")
+        self.portfolio.set_date(current_day)
+        self.portfolio.update_prices(panel.close[day_idx])
 
-            # === 扣手续费 ===
-            trades_path = "logs/trades_log.csv"
-            if os.path.exists(trades_path):
-                trades = pd.read_csv(trades_path)
-                daily_trades = trades[trades["Time"].str.contains(str(current_day))]
-                if not daily_trades.empty:
-                    fee = len(daily_trades) * TRADE_FEE
-                    self.portfolio.cash -= fee
-                    print(f"💸 扣除手续费 {TRADE_FEE}/笔，共 {fee:.2f} 美元")
+        # 组合多周期数据（整数下标查找）
+        daily_data = panel.snapshot(day_idx)
 
-            # === 每日汇总 ===
-            self.portfolio.summary()
+        if not daily_data:
+            return
 
-        print("\n✅ 回测完成！")
-        self.final_report()
+        # === AI 生成信号 ===
+        signals = self.agent.generate_signals(daily_data, self.portfolio.positions)
+        if signals.empty:
+            return
+        self.signal_queue.put(current_day, self.agent.save_signals(signals))
+
+        # === 执行交易（只执行当天这一批）===
+        with span("backtest.execute"):
+            self.executor.run(self.signal_queue.take(current_day))
+        self.portfolio.end_of_day()
+
+        # === 手续费（成交时已扣除，这里只汇总当天）===
+        stats = self.portfolio.day_stats(current_day)
+        if stats["trades"]:
+            print(f"💸 今日成交 {stats['trades']} 笔，手续费共 {stats['fees']:.2f} 美元")
+
+        # === 每日汇总 ===
+        self.portfolio.summary()
 
     # ------------------------------------------------------
     # 绩效汇总
     # ------------------------------------------------------
     def final_report(self):
-        trades_path = "logs/trades_log.csv"
-        if not os.path.exists(trades_path):
+        cache_stats = get_llm_cache().stats()
+        print(f"\n🗄️ 模型响应缓存 ({cache_stats['mode']}): 命中 {cache_stats['hits']} 次，未命中 {cache_stats['misses']} 次")
+        if not self.portfolio.ledger:
+            # 没有成交时仍输出现金、净值曲线与回撤
             print("⚠️ 无交易记录。")
-            return
-
-        trades = pd.read_csv(trades_path)
-        print(f"\n📊 总交易次数: {len(trades)}")
+        else:
+            print(f"📊 总交易次数: {len(self.portfolio.ledger)}")
+            print(f"💸 手续费合计: {self.portfolio.total_fees:.2f}")
         print(f"💰 最终现金: {self.portfolio.cash:.2f}")
+        equity = self.portfolio.equity
+        if len(equity):
+            print(f"📈 期末净值: {equity[-1]:.2f}，最大回撤: {max_drawdown(equity):.2%}")
         self.portfolio.summary()
 
 
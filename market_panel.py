@@ -0,0 +1,171 @@
+# market_panel.py
+# 回测用的时点对齐面板：每次回测只构建一次，主循环里只做整数下标查找。
+#
+#   days          -> 交易日列表 (datetime.date)
+#   symbols       -> 股票列表
+#   positions[tf] -> (n_days, n_symbols) 的 int64 矩阵，值为该周期 DataFrame 的行号，-1 表示无数据
+#
+# 日线取当天的行；周线/月线取截至当天「已走完」的最近一根 bar（as-of join），
+# 避免把尚未收盘的本周/本月 bar（包含未来价格）喂给模型。
+# 日内周期（1h / 15m / 5m，all_data 中除日/周/月线以外的 key）取截至当天收盘的最后一根 bar。
+import numpy as np
+import pandas as pd
+
+# 周期 bar 的时长（yfinance 的周线/月线以周期起始日标记）
+TIMEFRAME_PERIODS = {
+    "weekly": pd.DateOffset(weeks=1),
+    "monthly": pd.DateOffset(months=1),
+}
+BASE_TIMEFRAMES = ["daily", "weekly", "monthly"]
+
+
+def _to_days(dates):
+    """DatetimeIndex/Series -> datetime64[D] 数组（只保留日期部分）。"""
+    return pd.DatetimeIndex(dates).normalize().to_numpy(dtype="datetime64[D]")
+
+
+def _completion_days(bar_starts, period, daily_days):
+    """计算每根周期 bar 在日线上「走完」的那一天。
+
+    - 完成日 = 该 bar 覆盖区间 [start, start + period) 内最后一个日线交易日
+    - 区间最后一个工作日晚于日线数据末尾的 bar 视为未完成，永不可见
+    - 区间内没有日线交易日（例如整周停牌）时，取区间的最后一个自然日
+    """
+    starts = pd.DatetimeIndex(bar_starts).normalize()
+    ends = _to_days(starts + period)  # 区间右端（开区间）
+    last_bday = _to_days((starts + period) - pd.offsets.BDay(1))
+    starts = starts.to_numpy(dtype="datetime64[D]")
+    never = np.datetime64("9999-12-31", "D")
+
+    if len(daily_days) == 0:
+        return np.full(len(starts), never)
+
+    idx = np.searchsorted(daily_days, ends, side="left") - 1
+    last_in_bar = daily_days[np.clip(idx, 0, None)]
+    has_daily = (idx >= 0) & (last_in_bar >= starts)
+    completion = np.where(has_daily, last_in_bar, ends - np.timedelta64(1, "D"))
+    # bar 区间还没结束（数据截止在 bar 中途）-> 未完成
+    completion = np.where(last_bday > daily_days[-1], never, completion)
+    # 保证单调，便于二分查找
+    return np.maximum.accumulate(completion)
+
+
+class _FrameColumns:
+    """把一个 DataFrame 拆成按列的 numpy 数组，按行号取出字典。"""
+
+    def __init__(self, df):
+        df = df.reset_index(drop=True)
+        self.dates = pd.DatetimeIndex(df["Date"]) if "Date" in df.columns else None
+        self.columns = [c for c in df.columns if c != "Date"]
+        self.arrays = [df[c].to_numpy() for c in self.columns]
+
+    def row(self, pos):
+        out = {}
+        if self.dates is not None:
+            out["Date"] = self.dates[pos]
+        for col, arr in zip(self.columns, self.arrays):
+            val = arr[pos]
+            out[col] = val.item() if isinstance(val, np.generic) else val
+        return out
+
+
+class MarketPanel:
+    def __init__(self, all_data, days, completed_only=True):
+        """
+        all_data: {symbol: {"daily": df, "weekly": df, "monthly": df, ["1h": df, ...]}}（Date 为列）
+        days: 回测交易日列表（datetime.date），通常来自 BacktestController.get_trading_days
+        completed_only: 周线/月线只取已走完的 bar；False 时退化为 Date <= 当天
+        """
+        self.symbols = list(all_data)
+        self.days = list(days)
+        self.completed_only = completed_only
+        self._day_index = {d: i for i, d in enumerate(self.days)}
+
+        day_arr = np.array(self.days, dtype="datetime64[D]")
+        n_days, n_syms = len(self.days), len(self.symbols)
+
+        # 日内周期按在 all_data 中首次出现的顺序排列
+        self.intraday = []
+        for dfs in all_data.values():
+            self.intraday += [tf for tf in dfs if tf not in BASE_TIMEFRAMES and tf not in self.intraday]
+        self.timeframes = BASE_TIMEFRAMES + self.intraday
+
+        self.positions = {tf: np.full((n_days, n_syms), -1, dtype=np.int64) for tf in self.timeframes}
+        self._frames = {tf: [None] * n_syms for tf in self.timeframes}
+        # 日内 bar 可见的截止时刻：交易日次日零点（当天收盘前的 bar 都已走完）
+        day_ends = (day_arr + np.timedelta64(1, "D")).astype("datetime64[ns]")
+
+        for j, sym in enumerate(self.symbols):
+            dfs = all_data[sym]
+            df_d = dfs.get("daily", pd.DataFrame())
+            if df_d is None or df_d.empty:
+                continue
+            daily_days = _to_days(df_d["Date"])
+
+            # 日线：当天的行（同一天多行时取最后一行）
+            self._frames["daily"][j] = _FrameColumns(df_d)
+            rows = np.arange(len(daily_days))
+            if n_days:
+                hit = np.searchsorted(day_arr, daily_days)
+                ok = (hit < n_days) & (day_arr[np.clip(hit, 0, n_days - 1)] == daily_days)
+                self.positions["daily"][hit[ok], j] = rows[ok]
+
+            # 周线/月线：as-of join
+            for tf, period in TIMEFRAME_PERIODS.items():
+                df_tf = dfs.get(tf, pd.DataFrame())
+                if df_tf is None or df_tf.empty:
+                    continue
+                self._frames[tf][j] = _FrameColumns(df_tf)
+                if completed_only:
+                    available = _completion_days(df_tf["Date"], period, daily_days)
+                else:
+                    available = np.maximum.accumulate(_to_days(df_tf["Date"]))
+                self.positions[tf][:, j] = np.searchsorted(available, day_arr, side="right") - 1
+
+            # 日内：as-of join 到当天收盘
+            for tf in self.intraday:
+                df_tf = dfs.get(tf)
+                if df_tf is None or df_tf.empty:
+                    continue
+                self._frames[tf][j] = _FrameColumns(df_tf)
+                stamps = np.maximum.accumulate(pd.DatetimeIndex(df_tf["Date"]).to_numpy(dtype="datetime64[ns]"))
+                self.positions[tf][:, j] = np.searchsorted(stamps, day_ends, side="left") - 1
+
+        self.close = self.matrix("Close")
+
+    # ------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------
+    def day_index(self, day):
+        return self._day_index.get(day)
+
+    def matrix(self, column, timeframe="daily"):
+        """(n_days, n_symbols) 的 float 矩阵，缺失为 NaN。"""
+        pos = self.positions[timeframe]
+        out = np.full(pos.shape, np.nan)
+        for j, frame in enumerate(self._frames[timeframe]):
+            if frame is None or column not in frame.columns:
+                continue
+            arr = frame.arrays[frame.columns.index(column)].astype(float)
+            valid = pos[:, j] >= 0
+            out[valid, j] = arr[pos[valid, j]]
+        return out
+
+    def snapshot(self, i):
+        """第 i 个交易日的多周期数据，格式与 AIAgent.generate_signals 的 daily_data 一致。"""
+        daily_data = {}
+        pos_d = self.positions["daily"][i]
+        pos_w = self.positions["weekly"][i]
+        pos_m = self.positions["monthly"][i]
+        for j, sym in enumerate(self.symbols):
+            if pos_d[j] < 0:
+                continue
+            daily_data[sym] = {
+                "daily": self._frames["daily"][j].row(pos_d[j]),
+                "weekly": self._frames["weekly"][j].row(pos_w[j]) if pos_w[j] >= 0 else {},
+                "monthly": self._frames["monthly"][j].row(pos_m[j]) if pos_m[j] >= 0 else {},
+            }
+            for tf in self.intraday:
+                pos = self.positions[tf][i, j]
+                daily_data[sym][tf] = self._frames[tf][j].row(pos) if pos >= 0 else {}
+        return daily_data
@@ -1,52 +1,88 @@
 # portfolio_manager.py
 import os
-import pandas as pd
+import numpy as np
 from datetime import datetime
+from config import JOURNAL_FLUSH, TRADE_FEE, COMMISSION_RATE
+from journal_writer import JournalWriter
 
 # ==========================================================
 # 🧩 PortfolioManager 类
 # ==========================================================
+TRADE_COLUMNS = ["Time", "Symbol", "Action", "Price", "Quantity", "Cost", "Cash_Balance"]
+POSITION_COLUMNS = [
+    "Time", "Symbol", "Quantity", "Avg_Price", "Market_Price",
+    "Market_Value", "Cash", "Total_Value"
+]
+
+
+def max_drawdown(equity):
+    """净值曲线的最大回撤（0.1 表示 10%），空曲线返回 0。"""
+    equity = np.asarray(equity, dtype=float)
+    if len(equity) == 0:
+        return 0.0
+    return float((1 - equity / np.maximum.accumulate(equity)).max())
+
+
 class PortfolioManager:
-    def __init__(self, initial_cash=100000, log_path="logs/"):
+    def __init__(self, initial_cash=100000, log_path="logs/", journal_flush=JOURNAL_FLUSH,
+                 trade_fee=TRADE_FEE, commission_rate=COMMISSION_RATE, symbols=None, n_days=0):
+        """
+        log_path=None 时不写交易 / 持仓日志（例如参数扫描）。
+        symbols: 股票池（与价格面板的列顺序一致）；n_days: 预分配的净值曲线长度。
+        """
         self.cash = initial_cash
-        self.positions = {}  # {symbol: {"qty": 0, "avg_price": 0}}
         self.total_value = initial_cash
         self.log_path = log_path
 
-        os.makedirs(log_path, exist_ok=True)
-        self.trades_log_file = os.path.join(log_path, "trades_log.csv")
-        self.positions_log_file = os.path.join(log_path, "positions_log.csv")
+        # 持仓按股票池对齐存成数组（股票代码统一大写）：
+        #   qty[j] 股数 / avg_price[j] 成本价 / last_close[j] 最近一次已知收盘价（NaN 表示还没有）
+        self.symbols = []
+        self._sym_index = {}
+        self.qty = np.zeros(0, dtype=np.int64)
+        self.avg_price = np.zeros(0)
+        self.last_close = np.zeros(0)
+        # 每日净值曲线（预分配，equity 属性返回已写入部分的视图）
+        self.equity_curve = np.full(n_days, np.nan)
+        self.equity_dates = []
+        if symbols is not None:
+            self.set_universe(symbols)
 
-        # 初始化日志文件
-        if not os.path.exists(self.trades_log_file):
-            pd.DataFrame(columns=[
-                "Time", "Symbol", "Action", "Price", "Quantity", "Cost", "Cash_Balance"
-            ]).to_csv(self.trades_log_file, index=False)
+        # 费用模型：每笔固定费用 + 成交金额 × 佣金率，成交时扣除
+        self.trade_fee = trade_fee
+        self.commission_rate = commission_rate
+        # 内存成交台账（按模拟日期标记）和每日汇总 {date: {"trades", "fees", "bought", "sold"}}
+        self.current_date = None
+        self.ledger = []
+        self.daily = {}
+        self.total_fees = 0.0
+        self.trades_journal = None
+        self.positions_journal = None
 
-        if not os.path.exists(self.positions_log_file):
-            pd.DataFrame(columns=[
-                "Time", "Symbol", "Quantity", "Avg_Price", "Market_Price",
-                "Market_Value", "Cash", "Total_Value"
-            ]).to_csv(self.positions_log_file, index=False)
+        if log_path is not None:
+            self.trades_log_file = os.path.join(log_path, "trades_log.csv")
+            self.positions_log_file = os.path.join(log_path, "positions_log.csv")
+            # 日志先缓冲在内存里，按 journal_flush 策略批量写入
+            self.trades_journal = JournalWriter(self.trades_log_file, TRADE_COLUMNS, policy=journal_flush)
+            self.positions_journal = JournalWriter(self.positions_log_file, POSITION_COLUMNS, policy=journal_flush)
 
     # ----------------------------------------------------------
     # 💰 买入函数
     # ----------------------------------------------------------
     def buy(self, symbol, price, qty):
         cost = price * qty
-        if cost > self.cash:
+        fee = self.fee_for(price, qty)
+        if cost + fee > self.cash:
             print(f"❌ 现金不足，无法买入 {symbol}。")
             return False
 
         # 更新持仓
-        if symbol not in self.positions:
-            self.positions[symbol] = {"qty": 0, "avg_price": 0}
-
-        pos = self.positions[symbol]
-        new_qty = pos["qty"] + qty
-        pos["avg_price"] = (pos["avg_price"] * pos["qty"] + price * qty) / new_qty
-        pos["qty"] = new_qty
-        self.cash -= cost
+        symbol = symbol.upper()
+        j = self._slot(symbol)
+        new_qty = self.qty[j] + qty
+        self.avg_price[j] = (self.avg_price[j] * self.qty[j] + price * qty) / new_qty
+        self.qty[j] = new_qty
+        self.cash -= cost + fee
+        self._record_fill(symbol, "BUY", price, qty, fee)
 
         self._write_trade_log(symbol, "BUY", price, qty, cost)
         self._write_position_log(symbol, price)
@@ -57,75 +93,191 @@ class PortfolioManager:
     # 💵 卖出函数
     # ----------------------------------------------------------
     def sell(self, symbol, price, qty):
-        if symbol not in self.positions or self.positions[symbol]["qty"] < qty:
+        symbol = symbol.upper()
+        j = self._sym_index.get(symbol)
+        if j is None or self.qty[j] <= 0 or self.qty[j] < qty:
             print(f"❌ 持仓不足，无法卖出 {symbol}。")
             return False
 
-        pos = self.positions[symbol]
-        pos["qty"] -= qty
+        self.qty[j] -= qty
         proceeds = price * qty
-        self.cash += proceeds
+        fee = self.fee_for(price, qty)
+        self.cash += proceeds - fee
+        self._record_fill(symbol, "SELL", price, qty, fee)
 
-        # 如果清仓则删除持仓记录
-        if pos["qty"] == 0:
-            del self.positions[symbol]
+        # 如果清仓则重置成本价
+        if self.qty[j] == 0:
+            self.avg_price[j] = 0.0
 
         self._write_trade_log(symbol, "SELL", price, qty, proceeds)
         self._write_position_log(symbol, price)
         print(f"✅ 卖出 {symbol} {qty} 股 @ {price:.2f}, 现金余额 {self.cash:.2f}")
         return True
 
+    # ----------------------------------------------------------
+    # 📦 持仓数组
+    # ----------------------------------------------------------
+    def set_universe(self, symbols, n_days=None):
+        """按股票池（通常是价格面板的列顺序）重排持仓数组；已有但不在池中的股票排在后面。"""
+        symbols = [s.upper() for s in symbols]
+        extra = [s for s in self.symbols if s not in set(symbols)]
+        new_symbols = symbols + extra
+        qty = np.zeros(len(new_symbols), dtype=np.int64)
+        avg_price = np.zeros(len(new_symbols))
+        last_close = np.full(len(new_symbols), np.nan)
+        for k, sym in enumerate(new_symbols):
+            j = self._sym_index.get(sym)
+            if j is not None:
+                qty[k], avg_price[k], last_close[k] = self.qty[j], self.avg_price[j], self.last_close[j]
+        self.symbols = new_symbols
+        self._sym_index = {s: k for k, s in enumerate(new_symbols)}
+        self.qty, self.avg_price, self.last_close = qty, avg_price, last_close
+
+        if n_days is not None and n_days > len(self.equity_curve) - len(self.equity_dates):
+            self._grow_equity(len(self.equity_dates) + n_days)
+
+    def _slot(self, symbol):
+        """股票在持仓数组中的下标；不在股票池里的新股票追加到末尾。"""
+        j = self._sym_index.get(symbol)
+        if j is None:
+            j = len(self.symbols)
+            self.symbols.append(symbol)
+            self._sym_index[symbol] = j
+            self.qty = np.append(self.qty, 0)
+            self.avg_price = np.append(self.avg_price, 0.0)
+            self.last_close = np.append(self.last_close, np.nan)
+        return j
+
+    @property
+    def positions(self):
+        """兼容旧接口的持仓字典 {symbol: {"qty": .., "avg_price": ..}}（只含持有的股票，每次调用生成新字典）。"""
+        return {
+            self.symbols[j]: {"qty": int(self.qty[j]), "avg_price": float(self.avg_price[j])}
+            for j in np.flatnonzero(self.qty)
+        }
+
+    def qty_of(self, symbol):
+        j = self._sym_index.get(symbol.upper())
+        return int(self.qty[j]) if j is not None else 0
+
+    # ----------------------------------------------------------
+    # 📈 逐日估值与净值曲线
+    # ----------------------------------------------------------
+    def update_prices(self, closes):
+        """closes: 与 symbols 前 len(closes) 个对齐的当天收盘价向量，NaN（当天无数据）保留上一次的价格。"""
+        closes = np.asarray(closes, dtype=float)
+        n = len(closes)
+        np.copyto(self.last_close[:n], closes, where=~np.isnan(closes))
+
+    def _marks(self):
+        # 还没有收盘价的股票按成本价估值
+        return np.where(np.isnan(self.last_close), self.avg_price, self.last_close)
+
+    def market_value(self):
+        return float(self.qty @ self._marks())
+
+    def mark_to_market(self, closes=None, date=None):
+        """按收盘价估值（一次点积），把当天净值写入净值曲线并返回。"""
+        if closes is not None:
+            self.update_prices(closes)
+        self.total_value = self.cash + self.market_value()
+        n = len(self.equity_dates)
+        if n >= len(self.equity_curve):
+            self._grow_equity(max(2 * len(self.equity_curve), n + 1))
+        self.equity_curve[n] = self.total_value
+        self.equity_dates.append(date if date is not None else self.current_date)
+        return self.total_value
+
+    def _grow_equity(self, size):
+        curve = np.full(size, np.nan)
+        curve[:len(self.equity_dates)] = self.equity_curve[:len(self.equity_dates)]
+        self.equity_curve = curve
+
+    @property
+    def equity(self):
+        """已记录的每日净值（equity_curve 的视图，不复制）。"""
+        return self.equity_curve[:len(self.equity_dates)]
+
+    # ----------------------------------------------------------
+    # 🧾 成交台账与手续费
+    # ----------------------------------------------------------
+    def set_date(self, date):
+        """设置当前模拟日期，之后的成交都记在这一天。"""
+        self.current_date = date
+
+    def fee_for(self, price, qty):
+        return self.trade_fee + self.commission_rate * price * qty
+
+    def _record_fill(self, symbol, action, price, qty, fee):
+        self.ledger.append((self.current_date, symbol, action, price, qty, fee))
+        day = self.daily.get(self.current_date)
+        if day is None:
+            day = self.daily[self.current_date] = {"trades": 0, "fees": 0.0, "bought": 0.0, "sold": 0.0}
+        day["trades"] += 1
+        day["fees"] += fee
+        day["bought" if action == "BUY" else "sold"] += price * qty
+        self.total_fees += fee
+
+    def day_stats(self, date=None):
+        """某个模拟日（默认当前日）的成交笔数、手续费、买入 / 卖出金额。"""
+        date = self.current_date if date is None else date
+        return self.daily.get(date, {"trades": 0, "fees": 0.0, "bought": 0.0, "sold": 0.0})
+
     # ----------------------------------------------------------
     # 📓 写入交易日志
     # ----------------------------------------------------------
     def _write_trade_log(self, symbol, action, price, qty, cost):
+        if self.trades_journal is None:
+            return
         time_now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        new_log = pd.DataFrame([{
-            "Time": time_now,
-            "Symbol": symbol,
-            "Action": action,
-            "Price": price,
-            "Quantity": qty,
-            "Cost": cost,
-            "Cash_Balance": self.cash
-        }])
-        new_log.to_csv(self.trades_log_file, mode="a", header=False, index=False)
+        self.trades_journal.write([time_now, symbol, action, price, qty, cost, self.cash])
 
     # ----------------------------------------------------------
     # 📊 写入持仓日志
     # ----------------------------------------------------------
     def _write_position_log(self, symbol, market_price):
+        """成交后的持仓快照：成交股票按成交价、其余按最近收盘价估值；Total_Value 为逐行累计。"""
+        if self.positions_journal is None:
+            return
+        held = np.flatnonzero(self.qty)
+        if not len(held):
+            return
         time_now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        rows = []
-        total_value = self.cash
-
-        for sym, pos in self.positions.items():
-            mkt_value = pos["qty"] * market_price if sym == symbol else pos["qty"] * pos["avg_price"]
-            total_value += mkt_value
-            rows.append({
-                "Time": time_now,
-                "Symbol": sym,
-                "Quantity": pos["qty"],
-                "Avg_Price": pos["avg_price"],
-                "Market_Price": market_price if sym == symbol else pos["avg_price"],
-                "Market_Value": mkt_value,
-                "Cash": self.cash,
-                "Total_Value": total_value
-            })
-
-        if rows:
-            pd.DataFrame(rows).to_csv(self.positions_log_file, mode="a", header=False, index=False)
+        prices = self._marks()[held]
+        prices[held == self._sym_index.get(symbol)] = market_price
+        values = self.qty[held] * prices
+        totals = self.cash + np.cumsum(values)
+
+        self.positions_journal.write_many([
+            [time_now, self.symbols[j], int(self.qty[j]), float(self.avg_price[j]), float(p), float(v), self.cash, float(t)]
+            for j, p, v, t in zip(held, prices, values, totals)
+        ])
+
+    # ----------------------------------------------------------
+    # 💾 日志落盘
+    # ----------------------------------------------------------
+    def end_of_day(self):
+        """交易日结束：按落盘策略写入缓冲的日志。"""
+        for journal in (self.trades_journal, self.positions_journal):
+            if journal is not None:
+                journal.end_of_day()
+
+    def close(self):
+        """写入全部缓冲的日志（回测结束或进程退出前调用）。"""
+        for journal in (self.trades_journal, self.positions_journal):
+            if journal is not None:
+                journal.close()
 
     # ----------------------------------------------------------
     # 📈 查看当前持仓
     # ----------------------------------------------------------
     def summary(self):
         print("\n💼 当前持仓:")
-        total_value = self.cash
-        for sym, pos in self.positions.items():
-            market_value = pos["qty"] * pos["avg_price"]
-            total_value += market_value
-            print(f"{sym}: {pos['qty']} 股, 均价 {pos['avg_price']:.2f}, 市值 {market_value:.2f}")
+        marks = self._marks()
+        for j in np.flatnonzero(self.qty):
+            market_value = self.qty[j] * marks[j]
+            print(f"{self.symbols[j]}: {self.qty[j]} 股, 均价 {self.avg_price[j]:.2f}, 市值 {market_value:.2f}")
+        total_value = self.cash + self.market_value()
         print(f"现金余额: {self.cash:.2f}")
         print(f"账户总资产: {total_value:.2f}")
         return total_value
@@ -0,0 +1,124 @@
+# price_index.py
+# 按 (股票, 日期) O(1) 查询成交价：每次回测从已加载的日线（或 processed/ 存储）构建一次，
+# AIAgent.save_signals 和 TradeExecutor 共用，不再为每条信号重新读取文件。
+#
+# 成交价口径（config.FILL_PRICE）：
+#   close       信号当天收盘价
+#   next_open   该股票下一个交易日的开盘价（最后一天没有下一根 bar 时无法成交）
+#   vwap        当天典型价 (High + Low + Close) / 3，作为 VWAP 的近似
+from datetime import date as _date, datetime
+import numpy as np
+import pandas as pd
+from config import FILL_PRICE, PROCESSED_PATH
+from data_store import read_frame
+
+FILL_MODES = ("close", "next_open", "vwap")
+
+
+def _as_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, _date):
+        return value
+    if isinstance(value, str):
+        try:
+            return _date.fromisoformat(value[:10])
+        except ValueError:
+            pass
+    return pd.Timestamp(value).date()
+
+
+def _fill_prices(df, mode):
+    """按成交价口径计算每一行对应的成交价（与 df 行一一对应）。"""
+    close = df["Close"].to_numpy(dtype=float)
+    if mode == "close":
+        return close
+    if mode == "vwap":
+        return (df["High"].to_numpy(dtype=float) + df["Low"].to_numpy(dtype=float) + close) / 3
+    if mode == "next_open":
+        opens = df["Open"].to_numpy(dtype=float)
+        out = np.full(len(opens), np.nan)
+        out[:-1] = opens[1:]
+        return out
+    raise ValueError(f"未知的成交价口径: {mode}，可选 {FILL_MODES}")
+
+
+class PriceIndex:
+    def __init__(self, days, symbols, close, fill, mode=FILL_PRICE):
+        """
+        days: 升序的 datetime.date 列表；symbols: 股票列表（按大写匹配）
+        close / fill: (n_days, n_symbols) 矩阵，缺失为 NaN
+        """
+        self.days = list(days)
+        self.symbols = [s.upper() for s in symbols]
+        self.mode = mode
+        self.close_matrix = close
+        self.fill_matrix = fill
+        self._day_index = {d: i for i, d in enumerate(self.days)}
+        self._sym_index = {s: j for j, s in enumerate(self.symbols)}
+
+    # ------------------------------------------------------
+    # 构建
+    # ------------------------------------------------------
+    @classmethod
+    def from_frames(cls, frames, mode=FILL_PRICE):
+        """frames: {symbol: 日线 DataFrame}（Date 为列或索引，至少含 Close；next_open 需要 Open，vwap 需要 High/Low）。"""
+        if mode not in FILL_MODES:
+            raise ValueError(f"未知的成交价口径: {mode}，可选 {FILL_MODES}")
+        prepared = {}
+        for sym, df in frames.items():
+            if df is None or df.empty:
+                continue
+            if "Date" in df.columns:
+                df = df.set_index("Date")
+            df = df[~df.index.duplicated(keep="last")].sort_index()
+            prepared[sym] = df
+
+        day_arr = np.unique(np.concatenate(
+            [pd.DatetimeIndex(df.index).normalize().to_numpy(dtype="datetime64[D]") for df in prepared.values()]
+        )) if prepared else np.array([], dtype="datetime64[D]")
+        symbols = list(prepared)
+        close = np.full((len(day_arr), len(symbols)), np.nan)
+        fill = np.full((len(day_arr), len(symbols)), np.nan)
+
+        for j, sym in enumerate(symbols):
+            df = prepared[sym]
+            rows = np.searchsorted(day_arr, pd.DatetimeIndex(df.index).normalize().to_numpy(dtype="datetime64[D]"))
+            close[rows, j] = df["Close"].to_numpy(dtype=float)
+            fill[rows, j] = _fill_prices(df, mode)
+
+        days = [d.item() for d in day_arr]
+        return cls(days, symbols, close, fill, mode)
+
+    @classmethod
+    def from_store(cls, symbols, base_dir=PROCESSED_PATH, mode=FILL_PRICE):
+        """从 processed/ 的 {symbol}_daily_clean 构建（只读取需要的列）。"""
+        columns = {"close": ["Close"], "next_open": ["Open", "Close"], "vwap": ["High", "Low", "Close"]}.get(mode, ["Close"])
+        frames = {}
+        for sym in symbols:
+            df = read_frame(base_dir, f"{sym.lower()}_daily_clean", columns=columns)
+            if not df.empty:
+                frames[sym] = df
+        return cls.from_frames(frames, mode)
+
+    # ------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------
+    def __contains__(self, symbol):
+        return str(symbol).upper() in self._sym_index
+
+    def _lookup(self, matrix, symbol, date):
+        j = self._sym_index.get(str(symbol).upper())
+        i = self._day_index.get(_as_date(date)) if j is not None else None
+        if i is None:
+            return None
+        value = matrix[i, j]
+        return None if np.isnan(value) else float(value)
+
+    def close(self, symbol, date):
+        """当天收盘价，没有数据时返回 None。"""
+        return self._lookup(self.close_matrix, symbol, date)
+
+    def price(self, symbol, date):
+        """按 FILL_PRICE 口径的成交价，无法成交时返回 None。"""
+        return self._lookup(self.fill_matrix, symbol, date)
@@ -0,0 +1,149 @@
+# prompt_encoder.py
+# 把行情快照编码成紧凑的表格文本：每个周期一张表，首行是列名，之后每只股票一行。
+# 相比 indent=2 的 JSON，不再为每只股票重复 key，数值统一保留固定小数位。
+#
+#   [daily]
+#   symbol,Date,Close,Volume,EMA20,RSI,...
+#   TSSI,2024-01-02,12.345,1203400,11.982,61.27,...
+#   [weekly]
+#   ...
+#
+# 缺失值留空。
+import math
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from config import PROMPT_COLUMNS, PROMPT_DECIMALS, PROMPT_TOKEN_BUDGET, PROMPT_BUDGET_ACTION, INTRADAY_INTERVALS
+
+# 开启日内周期时，每只股票额外带上截至当天收盘的最后一根日内 bar（例如 [1h] 表）
+TIMEFRAMES = ["daily", "weekly", "monthly"] + list(INTRADAY_INTERVALS)
+
+# 未配置列投影时，日线默认不发送 Open/High/Low（与原 JSON 格式一致）
+DEFAULT_EXCLUDE = {"daily": {"Open", "High", "Low"}}
+
+# 超出预算时按此顺序整段丢弃（日内表最先）
+TRIM_ORDER = list(reversed(INTRADAY_INTERVALS)) + ["monthly", "weekly"]
+
+
+# ------------------------------ #
+# token 估算
+# ------------------------------ #
+def estimate_tokens(text):
+    """粗略估算 token 数：英文/数字约 4 个字符 1 个 token，中文约 1 个字符 1 个 token。"""
+    if not text:
+        return 0
+    wide = sum(1 for ch in text if ord(ch) > 0x2E80)
+    return math.ceil((len(text) - wide) / 4) + wide
+
+
+# ------------------------------ #
+# 单元格格式化
+# ------------------------------ #
+def format_value(value, decimals=PROMPT_DECIMALS):
+    if value is None:
+        return ""
+    if isinstance(value, (pd.Timestamp, datetime)):
+        # 日内 bar 带上时刻
+        if value.hour or value.minute:
+            return value.strftime("%Y-%m-%d %H:%M")
+        return value.strftime("%Y-%m-%d")
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, bool):
+        return str(value)
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, float):
+        if math.isnan(value) or math.isinf(value):
+            return ""
+        if value.is_integer() and abs(value) >= 10 ** decimals:
+            # 成交量等大整数不带小数
+            return str(int(value))
+        text = f"{value:.{decimals}f}".rstrip("0").rstrip(".")
+        return "0" if text in ("-0", "") else text
+    text = str(value)
+    # 避免文本中的逗号/换行破坏表格
+    return text.replace(",", ";").replace("\n", " ")
+
+
+def _columns_for(rows, timeframe, columns=None):
+    """列投影：显式配置优先，否则按首次出现顺序取全部列（Date 固定放在最前）。"""
+    if columns:
+        return [c for c in columns if c != "symbol"]
+    exclude = DEFAULT_EXCLUDE.get(timeframe, set())
+    seen = []
+    for row in rows:
+        for key in row:
+            if key not in exclude and key not in seen:
+                seen.append(key)
+    if "Date" in seen:
+        seen.remove("Date")
+        seen.insert(0, "Date")
+    return seen
+
+
+def encode_table(rows_by_symbol, timeframe, columns=None, decimals=PROMPT_DECIMALS):
+    """rows_by_symbol: {symbol: {列名: 值}}，返回一张带表头的表（没有任何数据时返回空串）。"""
+    rows = [r for r in rows_by_symbol.values() if r]
+    if not rows:
+        return ""
+    cols = _columns_for(rows, timeframe, columns)
+    lines = [f"[{timeframe}]", ",".join(["symbol"] + cols)]
+    for sym, row in rows_by_symbol.items():
+        if not row:
+            continue
+        lines.append(",".join([str(sym).upper()] + [format_value(row.get(c), decimals) for c in cols]))
+    return "\n".join(lines)
+
+
+def encode_snapshot(daily_data, columns=PROMPT_COLUMNS, decimals=PROMPT_DECIMALS, timeframes=TIMEFRAMES):
+    """daily_data: {symbol: {"daily": {...}, "weekly": {...}, "monthly": {...}}}"""
+    columns = columns or {}
+    tables = []
+    for tf in timeframes:
+        table = encode_table({sym: data.get(tf) for sym, data in daily_data.items()}, tf, columns.get(tf), decimals)
+        if table:
+            tables.append(table)
+    return "\n".join(tables)
+
+
+def encode_positions(positions, decimals=PROMPT_DECIMALS):
+    """positions: {symbol: {"qty": .., "avg_price": ..}}；空持仓返回 "none"。"""
+    rows = {sym: pos if isinstance(pos, dict) else {"qty": pos} for sym, pos in (positions or {}).items()}
+    return encode_table(rows, "positions", decimals=decimals) or "none"
+
+
+# ------------------------------ #
+# 预算控制
+# ------------------------------ #
+def encode_with_budget(daily_data, render, budget=PROMPT_TOKEN_BUDGET, action=PROMPT_BUDGET_ACTION,
+                       columns=PROMPT_COLUMNS, decimals=PROMPT_DECIMALS):
+    """编码行情并用 render(market_text) 生成完整 prompt，再检查 token 预算。
+
+    action:
+    - "warn": 超出预算只打印警告
+    - "trim": 依次丢弃日内、monthly、weekly 表直到不超预算（仍超出时打印警告）
+    返回 (prompt, estimated_tokens)。
+    """
+    timeframes = list(TIMEFRAMES)
+    prompt = render(encode_snapshot(daily_data, columns, decimals, timeframes))
+    tokens = estimate_tokens(prompt)
+    if budget is None or tokens <= budget:
+        return prompt, tokens
+
+    if action == "trim":
+        for tf in TRIM_ORDER:
+            if tf not in timeframes:
+                continue
+            timeframes.remove(tf)
+            prompt = render(encode_snapshot(daily_data, columns, decimals, timeframes))
+            new_tokens = estimate_tokens(prompt)
+            print(f"✂️ prompt 超出预算 ({tokens} > {budget} tokens)，已去掉 {tf} 表 -> {new_tokens} tokens")
+            tokens = new_tokens
+            if tokens <= budget:
+                return prompt, tokens
+    elif action != "warn":
+        raise ValueError(f"未知的预算处理方式: {action}")
+
+    print(f"⚠️ prompt 估算 {tokens} tokens，超出预算 {budget}")
+    return prompt, tokens
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+# 合成数据回测基准：生成 N 只股票 × Y 年的 OHLCV，逐阶段计时并记录峰值内存。
+#
+#   python scripts/benchmark.py                                   # 默认 10,100 只 × 1,5 年
+#   python scripts/benchmark.py --symbols 10,100,1000 --years 1,5,20 --output bench.json
+#   python scripts/benchmark.py --compare bench_baseline.json     # 与基线对比，变慢超过阈值时退出码为 1
+#   python scripts/benchmark.py --agent mock                      # 走本地模拟 DeepSeek 服务（含 HTTP 客户端）
+#
+# 每个规模在独立的临时目录中运行（data/、processed/、logs/ 等相对路径都落在临时目录），不会影响本地数据。
+# 依赖模型的阶段（prompt 编码、信号验证、组合日志、回测主循环）只跑最后 --days 个交易日。
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import contextlib
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_store import write_frame  # noqa: E402
+from data_preprocessor import preprocess_all  # noqa: E402
+from market_panel import MarketPanel  # noqa: E402
+from signal_validator import SignalValidator  # noqa: E402
+from portfolio_manager import PortfolioManager  # noqa: E402
+from ai_agent import AIAgent  # noqa: E402
+from main import BacktestController  # noqa: E402
+from config import DATA_PATH  # noqa: E402
+import utils.api_helper as api_helper  # noqa: E402
+import utils.tracing as tracing  # noqa: E402
+from utils.llm_cache import LLMResponseCache  # noqa: E402
+from utils.mock_deepseek_server import extract_symbols, make_signals, start_mock_server  # noqa: E402
+
+TRADING_DAYS_PER_YEAR = 252
+
+
+# ------------------------------ #
+# 合成数据
+# ------------------------------ #
+def synthetic_daily(n_days, seed, end="2024-12-31"):
+    rng = np.random.default_rng(seed)
+    index = pd.bdate_range(end=end, periods=n_days, name="Date")
+    close = rng.uniform(5, 500) * np.exp(np.cumsum(rng.normal(0.0003, 0.02, n_days)))
+    open_ = close * np.exp(rng.normal(0, 0.005, n_days))
+    high = np.maximum(open_, close) * (1 + rng.uniform(0, 0.02, n_days))
+    low = np.minimum(open_, close) * (1 - rng.uniform(0, 0.02, n_days))
+    volume = rng.integers(100_000, 10_000_000, n_days)
+    return pd.DataFrame({
+        "Open": open_, "High": high, "Low": low, "Close": close, "Volume": volume,
+        "Turnover": volume / 1e8,
+        "LongShortRatio": rng.uniform(0.5, 2.0, n_days),
+        "OptionEvents": rng.integers(0, 5, n_days),
+    }, index=index)
+
+
+def resample_bars(daily, rule):
+    """按 yfinance 的方式聚合周线/月线：bar 以周期起始日标记。"""
+    agg = {
+        "Open": "first", "High": "max", "Low": "min", "Close": "last", "Volume": "sum",
+        "Turnover": "sum", "LongShortRatio": "last", "OptionEvents": "sum",
+    }
+    bars = daily.resample(rule, label="left", closed="left").agg(agg).dropna(subset=["Close"])
+    bars.index.name = "Date"
+    return bars
+
+
+def make_universe(n_symbols, years, seed=0):
+    symbols = [f"syn{j:04d}" for j in range(n_symbols)]
+    n_days = int(years * TRADING_DAYS_PER_YEAR)
+    for j, sym in enumerate(symbols):
+        daily = synthetic_daily(n_days, seed * 100_003 + j)
+        write_frame(DATA_PATH, f"{sym}_daily", daily)
+        write_frame(DATA_PATH, f"{sym}_weekly", resample_bars(daily, "W-MON"))
+        write_frame(DATA_PATH, f"{sym}_monthly", resample_bars(daily, "MS"))
+    return symbols, n_days
+
+
+# ------------------------------ #
+# 桩 Agent：完整走 prompt 构建和信号解析，只把 API 调用换成本地确定性生成
+# ------------------------------ #
+class StubAgent(AIAgent):
+    def __init__(self, seed=0):
+        super().__init__(fanout=False, streaming=False)
+        self.seed = seed
+
+    def _request_signals(self, user_prompt, today):
+        signals = make_signals(extract_symbols(user_prompt), today, self.seed)
+        df = pd.DataFrame(signals, columns=["symbol", "action", "confidence", "reason"])
+        df["Date"] = today
+        return df
+
+
+# ------------------------------ #
+# 计时
+# ------------------------------ #
+class StageTimer:
+    def __init__(self, case, memory=True):
+        self.case = case
+        self.memory = memory
+        self.results = []
+
+    @contextlib.contextmanager
+    def stage(self, name, symbol_days, count=None):
+        if self.memory:
+            tracemalloc.start()
+        devnull = open(os.devnull, "w")
+        start = time.perf_counter()
+        try:
+            # 各阶段大量 print，计时期间丢弃输出
+            with contextlib.redirect_stdout(devnull):
+                yield
+        finally:
+            seconds = time.perf_counter() - start
+            devnull.close()
+            peak = None
+            if self.memory:
+                peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+                tracemalloc.stop()
+            record = {
+                "case": self.case,
+                "stage": name,
+                "seconds": round(seconds, 6),
+                "symbol_days": symbol_days,
+                "symbol_days_per_s": round(symbol_days / seconds, 1) if seconds > 0 else None,
+                "peak_mb": round(peak, 3) if peak is not None else None,
+            }
+            if count is not None:
+                record["count"] = count
+            self.results.append(record)
+            mem = f"  peak {peak:8.1f} MB" if peak is not None else ""
+            print(f"  {name:<18} {seconds:9.3f}s  {record['symbol_days_per_s'] or 0:>14,.0f} symbol-days/s{mem}")
+
+
+def run_case(n_symbols, years, args):
+    case = f"{n_symbols}x{years}y"
+    print(f"\n📐 {case}: {n_symbols} 只股票 × {years} 年")
+    timer = StageTimer(case, memory=not args.no_memory)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="llm_trader_bench_") as tmp:
+        os.chdir(tmp)
+        try:
+            n_days = int(years * TRADING_DAYS_PER_YEAR)
+            total = n_symbols * n_days
+
+            with timer.stage("write_raw", total):
+                symbols, _ = make_universe(n_symbols, years, args.seed)
+
+            with timer.stage("preprocess_all", total):
+                preprocess_all(symbols, full=True)
+
+            agent = make_agent(args)
+            controller = BacktestController(agent=agent, symbols=symbols)
+
+            with timer.stage("load_all_data", total):
+                all_data = controller.load_all_data()
+            days = controller.get_trading_days({sym: d["daily"] for sym, d in all_data.items()})
+
+            with timer.stage("build_panel", total):
+                panel = MarketPanel(all_data, days)
+
+            with timer.stage("snapshots", total):
+                for i in range(len(panel.days)):
+                    panel.snapshot(i)
+
+            # ---- 以下只跑最后 args.days 个交易日 ----
+            tail = list(range(max(0, len(panel.days) - args.days), len(panel.days)))
+            tail_total = n_symbols * len(tail)
+            snapshots = [panel.snapshot(i) for i in tail]
+
+            prompts = []
+            with timer.stage("prompt_encode", tail_total):
+                for snap in snapshots:
+                    today = agent._today(snap)
+                    prompts.append((today, agent._build_user_prompt(today, snap, {})))
+
+            raw = [
+                pd.DataFrame(make_signals(extract_symbols(prompt), today, args.seed)).assign(Date=today)
+                for today, prompt in prompts
+            ]
+            n_signals = sum(len(df) for df in raw)
+            validator = SignalValidator({}, universe=symbols)
+            with timer.stage("validate_signals", tail_total, count=n_signals):
+                for df in raw:
+                    validator.validate_signals(df)
+
+            n_trades = 0
+            with timer.stage("portfolio_log", tail_total):
+                portfolio = PortfolioManager(initial_cash=1e9, log_path="bench_logs/")
+                for i, snap in zip(tail, snapshots):
+                    for sym in list(snap)[:args.trades_per_day]:
+                        price = float(snap[sym]["daily"]["Close"])
+                        portfolio.buy(sym.upper(), price, 10)
+                        portfolio.sell(sym.upper(), price, 10)
+                        n_trades += 2
+                    portfolio.end_of_day()
+                portfolio.close()
+            timer.results[-1]["count"] = n_trades
+
+            start_date = panel.days[tail[0]] if tail else None
+            with timer.stage("backtest_run", tail_total):
+                bt = BacktestController(start_date=start_date, agent=agent, symbols=symbols)
+                bt.run(refresh_data=False)
+        finally:
+            os.chdir(cwd)
+    return timer.results
+
+
+def make_agent(args):
+    # 基准测试不读写模型响应缓存
+    api_helper._llm_cache = LLMResponseCache(mode="off")
+    if args.agent == "stub":
+        return StubAgent(seed=args.seed)
+    return AIAgent(fanout=False, streaming=args.stream)
+
+
+# ------------------------------ #
+# 对比
+# ------------------------------ #
+def compare(results, meta, baseline_path, threshold, min_seconds):
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    baseline = {(r["case"], r["stage"]): r for r in data["results"]}
+
+    print(f"\n🔍 与基线对比: {baseline_path} (阈值 +{threshold:.0%}，忽略 < {min_seconds}s 的差异)")
+    for key in ("memory_tracing", "agent", "days"):
+        if data.get("meta", {}).get(key) != meta[key]:
+            # tracemalloc 会让耗时成倍增加，设置不同的结果不可比
+            print(f"⚠️ 基线的 {key}={data.get('meta', {}).get(key)} 与本次 {meta[key]} 不同，对比结果仅供参考")
+    regressions = []
+    for r in results:
+        base = baseline.get((r["case"], r["stage"]))
+        if base is None or not base["seconds"]:
+            continue
+        ratio = r["seconds"] / base["seconds"]
+        slower = ratio > 1 + threshold and r["seconds"] - base["seconds"] >= min_seconds
+        flag = "❌ 变慢" if slower else ("✅ 变快" if ratio < 1 - threshold else "  ")
+        print(f"  {r['case']:<10} {r['stage']:<18} {base['seconds']:9.3f}s -> {r['seconds']:9.3f}s  x{ratio:5.2f} {flag}")
+        if slower:
+            regressions.append(r)
+    return regressions
+
+
+def parse_list(text, cast):
+    return [cast(x) for x in text.split(",") if x.strip()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="合成数据回测基准")
+    parser.add_argument("--symbols", default="10,100", help="股票数量列表，逗号分隔")
+    parser.add_argument("--years", default="1,5", help="年数列表，逗号分隔")
+    parser.add_argument("--days", type=int, default=20, help="依赖模型的阶段跑最后多少个交易日")
+    parser.add_argument("--trades-per-day", type=int, default=10, help="portfolio_log 阶段每天买卖的股票数")
+    parser.add_argument("--agent", choices=["stub", "mock"], default="stub", help="stub: 进程内生成信号；mock: 本地模拟服务")
+    parser.add_argument("--stream", action="store_true", help="--agent mock 时使用流式接口")
+    parser.add_argument("--mock-latency", default="fixed:0", help="--agent mock 时的服务端延迟分布")
+    parser.add_argument("--repeat", type=int, default=1, help="每个规模重复次数，取最短耗时")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", action="store_true", help="不用 tracemalloc 统计峰值内存（tracemalloc 会显著拉长耗时）")
+    parser.add_argument("--trace", help="把各阶段的 span 写入该 JSONL 文件（默认关闭追踪）")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="基线结果文件")
+    parser.add_argument("--threshold", type=float, default=0.2, help="变慢超过该比例视为回退")
+    parser.add_argument("--min-seconds", type=float, default=0.05, help="绝对差小于该秒数时不视为回退")
+    args = parser.parse_args()
+
+    if args.trace:
+        tracing.configure(enabled=True, path=os.path.abspath(args.trace))
+    else:
+        tracing.configure(enabled=False)
+
+    server = None
+    if args.agent == "mock":
+        server = start_mock_server(latency=args.mock_latency, seed=args.seed)
+        api_helper.DEEPSEEK_API_URL = server.url
+        print(f"🧪 模拟 DeepSeek 服务: {server.url}")
+
+    results = []
+    for n_symbols in parse_list(args.symbols, int):
+        for years in parse_list(args.years, float):
+            years = int(years) if float(years).is_integer() else years
+            runs = [run_case(n_symbols, years, args) for _ in range(max(1, args.repeat))]
+            # 多次运行取每个阶段的最短耗时（峰值内存取最大）以减少噪声
+            for records in zip(*runs):
+                best = dict(min(records, key=lambda r: r["seconds"]))
+                peaks = [r["peak_mb"] for r in records if r["peak_mb"] is not None]
+                best["peak_mb"] = max(peaks) if peaks else None
+                best["runs"] = len(records)
+                results.append(best)
+
+    if server is not None:
+        server.shutdown()
+
+    output = {
+        "meta": {
+            "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "platform": platform.platform(),
+            "agent": args.agent,
+            "days": args.days,
+            "repeat": args.repeat,
+            "memory_tracing": not args.no_memory,
+            "span_tracing": bool(args.trace),
+        },
+        "results": results,
+    }
+    output_path = os.path.abspath(args.output)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(output, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 结果已保存: {output_path}")
+
+    if args.compare:
+        regressions = compare(results, output["meta"], args.compare, args.threshold, args.min_seconds)
+        if regressions:
+            print(f"❌ {len(regressions)} 个阶段变慢")
+            sys.exit(1)
+        print("✅ 未发现性能回退")
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# 对比批量指标内核 (indicators.py) 与 ta 库逐只计算的结果。
+#
+#   python scripts/check_indicator_parity.py              # 合成数据（含长度不足 14/20/26 的股票）
+#   python scripts/check_indicator_parity.py --store      # 本地 data/ 中 SYMBOLS 的日/周/月线
+#
+# 有任何一列超出容差时以非零状态退出。
+import os
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+from ta.trend import EMAIndicator, MACD
+from ta.momentum import RSIIndicator
+from ta.volatility import BollingerBands, AverageTrueRange
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import indicators  # noqa: E402
+from config import SYMBOLS, DATA_PATH  # noqa: E402
+from data_store import read_frame  # noqa: E402
+from data_preprocessor import clean_dataframe, PERIODS, _stack  # noqa: E402
+
+
+def ta_reference(df):
+    """原 add_technical_indicators 基于 ta 的实现（含最短长度规则）。"""
+    out = pd.DataFrame(index=df.index)
+    n = len(df)
+    nan = pd.Series(np.nan, index=df.index)
+
+    out["EMA20"] = EMAIndicator(close=df["Close"], window=20).ema_indicator() if n >= 20 else nan
+    out["RSI"] = RSIIndicator(close=df["Close"], window=14).rsi() if n >= 14 else nan
+    if n >= 26:
+        macd = MACD(close=df["Close"])
+        out["MACD"], out["MACD_Signal"], out["MACD_Hist"] = macd.macd(), macd.macd_signal(), macd.macd_diff()
+    else:
+        out["MACD"] = out["MACD_Signal"] = out["MACD_Hist"] = nan
+    if n >= 14:
+        out["ATR"] = AverageTrueRange(high=df["High"], low=df["Low"], close=df["Close"], window=14).average_true_range().to_numpy()
+    else:
+        out["ATR"] = nan
+    if n >= 20:
+        bb = BollingerBands(close=df["Close"], window=20, window_dev=2)
+        out["BB_Upper"], out["BB_Lower"] = bb.bollinger_hband(), bb.bollinger_lband()
+        out["BB_Width"] = out["BB_Upper"] - out["BB_Lower"]
+    else:
+        out["BB_Upper"] = out["BB_Lower"] = out["BB_Width"] = nan
+    return out
+
+
+def synthetic_frames(seed=0):
+    rng = np.random.default_rng(seed)
+    frames = {}
+    for j, n in enumerate([1, 5, 13, 14, 19, 20, 25, 26, 34, 60, 250, 1000]):
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+        spread = close * rng.uniform(0.001, 0.03, n)
+        frames[f"SYN{j}_{n}"] = pd.DataFrame(
+            {"High": close + spread, "Low": close - spread, "Close": close},
+            index=pd.bdate_range("2015-01-01", periods=n, name="Date"),
+        )
+    return frames
+
+
+def store_frames():
+    frames = {}
+    for sym in SYMBOLS:
+        for period in PERIODS:
+            raw = read_frame(DATA_PATH, f"{sym}_{period}")
+            if not raw.empty:
+                frames[f"{sym}_{period}"] = clean_dataframe(raw.reset_index())
+    return frames
+
+
+def check(frames, rtol=1e-8, atol=1e-8):
+    names = list(frames)
+    dfs = [frames[n] for n in names]
+    batch, _ = indicators.compute(_stack(dfs, "High"), _stack(dfs, "Low"), _stack(dfs, "Close"))
+
+    failures = 0
+    for j, (name, df) in enumerate(zip(names, dfs)):
+        ref = ta_reference(df)
+        for col in indicators.INDICATOR_COLUMNS:
+            got = batch[col][:len(df), j]
+            want = ref[col].to_numpy(dtype=float)
+            if not np.allclose(got, want, rtol=rtol, atol=atol, equal_nan=True):
+                diff = np.nanmax(np.abs(got - want)) if np.isfinite(got - want).any() else float("nan")
+                print(f"❌ {name} {col} 不一致 (max abs diff={diff})")
+                failures += 1
+    print(f"{'✅' if failures == 0 else '❌'} 共检查 {len(names)} 个序列 × {len(indicators.INDICATOR_COLUMNS)} 个指标，{failures} 处不一致")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--store", action="store_true", help="使用本地 data/ 中的行情而不是合成数据")
+    args = parser.parse_args()
+
+    frames = store_frames() if args.store else synthetic_frames()
+    if not frames:
+        print("⚠️ 没有可检查的数据")
+        sys.exit(0)
+    sys.exit(1 if check(frames) else 0)
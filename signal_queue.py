@@ -0,0 +1,109 @@
+# signal_queue.py
+# AIAgent -> TradeExecutor 的进程内信号传递：
+#   SignalQueue      按模拟日期分批存放已验证的信号，执行器每天只取当天那一批
+#   SignalAuditLog   把每批信号追加写入 CSV（只做审计，不再作为执行器的输入），可在后台线程写入；
+#                    也用来录制信号带（columns=TAPE_COLUMNS）
+import os
+import queue
+import threading
+from collections import deque
+import pandas as pd
+from config import Signals_path
+
+# 执行器输入 / 审计文件的列
+SIGNAL_COLUMNS = ["Symbol", "Action", "Confidence", "Reason", "Date", "Price"]
+# 信号带（模型原始输出）的列
+TAPE_COLUMNS = ["Date", "symbol", "action", "confidence", "reason"]
+
+
+def _day_key(date):
+    return str(pd.Timestamp(date).date()) if date is not None and str(date) != "" else ""
+
+
+class SignalQueue:
+    """按日期分批的 FIFO 信号队列。
+
+    put(date, df) 放入一批信号；take(date) 取出并移除该日期的全部批次。
+    早于 date 仍未取走的批次视为过期，直接丢弃（不会在之后的日子里被重复执行）。
+    """
+
+    def __init__(self):
+        self._batches = deque()
+
+    def __len__(self):
+        return len(self._batches)
+
+    def put(self, date, df):
+        if df is None or df.empty:
+            return
+        self._batches.append((_day_key(date), df))
+
+    def take(self, date):
+        key = _day_key(date)
+        taken = []
+        while self._batches and self._batches[0][0] <= key:
+            day, df = self._batches.popleft()
+            if day == key:
+                taken.append(df)
+            else:
+                print(f"⚠️ 丢弃过期信号批次 {day}（{len(df)} 条）")
+        if not taken:
+            return pd.DataFrame(columns=SIGNAL_COLUMNS)
+        return taken[0] if len(taken) == 1 else pd.concat(taken, ignore_index=True)
+
+
+class SignalAuditLog:
+    """只追加的信号审计日志（CSV）。
+
+    async_write=True 时由后台线程写入，主循环不等待磁盘；close() 会等待全部写完。
+    """
+
+    def __init__(self, path=Signals_path, async_write=True, columns=SIGNAL_COLUMNS):
+        self.path = path
+        self.async_write = async_write
+        self.columns = list(columns)
+        dirpath = os.path.dirname(path)
+        if dirpath:
+            os.makedirs(dirpath, exist_ok=True)
+        self._queue = None
+        self._thread = None
+        if async_write:
+            self._queue = queue.Queue()
+            self._thread = threading.Thread(target=self._worker, name="signal-audit", daemon=True)
+            self._thread.start()
+
+    def write(self, df):
+        if df is None or df.empty:
+            return
+        if self._queue is not None:
+            self._queue.put(df.copy())
+        else:
+            self._append(df)
+
+    def _append(self, df):
+        header = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        df.reindex(columns=self.columns).to_csv(self.path, mode="a", header=header, index=False)
+
+    def _worker(self):
+        while True:
+            df = self._queue.get()
+            try:
+                if df is None:
+                    return
+                self._append(df)
+            except Exception as e:
+                print(f"⚠️ 写入信号审计日志失败: {e}")
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        if self._queue is not None:
+            self._queue.join()
+
+    def close(self):
+        """等待后台写完并停止线程；之后的 write() 改为同步写入。"""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._queue = None
+        self._thread = None
@@ -1,78 +1,180 @@
 # signal_validator.py
+import threading
+import numpy as np
 import pandas as pd
-from config import Min_confidence
+from config import Min_confidence, SYMBOLS
 VALID_ACTIONS = ["BUY", "SELL", "HOLD"]
 
+# 被过滤信号的原因代码（按检查顺序，每条信号只记第一个命中的原因）
+REJECT_REASONS = [
+    "missing_symbol",   # 缺少 symbol
+    "invalid_action",   # 动作不是 BUY / SELL / HOLD
+    "unknown_symbol",   # 不在股票池内
+    "low_confidence",   # 置信度低于阈值
+    "no_position",      # 无仓位却 SELL（allow_sell_without_position=False 时）
+    "hold",             # HOLD 不产生交易
+    "duplicate",        # 同一股票的重复信号，只保留置信度最高的一条
+]
+REJECT_COLUMNS = ["symbol", "action", "confidence", "Date", "reject_reason"]
+SIGNAL_FIELDS = ["symbol", "action", "confidence", "reason", "Date"]
+
+
 class SignalValidator:
-    def __init__(self, positions, allow_sell_without_position=True, min_confidence=Min_confidence):
+    def __init__(self, positions, allow_sell_without_position=True, min_confidence=Min_confidence, universe=SYMBOLS):
         """
-        positions: 当前持仓字典，例如 {"AAPL": 100, "MSFT": 0}
+        positions: 当前持仓字典，例如 {"AAPL": 100, "MSFT": 0} 或 {"AAPL": {"qty": 100, ...}}
         allow_sell_without_position: 若为 True，则允许在无仓位时仍执行 SELL（例如做空或强制平仓），否则会被过滤掉。
         min_confidence: 置信度阈值，低于该值的信号会被过滤。
+        universe: 允许交易的股票池，池外的信号会被过滤；None 表示不检查。
         """
         # normalize position keys to uppercase for case-insensitive matching
-        self.positions = {k.upper(): v for k, v in (positions or {}).items()}
+        self.positions = {
+            k.upper(): (v.get("qty", 0) if isinstance(v, dict) else v) or 0
+            for k, v in (positions or {}).items()
+        }
         self.allow_sell_without_position = allow_sell_without_position
         self.min_confidence = min_confidence
+        self.universe = {s.upper() for s in universe} if universe is not None else None
+        # 被过滤的信号（结构化记录，不再逐条打印）；流式模式下已放行的股票
+        # 分片并发 + 流式时多个线程共用同一个验证器，两者都在锁内读写
+        self._rejected = []
+        self._emitted = set()
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------
+    # 被过滤的信号
+    # ------------------------------------------------------
+    @property
+    def rejected(self):
+        """本验证器过滤掉的全部信号：列 symbol / action / confidence / Date / reject_reason。"""
+        with self._lock:
+            records = list(self._rejected)
+        frames = [r if isinstance(r, pd.DataFrame) else pd.DataFrame([r]) for r in records]
+        frames = [f for f in frames if not f.empty]
+        if not frames:
+            return pd.DataFrame(columns=REJECT_COLUMNS)
+        return pd.concat(frames, ignore_index=True).reindex(columns=REJECT_COLUMNS)
+
+    def _reject(self, symbol, action, confidence, date, reason):
+        with self._lock:
+            self._rejected.append({
+                "symbol": symbol, "action": action, "confidence": confidence, "Date": date, "reject_reason": reason
+            })
+        return None
 
-    def validate_signals(self, df: pd.DataFrame):
+    # ------------------------------------------------------
+    # 单条验证（流式输出时每解析出一个对象就调用一次）
+    # ------------------------------------------------------
+    def validate_signal(self, row):
         """
-        检查AI输出信号的合理性
-        返回过滤后的DataFrame
+        检查单条信号（dict 或 DataFrame 的一行），通过时返回规范化后的 dict，否则返回 None。
+        规则与 validate_signals 相同；重复的股票保留先到的那条（已放行的信号无法撤回）。
         """
-        if df.empty:
-            print("⚠️ 没有信号可验证。")
-            return df
+        symbol = row.get("symbol")
+        action = str(row.get("action", "") or "").strip().upper()
+        # confidence may be string/NaN -> coerce
+        try:
+            confidence = float(row.get("confidence", 0) or 0)
+        except Exception:
+            confidence = 0.0
+        if np.isnan(confidence):
+            confidence = 0.0
+        reason = row.get("reason", "") or ""
+        date = row.get("Date", "")
 
-        valid_rows = []
-        for _, row in df.iterrows():
-            # normalize and validate fields
-            symbol = row.get("symbol")
-            if symbol is None:
-                print(f"❌ 无效信号（缺少 symbol）：{row}")
-                continue
-            symbol = str(symbol).upper()
+        if symbol is None or (isinstance(symbol, float) and np.isnan(symbol)) or str(symbol).strip() == "":
+            return self._reject(None, action, confidence, date, "missing_symbol")
+        symbol = str(symbol).strip().upper()
 
-            action = str(row.get("action", "")).upper()
+        if action not in VALID_ACTIONS:
+            return self._reject(symbol, action, confidence, date, "invalid_action")
+        if self.universe is not None and symbol not in self.universe:
+            return self._reject(symbol, action, confidence, date, "unknown_symbol")
+        if confidence < float(self.min_confidence):
+            return self._reject(symbol, action, confidence, date, "low_confidence")
+        if action == "SELL" and self.positions.get(symbol, 0) <= 0 and not self.allow_sell_without_position:
+            return self._reject(symbol, action, confidence, date, "no_position")
+        if action == "HOLD":
+            return self._reject(symbol, action, confidence, date, "hold")
+        # 检查与登记必须原子完成，否则两个分片可能同时放行同一只股票
+        with self._lock:
+            duplicate = symbol in self._emitted
+            self._emitted.add(symbol)
+        if duplicate:
+            return self._reject(symbol, action, confidence, date, "duplicate")
 
-            # confidence may be string/NaN -> coerce
-            try:
-                confidence = float(row.get("confidence", 0) or 0)
-            except Exception:
-                confidence = 0.0
+        return {
+            "symbol": symbol,
+            "action": action,
+            "confidence": confidence,
+            "reason": reason,
+            "Date": date
+        }
 
-            reason = row.get("reason", "") or ""
-            date = row.get("Date", "")
-
-            # 1️⃣ 基本检查
-            if action not in VALID_ACTIONS:
-                print(f"❌ 无效信号动作：{row}")
-                continue
+    # ------------------------------------------------------
+    # 批量验证（按列向量化）
+    # ------------------------------------------------------
+    def validate_signals(self, df: pd.DataFrame, with_rejections=False):
+        """
+        检查AI输出信号的合理性
+        返回过滤后的DataFrame（列 symbol / action / confidence / reason / Date）；
+        with_rejections=True 时返回 (通过的信号, 本次被过滤的信号及原因)。
+        """
+        if df.empty:
+            print("⚠️ 没有信号可验证。")
+            valid = pd.DataFrame(columns=SIGNAL_FIELDS)
+            return (valid, pd.DataFrame(columns=REJECT_COLUMNS)) if with_rejections else valid
 
-            # 2️⃣ 信心过滤
-            if confidence < float(self.min_confidence):
-                print(f"⚠️ 信心不足 {symbol}: {confidence} < {self.min_confidence}")
-                continue
+        n = len(df)
+        raw_symbol = df["symbol"] if "symbol" in df.columns else pd.Series([None] * n, index=df.index)
+        symbol = raw_symbol.astype("string").str.strip().str.upper()
+        action = (df["action"] if "action" in df.columns else pd.Series([""] * n, index=df.index)) \
+            .astype("string").str.strip().str.upper().fillna("")
+        confidence = pd.to_numeric(df["confidence"], errors="coerce").fillna(0.0) if "confidence" in df.columns \
+            else pd.Series(0.0, index=df.index)
+        reason = df["reason"].fillna("") if "reason" in df.columns else pd.Series("", index=df.index)
+        date = df["Date"] if "Date" in df.columns else pd.Series("", index=df.index)
 
-            # 3️⃣ 仓位冲突检查
-            pos = self.positions.get(symbol, 0)
-            if action == "SELL" and pos == 0 and not self.allow_sell_without_position:
-                print(f"⚠️ 无仓位却触发 SELL: {symbol} (已过滤)")
-                continue
+        # 每条信号第一个命中的过滤原因（空字符串表示通过）
+        missing = (symbol.isna() | (symbol == "")).to_numpy(dtype=bool)
+        invalid = ~action.isin(VALID_ACTIONS).to_numpy(dtype=bool)
+        unknown = ~symbol.isin(self.universe).to_numpy(dtype=bool) if self.universe is not None else np.zeros(n, dtype=bool)
+        low = (confidence < float(self.min_confidence)).to_numpy(dtype=bool)
+        if self.allow_sell_without_position:
+            no_pos = np.zeros(n, dtype=bool)
+        else:
+            held = symbol.map(self.positions).fillna(0).to_numpy(dtype=float) > 0
+            no_pos = (action == "SELL").to_numpy(dtype=bool) & ~held
+        hold = (action == "HOLD").to_numpy(dtype=bool)
+        verdict = np.select([missing, invalid, unknown, low, no_pos, hold], REJECT_REASONS[:6], default="")
 
-            # 4️⃣ 忽略 HOLD
-            if action == "HOLD":
-                # HOLD 不会产生交易
-                continue
+        # 同一股票多条通过的信号：保留置信度最高的一条（相同时保留先出现的）
+        passed = np.flatnonzero(verdict == "")
+        if len(passed):
+            order = passed[np.lexsort((passed, -confidence.to_numpy(dtype=float)[passed]))]
+            dup = symbol.iloc[order].duplicated().to_numpy(dtype=bool)
+            verdict[order[dup]] = "duplicate"
 
-            valid_rows.append({
-                "symbol": symbol,
-                "action": action,
-                "confidence": confidence,
-                "reason": reason,
-                "Date": date
-            })
+        ok = verdict == ""
+        df_valid = pd.DataFrame({
+            "symbol": symbol[ok].astype(object),
+            "action": action[ok].astype(object),
+            "confidence": confidence[ok].astype(float),
+            "reason": reason[ok],
+            "Date": date[ok],
+        }).reset_index(drop=True)
+        df_rejected = pd.DataFrame({
+            "symbol": symbol[~ok].astype(object).where(~missing[~ok], None),
+            "action": action[~ok].astype(object),
+            "confidence": confidence[~ok].astype(float),
+            "Date": date[~ok],
+            "reject_reason": verdict[~ok],
+        }).reset_index(drop=True)
+        with self._lock:
+            self._rejected.append(df_rejected)
 
-        df_valid = pd.DataFrame(valid_rows)
+        if len(df_rejected):
+            counts = df_rejected["reject_reason"].value_counts()
+            print("⚠️ 过滤 " + "，".join(f"{k} {v} 条" for k, v in counts.items()))
         print(f"✅ {len(df_valid)} 个信号通过验证")
-        return df_valid
+        return (df_valid, df_rejected) if with_rejections else df_valid
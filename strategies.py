@@ -0,0 +1,243 @@
+# strategies.py
+# 可替换的信号来源。任何策略只要实现 generate_signals(daily_data, positions) / save_signals(df)，
+# 就能直接交给 BacktestController（与 AIAgent 接口相同）。
+#
+#   BaseStrategy        公共部分：验证信号、转换为执行器输入、按需构建价格索引
+#   RuleBasedStrategy   确定性的规则策略（EMA20 / RSI / MACD / 布林带 / VIX），用作对照组和流水线冒烟测试；
+#                       prepare(panel) 时对全部股票、全部交易日一次性向量化计算，之后每天只是查表
+#   SignalMatrixStrategy 按给定的信号矩阵逐日输出（信号带、缓存等），与向量化回测对拍
+#
+#   make_strategy("rules") / make_strategy("llm")   按 config.STRATEGY 创建
+import numpy as np
+import pandas as pd
+from config import (
+    Min_confidence, STRATEGY,
+    RULE_RSI_OVERBOUGHT, RULE_RSI_OVERSOLD, RULE_VIX_MAX,
+)
+from signal_validator import SignalValidator
+from signal_queue import SIGNAL_COLUMNS
+from price_index import PriceIndex
+
+HOLD, BUY, SELL = 0, 1, -1
+ACTION_NAMES = {HOLD: "HOLD", BUY: "BUY", SELL: "SELL"}
+RAW_COLUMNS = ["symbol", "action", "confidence", "reason", "Date"]
+
+# 规则用到的日线列
+RULE_COLUMNS = ["Close", "EMA20", "RSI", "MACD", "MACD_Signal", "BB_Upper", "BB_Lower", "VIX"]
+
+# 原因代码 -> 说明（与模型输出的 reason 字段对应）
+RULE_REASONS = {
+    0: "No clear setup",
+    1: "Close above EMA20 with MACD above signal",
+    2: "Oversold below lower Bollinger band",
+    3: "Close below EMA20 with MACD below signal",
+    4: "RSI overbought",
+    5: "Close above upper Bollinger band",
+    6: "VIX above risk limit",
+}
+
+
+class BaseStrategy:
+    """策略基类：子类实现 _raw_signals(daily_data, today)，返回未验证的信号（列同模型输出）。"""
+
+    def __init__(self, min_confidence=Min_confidence):
+        self.min_confidence = min_confidence
+        # (symbol, date) -> 成交价，回测时由控制器注入
+        self.price_index = None
+
+    def prepare(self, panel):
+        """回测开始前调用一次（可选），可在这里对整个面板做预计算。"""
+
+    def generate_signals(self, daily_data: dict, positions: dict):
+        """
+        daily_data: {symbol: {"daily": {...}, "weekly": {...}, "monthly": {...}}}
+        positions: 当前持仓信息
+        返回通过验证的信号（列 symbol / action / confidence / reason / Date）
+        """
+        if not daily_data:
+            return pd.DataFrame(columns=RAW_COLUMNS)
+        today = self._today(daily_data)
+        raw = self._raw_signals(daily_data, today)
+        validator = SignalValidator(positions, min_confidence=self.min_confidence, universe=daily_data.keys())
+        return validator.validate_signals(raw)
+
+    def _raw_signals(self, daily_data, today):
+        raise NotImplementedError
+
+    @staticmethod
+    def _today(daily_data):
+        today = list(daily_data.values())[0]["daily"]["Date"]
+        return pd.Timestamp(today).strftime("%Y-%m-%d")
+
+    def save_signals(self, df):
+        """把已验证的信号转换为执行器输入（列 SIGNAL_COLUMNS），成交价来自价格索引。"""
+        if df.empty:
+            return pd.DataFrame(columns=SIGNAL_COLUMNS)
+        price_index = self._get_price_index(df["symbol"])
+        symbols = df["symbol"].astype(str).str.upper()
+        return pd.DataFrame({
+            "Symbol": symbols.to_numpy(),
+            "Action": df["action"].astype(str).str.upper().to_numpy(),
+            "Confidence": df["confidence"].astype(float).to_numpy(),
+            "Reason": df["reason"].to_numpy(),
+            "Date": df["Date"].to_numpy(),
+            "Price": [price_index.price(s, d) for s, d in zip(symbols, df["Date"])],
+        }, columns=SIGNAL_COLUMNS)
+
+    def _get_price_index(self, symbols):
+        """回测中由 BacktestController 注入；单独使用时按需从 processed/ 构建一次。"""
+        symbols = {str(s).upper() for s in symbols}
+        if self.price_index is None or any(s not in self.price_index for s in symbols):
+            known = set(self.price_index.symbols) if self.price_index is not None else set()
+            self.price_index = PriceIndex.from_store(sorted(known | symbols))
+        return self.price_index
+
+
+# ---------------------- #
+# 规则策略
+# ---------------------- #
+def evaluate_rules(cols, rsi_overbought=RULE_RSI_OVERBOUGHT, rsi_oversold=RULE_RSI_OVERSOLD, vix_max=RULE_VIX_MAX):
+    """对任意形状的数组（单日的一行或整个 (n_days, n_symbols) 面板）计算规则信号。
+
+    cols: {列名: ndarray}，缺失值为 NaN（缺少指标的位置不会触发信号）。
+    返回 (action, confidence, reason_code)，action 取 BUY=1 / SELL=-1 / HOLD=0。
+    """
+    close, ema = cols["Close"], cols["EMA20"]
+    rsi, macd, signal = cols["RSI"], cols["MACD"], cols["MACD_Signal"]
+    upper, lower, vix = cols["BB_Upper"], cols["BB_Lower"], cols["VIX"]
+
+    with np.errstate(invalid="ignore"):
+        trend_up = close > ema
+        trend_down = close < ema
+        macd_up = macd > signal
+        macd_down = macd < signal
+        overbought = rsi > rsi_overbought
+        oversold = rsi < rsi_oversold
+        above_band = close > upper
+        below_band = close < lower
+        calm = ~(vix > vix_max)          # VIX 缺失时视为正常
+        fearful = vix > vix_max
+
+        # 卖出优先于买入：风险信号出现时不加仓
+        sell_codes = [trend_down & macd_down, overbought, above_band, fearful]
+        buy_codes = [trend_up & macd_up & ~overbought & calm, below_band & oversold & calm]
+        reason = np.select(sell_codes + buy_codes, [3, 4, 5, 6, 1, 2], default=0)
+        action = np.select([reason >= 3, reason >= 1], [SELL, BUY], default=HOLD)
+
+        # 置信度：0.5 起，每多一个同向条件 +0.1，最高 0.95
+        bull_votes = (trend_up.astype(int) + macd_up + (rsi > 50) + below_band + calm)
+        bear_votes = (trend_down.astype(int) + macd_down + overbought + above_band + fearful)
+        votes = np.where(action == BUY, bull_votes, np.where(action == SELL, bear_votes, 0))
+        confidence = np.where(action == HOLD, 0.5, np.minimum(0.5 + 0.1 * votes, 0.95))
+    return action.astype(np.int8), confidence.round(2), reason.astype(np.int8)
+
+
+class RuleBasedStrategy(BaseStrategy):
+    """EMA20 / RSI / MACD / 布林带 / VIX 的确定性规则策略。
+
+    prepare(panel) 后整段回测的信号矩阵一次算好（signal_matrix），generate_signals 只按日期取一行；
+    没有 prepare 时按当天快照现算，结果相同。
+    """
+
+    def __init__(self, min_confidence=Min_confidence, rsi_overbought=RULE_RSI_OVERBOUGHT,
+                 rsi_oversold=RULE_RSI_OVERSOLD, vix_max=RULE_VIX_MAX):
+        super().__init__(min_confidence)
+        self.params = {"rsi_overbought": rsi_overbought, "rsi_oversold": rsi_oversold, "vix_max": vix_max}
+        self.days = []
+        self.symbols = []
+        self._day_index = {}
+        self._sym_index = {}
+        self.actions = None
+        self.confidence = None
+        self.reasons = None
+
+    def prepare(self, panel):
+        """对面板上全部股票、全部交易日一次性计算信号矩阵。"""
+        self.days = list(panel.days)
+        self.symbols = list(panel.symbols)
+        self._day_index = {d: i for i, d in enumerate(self.days)}
+        self._sym_index = {s.upper(): j for j, s in enumerate(self.symbols)}
+        cols = {col: panel.matrix(col) for col in RULE_COLUMNS}
+        self.actions, self.confidence, self.reasons = evaluate_rules(cols, **self.params)
+        # 当天没有日线的位置不出信号
+        missing = np.isnan(cols["Close"])
+        self.actions[missing] = HOLD
+        return self
+
+    def signal_matrix(self):
+        """(days, symbols, actions, confidence)：actions 为 BUY=1 / SELL=-1 / HOLD=0 的 (n_days, n_symbols) 矩阵。"""
+        return self.days, self.symbols, self.actions, self.confidence
+
+    def _raw_signals(self, daily_data, today):
+        symbols = list(daily_data)
+        i = self._day_index.get(pd.Timestamp(today).date()) if self.actions is not None else None
+        cols_idx = [self._sym_index.get(s.upper()) for s in symbols]
+
+        if i is not None and all(j is not None for j in cols_idx):
+            action = self.actions[i, cols_idx]
+            confidence = self.confidence[i, cols_idx]
+            reason = self.reasons[i, cols_idx]
+        else:
+            cols = {
+                col: np.array([_as_float(daily_data[s]["daily"].get(col)) for s in symbols])
+                for col in RULE_COLUMNS
+            }
+            action, confidence, reason = evaluate_rules(cols, **self.params)
+
+        return pd.DataFrame({
+            "symbol": [s.upper() for s in symbols],
+            "action": [ACTION_NAMES[int(a)] for a in action],
+            "confidence": confidence,
+            "reason": [RULE_REASONS[int(r)] for r in reason],
+            "Date": today,
+        }, columns=RAW_COLUMNS)
+
+
+class SignalMatrixStrategy(BaseStrategy):
+    """按预先给定的 (n_days, n_symbols) 信号矩阵逐日输出信号（例如由信号带或规则策略生成），
+    用于让事件驱动回测与向量化回测（vector_backtest.py）跑同一组信号。"""
+
+    def __init__(self, days, symbols, actions, confidence, min_confidence=Min_confidence):
+        super().__init__(min_confidence)
+        self.days = list(days)
+        self.symbols = list(symbols)
+        self.actions = np.asarray(actions, dtype=np.int8)
+        self.confidence = np.asarray(confidence, dtype=float)
+        self._day_index = {d: i for i, d in enumerate(self.days)}
+        self._sym_index = {s.upper(): j for j, s in enumerate(self.symbols)}
+
+    def signal_matrix(self):
+        return self.days, self.symbols, self.actions, self.confidence
+
+    def _raw_signals(self, daily_data, today):
+        i = self._day_index.get(pd.Timestamp(today).date())
+        rows = []
+        for sym in daily_data:
+            j = self._sym_index.get(sym.upper())
+            if i is None or j is None or self.actions[i, j] == HOLD:
+                continue
+            rows.append({
+                "symbol": sym.upper(),
+                "action": ACTION_NAMES[int(self.actions[i, j])],
+                "confidence": float(self.confidence[i, j]),
+                "reason": "signal matrix",
+                "Date": today,
+            })
+        return pd.DataFrame(rows, columns=RAW_COLUMNS)
+
+
+def _as_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def make_strategy(name=STRATEGY, **kwargs):
+    """"llm" -> AIAgent；"rules" -> RuleBasedStrategy。"""
+    if name == "rules":
+        return RuleBasedStrategy(**kwargs)
+    if name == "llm":
+        from ai_agent import AIAgent
+        return AIAgent(**kwargs)
+    raise ValueError(f"未知的策略: {name}，可选 llm / rules")
@@ -0,0 +1,209 @@
+# sweep.py
+# 参数扫描：在录制好的信号带（SIGNAL_TAPE_PATH，模型每天验证前的原始输出）上重放回测，
+# 不重新准备数据、也不调用模型。每组参数在进程池里独立运行，结果汇总成一张表。
+#
+#   python sweep.py --min-confidence 0.5 0.6 0.7 --trade-fee 1 2 --max-allocation 0.1 0.2 0.3 \
+#                   --initial-cash 50000 100000 --workers 8
+#
+# 价格矩阵（收盘价 / 成交价）由主进程写成 .npy，工作进程以只读 np.memmap 方式共享；
+# 信号带在主进程里验证、按天分组一次，工作进程启动时各拿一份。
+# 每个工作进程内部用与回测相同的 PortfolioManager / TradeExecutor，结果与 BacktestController 一致。
+import io
+import os
+import sys
+import json
+import time
+import itertools
+import contextlib
+from datetime import date as _date
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from config import (
+    SYMBOLS, Min_confidence, TRADE_FEE, COMMISSION_RATE, MAX_ALLOCATION, FILL_PRICE,
+    SIGNAL_TAPE_PATH, SWEEP_CACHE_DIR, SWEEP_RESULTS_PATH,
+)
+from price_index import PriceIndex
+from signal_validator import SignalValidator
+from portfolio_manager import PortfolioManager, max_drawdown
+from trade_executor import TradeExecutor
+
+PARAM_NAMES = ["min_confidence", "trade_fee", "max_allocation", "initial_cash"]
+
+
+# ---------------------- #
+# 信号带
+# ---------------------- #
+def load_tape(path=SIGNAL_TAPE_PATH, symbols=None, start=None, end=None):
+    """读取信号带并做一次与参数无关的验证（置信度阈值留给每组参数）。
+
+    返回 {date: DataFrame[Symbol, Action, Confidence]}，同一股票同一天只保留置信度最高的一条。
+    先去重再按阈值过滤，与先过滤再去重结果相同（保留的总是置信度最高的那条）。
+    """
+    tape = pd.read_csv(path)
+    tape["Date"] = pd.to_datetime(tape["Date"], errors="coerce").dt.date
+    tape = tape.dropna(subset=["Date"])
+    if start is not None:
+        tape = tape[tape["Date"] >= pd.Timestamp(start).date()]
+    if end is not None:
+        tape = tape[tape["Date"] <= pd.Timestamp(end).date()]
+
+    by_day = {}
+    validator = SignalValidator({}, min_confidence=0.0, universe=symbols)
+    for day, group in tape.groupby("Date", sort=True):
+        with contextlib.redirect_stdout(io.StringIO()):
+            valid = validator.validate_signals(group)
+        if not valid.empty:
+            by_day[day] = pd.DataFrame({
+                "Symbol": valid["symbol"].to_numpy(),
+                "Action": valid["action"].to_numpy(),
+                "Confidence": valid["confidence"].to_numpy(dtype=float),
+            })
+    return by_day
+
+
+# ---------------------- #
+# 共享价格矩阵
+# ---------------------- #
+def write_shared_prices(price_index, out_dir=SWEEP_CACHE_DIR):
+    """把价格索引写成 .npy + meta.json，供工作进程以只读内存映射方式打开。"""
+    os.makedirs(out_dir, exist_ok=True)
+    np.save(os.path.join(out_dir, "close.npy"), price_index.close_matrix)
+    np.save(os.path.join(out_dir, "fill.npy"), price_index.fill_matrix)
+    meta = {
+        "days": [d.isoformat() for d in price_index.days],
+        "symbols": price_index.symbols,
+        "mode": price_index.mode,
+    }
+    with open(os.path.join(out_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    return out_dir
+
+
+def open_shared_prices(shared_dir=SWEEP_CACHE_DIR):
+    with open(os.path.join(shared_dir, "meta.json"), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    close = np.load(os.path.join(shared_dir, "close.npy"), mmap_mode="r")
+    fill = np.load(os.path.join(shared_dir, "fill.npy"), mmap_mode="r")
+    days = [_date.fromisoformat(d) for d in meta["days"]]
+    return PriceIndex(days, meta["symbols"], close, fill, meta["mode"])
+
+
+# ---------------------- #
+# 工作进程
+# ---------------------- #
+_prices = None
+_tape = None
+_days = None
+
+
+def _init_worker(shared_dir, tape, days):
+    global _prices, _tape, _days
+    _prices = open_shared_prices(shared_dir)
+    _tape = tape
+    _days = days
+    # 执行器和持仓管理器的逐笔打印在扫描中没有意义
+    sys.stdout = open(os.devnull, "w")
+
+
+def simulate(prices, tape, days, min_confidence=Min_confidence, trade_fee=TRADE_FEE,
+             max_allocation=MAX_ALLOCATION, initial_cash=100000, commission_rate=COMMISSION_RATE):
+    """按回测主循环的顺序重放一组参数：更新收盘价 -> 执行当天信号 -> 收盘估值。"""
+    portfolio = PortfolioManager(initial_cash=initial_cash, log_path=None, trade_fee=trade_fee,
+                                 commission_rate=commission_rate, symbols=prices.symbols, n_days=len(days))
+    executor = TradeExecutor(portfolio, min_confidence, price_index=prices, max_allocation=max_allocation)
+
+    for day in days:
+        portfolio.set_date(day)
+        portfolio.update_prices(prices.close_matrix[prices._day_index[day]])
+        batch = tape.get(day)
+        if batch is not None:
+            batch = batch[batch["Confidence"].to_numpy() >= float(min_confidence)]
+            if not batch.empty:
+                executor.run(batch.assign(Price=np.nan, Date=day))
+        portfolio.mark_to_market(date=day)
+
+    equity = portfolio.equity
+    return {
+        "final_nav": float(equity[-1]) if len(equity) else float(initial_cash),
+        "return": float(equity[-1] / initial_cash - 1) if len(equity) else 0.0,
+        "trades": len(portfolio.ledger),
+        "fees": portfolio.total_fees,
+        "max_drawdown": max_drawdown(equity),
+    }
+
+
+def _run_config(params):
+    start = time.perf_counter()
+    result = simulate(_prices, _tape, _days, **params)
+    result["seconds"] = time.perf_counter() - start
+    return {**params, **result}
+
+
+# ---------------------- #
+# 扫描入口
+# ---------------------- #
+def build_grid(min_confidence=None, trade_fee=None, max_allocation=None, initial_cash=None):
+    """参数网格（笛卡尔积），未给出的参数取 config 中的默认值。"""
+    values = [
+        min_confidence or [Min_confidence],
+        trade_fee or [TRADE_FEE],
+        max_allocation or [MAX_ALLOCATION],
+        initial_cash or [100000],
+    ]
+    return [dict(zip(PARAM_NAMES, combo)) for combo in itertools.product(*values)]
+
+
+def run_sweep(grid, symbols=SYMBOLS, tape_path=SIGNAL_TAPE_PATH, start=None, end=None,
+              workers=None, fill_price=FILL_PRICE, shared_dir=SWEEP_CACHE_DIR, output=SWEEP_RESULTS_PATH):
+    t0 = time.perf_counter()
+    tape = load_tape(tape_path, symbols=symbols, start=start, end=end)
+    if not tape:
+        print(f"⚠️ 信号带为空：{tape_path}")
+        return pd.DataFrame()
+
+    prices = PriceIndex.from_store(symbols, mode=fill_price)
+    first, last = min(tape), max(tape)
+    days = [d for d in prices.days if first <= d <= last]
+    write_shared_prices(prices, shared_dir)
+    print(f"📼 信号带 {len(tape)} 天（{first} ~ {last}），{len(prices.symbols)} 只股票，{len(grid)} 组参数")
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(shared_dir, tape, days)) as pool:
+        rows = list(pool.map(_run_config, grid, chunksize=max(1, len(grid) // (workers * 4))))
+
+    results = pd.DataFrame(rows).sort_values("final_nav", ascending=False).reset_index(drop=True)
+    if output:
+        dirpath = os.path.dirname(output)
+        if dirpath:
+            os.makedirs(dirpath, exist_ok=True)
+        results.to_csv(output, index=False)
+        print(f"💾 结果已保存: {output}")
+    print(f"✅ {len(grid)} 组参数完成，用时 {time.perf_counter() - t0:.1f}s（{workers} 个进程）")
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="在信号带上按参数网格并行重放回测")
+    parser.add_argument("--min-confidence", type=float, nargs="+")
+    parser.add_argument("--trade-fee", type=float, nargs="+")
+    parser.add_argument("--max-allocation", type=float, nargs="+")
+    parser.add_argument("--initial-cash", type=float, nargs="+")
+    parser.add_argument("--symbols", nargs="+", default=SYMBOLS)
+    parser.add_argument("--tape", default=SIGNAL_TAPE_PATH)
+    parser.add_argument("--start")
+    parser.add_argument("--end")
+    parser.add_argument("--fill-price", default=FILL_PRICE, choices=["close", "next_open", "vwap"])
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--output", default=SWEEP_RESULTS_PATH)
+    parser.add_argument("--top", type=int, default=10, help="打印前 N 组结果")
+    args = parser.parse_args()
+
+    grid = build_grid(args.min_confidence, args.trade_fee, args.max_allocation, args.initial_cash)
+    results = run_sweep(grid, symbols=args.symbols, tape_path=args.tape, start=args.start, end=args.end,
+                        workers=args.workers, fill_price=args.fill_price, output=args.output)
+    if not results.empty:
+        print(results.head(args.top).to_string(index=False))
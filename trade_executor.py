@@ -3,19 +3,26 @@ import os
 import pandas as pd
 from datetime import datetime
 from portfolio_manager import PortfolioManager
-from config import Min_confidence
+from config import Min_confidence, MAX_ALLOCATION
 from config import Signals_path
+from utils.tracing import span
 
 class TradeExecutor:
-    def __init__(self, portfolio: PortfolioManager, min_confidence=Min_confidence, signals_path=Signals_path):
+    def __init__(self, portfolio: PortfolioManager, min_confidence=Min_confidence, signals_path=Signals_path, price_index=None,
+                 max_allocation=MAX_ALLOCATION):
         self.portfolio = portfolio
         self.min_confidence = min_confidence
+        # 每次买入最多使用的现金比例
+        self.max_allocation = max_allocation
         self.signals_path = signals_path
+        # PriceIndex：有则按 (Symbol, Date) 查成交价，否则用信号里的 Price 列
+        self.price_index = price_index
 
     # --------------------------------------------------------
     # 🔍 读取AI信号
     # --------------------------------------------------------
-    def load_signals(self):
+    def load_signals(self, date=None):
+        """从信号审计文件读取 date 当天（默认今天）的信号；回测中信号由内存直接传入，不走这里。"""
         if not os.path.exists(self.signals_path):
             print(f"⚠️ 找不到信号文件：{self.signals_path}")
             return pd.DataFrame()
@@ -23,26 +30,28 @@ class TradeExecutor:
         df = pd.read_csv(self.signals_path)
         df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
         # df = df[df["Confidence"] >= self.min_confidence]  # 筛选高置信度信号
-        today = datetime.now().date()
-        df = df[df["Date"].dt.date <= today]  # 只执行今天及之前的信号
+        day = pd.Timestamp(date).date() if date is not None else datetime.now().date()
+        df = df[df["Date"].dt.date == day]  # 只执行当天的信号，历史信号不会被重复执行
         return df
 
     # --------------------------------------------------------
     # ⚙️ 执行单条交易
     # --------------------------------------------------------
     def execute_signal(self, symbol, action, price):
-        qty = self._calculate_quantity(symbol, price)
+        with span("trade", symbol=symbol, action=action, price=price) as s:
+            qty = self._calculate_quantity(symbol, price)
+            s.set(qty=qty)
 
-        if qty <= 0:
-            print(f"⚠️ {symbol} 交易数量为 0，跳过。")
-            return
+            if qty <= 0:
+                print(f"⚠️ {symbol} 交易数量为 0，跳过。")
+                return
 
-        if action == "BUY":
-            self.portfolio.buy(symbol, price, qty)
-        elif action == "SELL":
-            self.portfolio.sell(symbol, price, qty)
-        else:
-            print(f"❌ 未知交易动作: {action}")
+            if action == "BUY":
+                s.set(filled=self.portfolio.buy(symbol, price, qty))
+            elif action == "SELL":
+                s.set(filled=self.portfolio.sell(symbol, price, qty))
+            else:
+                print(f"❌ 未知交易动作: {action}")
 
     # --------------------------------------------------------
     # 💰 动态仓位管理
@@ -50,39 +59,46 @@ class TradeExecutor:
     def _calculate_quantity(self, symbol, price):
         """
         简单仓位管理逻辑：
-        - 每次买入不超过总现金的 10%
+        - 每次买入不超过总现金的 max_allocation（默认 20%）
         - 每次卖出全部持仓
         """
         cash = self.portfolio.cash
-        if symbol in self.portfolio.positions:
-            pos = self.portfolio.positions[symbol]
-        else:
-            pos = {"qty": 0, "avg_price": 0}
+        pos_qty = self.portfolio.qty_of(symbol)
 
-        max_allocation = 0.20  # 每次买入最多20%现金
         qty = 0
 
         if cash > 0:
-            qty = int((cash * max_allocation) / price)
+            qty = int((cash * self.max_allocation) / price)
 
         # 如果是卖出信号 -> 卖出全部持仓
-        if pos["qty"] > 0:
-            qty = pos["qty"]
+        if pos_qty > 0:
+            qty = pos_qty
 
         return qty
 
     # --------------------------------------------------------
     # 🚀 执行所有信号
     # --------------------------------------------------------
-    def run(self):
-        df = self.load_signals()
+    def run(self, signals=None, date=None):
+        """执行一批信号。
+
+        signals: 当天已验证的信号（列 Symbol / Action / Price），由回测主循环从内存传入；
+                 为 None 时从信号文件读取 date 当天的信号。
+        """
+        df = signals if signals is not None else self.load_signals(date)
         if df.empty:
             print("⚠️ 无有效交易信号。")
             return
 
         print(f"📈 检测到 {len(df)} 个交易信号，开始执行...")
-        for _, row in df.iterrows():
-            self.execute_signal(row["Symbol"], row["Action"], row["Price"])
+        dates = df["Date"] if "Date" in df.columns else [None] * len(df)
+        for symbol, action, price, day in zip(df["Symbol"], df["Action"], df["Price"], dates):
+            if self.price_index is not None and day is not None and not pd.isna(day):
+                price = self.price_index.price(symbol, day)
+            if price is None or pd.isna(price):
+                print(f"⚠️ {symbol} 缺少成交价格，跳过。")
+                continue
+            self.execute_signal(symbol, action, float(price))
 
         print("\n✅ 所有信号执行完毕！")
         self.portfolio.summary()
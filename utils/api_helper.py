@@ -1,24 +1,25 @@
 # utils/api_helper.py
-import requests
 import json
 import time
 from config import DEEPSEEK_API_KEY, DEEPSEEK_API_URL, AI_MODEL, Model_Temperature, Model_Max_Tokens
 from requests.exceptions import Timeout, RequestException
+from utils.llm_cache import LLMResponseCache
+from utils.http_client import get_http_client
+from utils.tracing import span
 
+_llm_cache = None
 
-def call_deepseek_api(model: str, system_prompt: str, user_prompt: str, timeout: int = 300, retries: int = 3, verbose: bool = False):
-    """调用 DeepSeek API 并返回模型输出。
 
-    Parameters:
-    - model: 模型名称（目前未使用函数参数里的 model，而是使用 config 中的 AI_MODEL）。
-    - system_prompt: 系统提示词
-    - user_prompt: 用户提示词
-    - timeout: 单次请求超时时间（秒）
-    - retries: 重试次数
-    - verbose: 若为 True，打印要发送的 payload 和响应信息到命令行
+def get_llm_cache():
+    """进程内共享的模型响应缓存（按 config.LLM_CACHE_MODE 创建）。"""
+    global _llm_cache
+    if _llm_cache is None:
+        _llm_cache = LLMResponseCache()
+    return _llm_cache
 
-    返回: 成功时返回模型输出字符串；失败时返回字符串 "[]"。
-    """
+
+def _chat_request(system_prompt, user_prompt, stream=False):
+    """返回 (url, headers, payload)。"""
     url = f"{DEEPSEEK_API_URL}/v1/chat/completions"
     headers = {
         "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
@@ -33,77 +34,180 @@ def call_deepseek_api(model: str, system_prompt: str, user_prompt: str, timeout:
         ],
         "temperature": Model_Temperature,
         "max_tokens": Model_Max_Tokens,
-        "stream": False       # ✅ 确保不是流式输出
+        "stream": stream
     }
+    return url, headers, payload
+
+
+def call_deepseek_api(model: str, system_prompt: str, user_prompt: str, timeout: int = 300, retries: int = 3, verbose: bool = False, use_cache: bool = True):
+    """调用 DeepSeek API 并返回模型输出。
+
+    Parameters:
+    - model: 模型名称（目前未使用函数参数里的 model，而是使用 config 中的 AI_MODEL）。
+    - system_prompt: 系统提示词
+    - user_prompt: 用户提示词
+    - timeout: 单次请求超时时间（秒）
+    - retries: 重试次数
+    - verbose: 若为 True，打印要发送的 payload 和响应信息到命令行
+    - use_cache: 若为 True，先查模型响应缓存（相同 model/temperature/max_tokens/prompt 直接返回）
+
+    返回: 成功时返回模型输出字符串；失败时返回字符串 "[]"。
+    replay 缓存模式下未命中会抛出 ReplayCacheMiss。
+    """
+    cache = get_llm_cache() if use_cache else None
+    cache_key = dict(
+        model=AI_MODEL, temperature=Model_Temperature, max_tokens=Model_Max_Tokens,
+        system_prompt=system_prompt, user_prompt=user_prompt,
+    )
+    if cache is not None:
+        cached = cache.get(**cache_key)
+        if cached is not None:
+            print("[API] 命中响应缓存，跳过请求")
+            return cached
+
+    url, headers, payload = _chat_request(system_prompt, user_prompt, stream=False)
 
     # 将 payload 字符串化以便打印（不包含 Authorization）
     payload_str = json.dumps(payload, ensure_ascii=False)
 
-    for attempt in range(1, retries + 1):
+    if verbose:
+        # 打印简洁的信息：URL、payload（不打印完整 API KEY）
+        masked_key = DEEPSEEK_API_KEY[:4] + "..." if DEEPSEEK_API_KEY else "(no-key)"
+        print(f"[API] POST {url}  retries={retries}")
+        print(f"[API] Authorization: Bearer {masked_key}")
+        print("[API] Payload:")
+        print(payload_str)
+
+    # 连接复用、限流、熔断与退避重试都在共享客户端中处理
+    start = time.time()
+    with span("api.request", stream=False, prompt_chars=len(user_prompt)) as s:
+        resp = get_http_client().post(url, retries=retries, headers=headers, data=payload_str.encode('utf-8'), timeout=timeout)
+        s.set(status=resp.status_code if resp is not None else None)
+    elapsed = time.time() - start
+
+    if resp is None:
+        return "[]"
+
+    if verbose:
+        print(f"[API] Response status: {resp.status_code}  elapsed={elapsed:.2f}s")
+
+    if resp.status_code != 200:
+        # 不可重试的错误（鉴权失败、余额不足等）
+        print(f"⚠️ API返回错误 {resp.status_code}: {resp.text}")
+        return "[]"
+
+    try:
+        resp_json = resp.json()
+        # When verbose, print the returned JSON keys and a truncated dump to diagnose empty content cases
+        if verbose:
+            try:
+                import pprint
+                print("[API] Full response JSON (truncated):")
+                pprint.pprint(resp_json)
+            except Exception:
+                print("[API] (unable to pretty-print full JSON)")
+
+        # Persist full response to logs for post-mortem (only when verbose)
         try:
+            import os
+            from datetime import datetime
+            os.makedirs("logs", exist_ok=True)
+            ts = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+            fname = f"logs/api_response_{ts}.json"
+            with open(fname, "w", encoding="utf-8") as f:
+                json.dump(resp_json, f, ensure_ascii=False, indent=2)
+            print(f"[API] Full response saved to: {fname}")
+        except Exception as _:
             if verbose:
-                # 打印简洁的信息：URL、payload（不打印完整 API KEY）和 attempt
-                masked_key = DEEPSEEK_API_KEY[:4] + "..." if DEEPSEEK_API_KEY else "(no-key)"
-                print(f"[API] POST {url}  attempt={attempt}/{retries}")
-                print(f"[API] Authorization: Bearer {masked_key}")
-                print("[API] Payload:")
-                print(payload_str)
+                print("[API] 无法将完整响应写入日志文件：", _)
 
-            start = time.time()
-            resp = requests.post(url, headers=headers, data=payload_str.encode('utf-8'), timeout=timeout)
-            elapsed = time.time() - start
+        # extract content if present
+        message = resp_json.get("choices", [{}])[0].get("message", {})
+        result = message.get("content", "")
+        print("[API] Model output (full):")
+        print(result)  # ✅ 原样打印，不截断
+        if cache is not None and result and result.strip():
+            cache.put(result, **cache_key)
+        return result
+    except Exception as e:
+        print("[API] JSON 解析模型输出失败:", e)
+        return "[]"
 
-            if verbose:
-                print(f"[API] Response status: {resp.status_code}  elapsed={elapsed:.2f}s")
-
-            if resp.status_code == 200:
-                try:
-                    resp_json = resp.json()
-                    # When verbose, print the returned JSON keys and a truncated dump to diagnose empty content cases
-                    if verbose:
-                        try:
-                            import pprint
-                            print("[API] Full response JSON (truncated):")
-                            pprint.pprint(resp_json)
-                        except Exception:
-                            print("[API] (unable to pretty-print full JSON)")
-
-                    # Persist full response to logs for post-mortem (only when verbose)
-                    try:
-                        import os
-                        from datetime import datetime
-                        os.makedirs("logs", exist_ok=True)
-                        ts = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
-                        fname = f"logs/api_response_{ts}.json"
-                        with open(fname, "w", encoding="utf-8") as f:
-                            json.dump(resp_json, f, ensure_ascii=False, indent=2)
-                        print(f"[API] Full response saved to: {fname}")
-                    except Exception as _:
-                        if verbose:
-                            print("[API] 无法将完整响应写入日志文件：", _)
-
-                    # extract content if present
-                    message = resp_json.get("choices", [{}])[0].get("message", {})
-                    result = message.get("content", "")
-                    print("[API] Model output (full):")
-                    print(result)  # ✅ 原样打印，不截断
-                    return result
-                except Exception as e:
-                    print("[API] JSON 解析模型输出失败:", e)
-                    return "[]"
-            else:
-                # 非 200 响应：打印并按重试策略继续
-                print(f"⚠️ API返回错误 {resp.status_code}: {resp.text}")
-        except Timeout:
-            print(f"⚠️ 请求超时 (timeout={timeout}s) on attempt {attempt}/{retries}")
-        except RequestException as e:
-            print(f"⚠️ 请求异常 on attempt {attempt}/{retries}: {e}")
-
-        # 简单退避
-        time.sleep(2 * attempt)
-
-    return "[]"
 
+def call_deepseek_api_stream(model: str, system_prompt: str, user_prompt: str, timeout: int = 300, retries: int = 3, verbose: bool = False, use_cache: bool = True):
+    """流式调用 DeepSeek API（server-sent events），逐段 yield 模型输出的文本增量。
+
+    参数与 call_deepseek_api 相同。
+    - 命中响应缓存时一次性 yield 缓存的完整输出
+    - 只在建立连接阶段重试（由共享客户端处理），开始输出后中断不再重试，避免重复输出
+    - 调用方提前停止迭代（break / close()）会立即关闭连接，被取消的输出不写入缓存
+    失败时不 yield 任何内容。
+    """
+    cache = get_llm_cache() if use_cache else None
+    cache_key = dict(
+        model=AI_MODEL, temperature=Model_Temperature, max_tokens=Model_Max_Tokens,
+        system_prompt=system_prompt, user_prompt=user_prompt,
+    )
+    if cache is not None:
+        cached = cache.get(**cache_key)
+        if cached is not None:
+            print("[API] 命中响应缓存，跳过请求")
+            yield cached
+            return
+
+    url, headers, payload = _chat_request(system_prompt, user_prompt, stream=True)
+    payload_str = json.dumps(payload, ensure_ascii=False)
+
+    if verbose:
+        print(f"[API] POST {url} (stream)  retries={retries}")
+
+    # 只重试建立连接阶段；开始输出后再重试会导致重复内容
+    start = time.time()
+    with span("api.request", stream=True, prompt_chars=len(user_prompt)) as s:
+        resp = get_http_client().post(url, retries=retries, headers=headers, data=payload_str.encode('utf-8'), timeout=timeout, stream=True)
+        s.set(status=resp.status_code if resp is not None else None)
+    if resp is None:
+        return
+    if resp.status_code != 200:
+        print(f"⚠️ API返回错误 {resp.status_code}: {resp.text}")
+        resp.close()
+        return
+
+    received = []
+    try:
+        for raw in resp.iter_lines():
+            # SSE 固定为 UTF-8；按字节读取再解码，不依赖 Content-Type 里的 charset（缺省时 requests 会按 ISO-8859-1 解码）
+            line = raw.decode("utf-8") if raw else ""
+            # SSE: 只处理 "data: ..." 行，空行和注释行（": keep-alive"）跳过
+            if not line or not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            try:
+                chunk = json.loads(data)
+            except ValueError:
+                print(f"⚠️ 无法解析的 SSE 数据: {data[:200]}")
+                continue
+            delta = (chunk.get("choices") or [{}])[0].get("delta") or {}
+            text = delta.get("content")
+            if text:
+                if not received and verbose:
+                    print(f"[API] 首个 token 用时 {time.time() - start:.2f}s")
+                received.append(text)
+                yield text
+    except RequestException as e:
+        # 已经输出过部分内容，不再重试
+        print(f"⚠️ 流式输出中断，返回已收到的部分: {e}")
+        return
+    finally:
+        resp.close()
+
+    result = "".join(received)
+    if verbose:
+        print(f"[API] 流式输出完成 elapsed={time.time() - start:.2f}s chars={len(result)}")
+    if cache is not None and result.strip():
+        cache.put(result, **cache_key)
 
 def ping_deepseek_api(timeout: int = 20, verbose: bool = True):
     """发送一个非常小的请求以确认 API 可达性并测量响应时间。
@@ -137,9 +241,13 @@ def ping_deepseek_api(timeout: int = 20, verbose: bool = True):
             print("[PING] Payload:")
             print(payload_str)
 
+        # 复用连接池，但不重试、不计入熔断（ping 用于诊断）
         start = time.time()
-        resp = requests.post(url, headers=headers, data=payload_str.encode('utf-8'), timeout=timeout)
+        resp = get_http_client().post(url, retries=1, use_breaker=False, label="PING", raise_on_error=True,
+                                      headers=headers, data=payload_str.encode('utf-8'), timeout=timeout)
         elapsed = time.time() - start
+        if resp is None:
+            return {"error": "request failed", "elapsed": elapsed}
 
         if verbose:
             print(f"[PING] status={resp.status_code} elapsed={elapsed:.2f}s")
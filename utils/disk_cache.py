@@ -0,0 +1,148 @@
+# utils/disk_cache.py
+import os
+import json
+import time
+import hashlib
+import threading
+
+
+class DiskCache:
+    """简单的本地磁盘缓存：每个 key 一个 JSON 文件。
+
+    - key 可以是任意可 JSON 序列化的对象（例如 ("news_sentiment", "NVDA")），文件名为其 sha256
+    - 每条记录保存写入时间 fetched_at，由调用方按 TTL 判断是否过期
+    - 条目数超过 max_entries 时按写入时间淘汰最旧的记录，一次删到 max_entries × EVICT_RATIO，
+      条目数在内存中计数（首次写入时扫描一次目录），平时写入不扫描目录
+    """
+
+    EVICT_RATIO = 0.9
+
+    def __init__(self, root, max_entries=None):
+        self.root = root
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._count = None
+        os.makedirs(root, exist_ok=True)
+
+    # ------------------------------------------------------
+    # key -> 文件
+    # ------------------------------------------------------
+    @staticmethod
+    def make_key(key):
+        raw = json.dumps(key, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, digest):
+        return os.path.join(self.root, f"{digest}.json")
+
+    # ------------------------------------------------------
+    # 读写
+    # ------------------------------------------------------
+    def get_entry(self, key):
+        """返回 {"key", "value", "fetched_at"}；不存在或文件损坏时返回 None（不计入命中统计）。"""
+        path = self._path(self.make_key(key))
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def is_fresh(entry, ttl):
+        """ttl 为秒，None 表示永不过期。"""
+        return entry is not None and (ttl is None or time.time() - entry["fetched_at"] <= ttl)
+
+    def get(self, key, ttl=None):
+        """未过期时返回 value，否则返回 None。"""
+        entry = self.get_entry(key)
+        if not self.is_fresh(entry, ttl):
+            self.record_miss()
+            return None
+        self.record_hit()
+        return entry["value"]
+
+    def set(self, key, value, **extra):
+        """写入一条记录，extra 中的字段一并保存（例如原始请求参数）。返回写入的记录。"""
+        entry = {"key": key, "value": value, "fetched_at": time.time()}
+        entry.update(extra)
+        path = self._path(self.make_key(key))
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        if not self.max_entries:
+            os.replace(tmp, path)
+            return entry
+        with self._lock:
+            is_new = not os.path.exists(path)
+            os.replace(tmp, path)
+            if self._count is None:
+                self._count = self._scan_count()
+            elif is_new:
+                self._count += 1
+            over = self._count > self.max_entries
+        if over:
+            # 批量淘汰，避免每次写入都扫描目录
+            self.evict(int(self.max_entries * self.EVICT_RATIO))
+        return entry
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(self.make_key(key)))
+        except OSError:
+            return
+        with self._lock:
+            if self._count is not None:
+                self._count -= 1
+
+    def _scan_count(self):
+        return sum(1 for e in os.scandir(self.root) if e.name.endswith(".json"))
+
+    # ------------------------------------------------------
+    # 淘汰
+    # ------------------------------------------------------
+    def evict(self, max_entries=None, max_age=None):
+        """按条目数和最大年龄（秒）淘汰，返回删除的条目数。"""
+        max_entries = max_entries if max_entries is not None else self.max_entries
+        with self._lock:
+            entries = []
+            for e in os.scandir(self.root):
+                if e.name.endswith(".json"):
+                    try:
+                        entries.append((e.stat().st_mtime, e.path))
+                    except OSError:
+                        continue
+            entries.sort()
+
+            remove = []
+            if max_age is not None:
+                cutoff = time.time() - max_age
+                remove = [p for mtime, p in entries if mtime < cutoff]
+                entries = [(mtime, p) for mtime, p in entries if mtime >= cutoff]
+            if max_entries is not None and len(entries) > max_entries:
+                remove += [p for _, p in entries[: len(entries) - max_entries]]
+                entries = entries[len(entries) - max_entries:]
+
+            for p in remove:
+                try:
+                    os.remove(p)
+                except OSError:
+                    pass
+            self._count = len(entries)
+            return len(remove)
+
+    # ------------------------------------------------------
+    # 统计（多线程调用，计数加锁）
+    # ------------------------------------------------------
+    def record_hit(self):
+        with self._lock:
+            self.hits += 1
+
+    def record_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
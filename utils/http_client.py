@@ -0,0 +1,185 @@
+# utils/http_client.py
+import time
+import random
+import threading
+from email.utils import parsedate_to_datetime
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import Timeout, RequestException
+from config import (
+    HTTP_POOL_SIZE, HTTP_BACKOFF_BASE, HTTP_BACKOFF_MAX,
+    HTTP_RATE_LIMIT, HTTP_RATE_BURST, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT,
+)
+
+# 这些状态码视为暂时性错误：重试，并计入熔断器
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """客户端令牌桶限流：平均每秒 rate 个请求，最多突发 capacity 个。"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """取一个令牌，不够时阻塞等待。返回等待的秒数。"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+class CircuitBreaker:
+    """连续失败 failure_threshold 次后熔断 reset_timeout 秒，期间请求直接失败；
+    超时后放行一个试探请求（half-open），成功则恢复，失败则重新熔断。"""
+
+    def __init__(self, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self._probing:
+                    print(f"🔌 连续失败 {self.failures} 次，熔断 {self.reset_timeout}s")
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+
+def parse_retry_after(value):
+    """Retry-After 可以是秒数或 HTTP 日期，返回秒数（无法解析时返回 None）。"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, base=HTTP_BACKOFF_BASE, cap=HTTP_BACKOFF_MAX):
+    """指数退避 + full jitter：在 [0, min(cap, base * 2^(attempt-1))] 内均匀取值。"""
+    return random.uniform(0, min(cap, base * (2 ** (attempt - 1))))
+
+
+class HTTPClient:
+    """共享的 HTTP 客户端：连接池 keep-alive、限流、熔断、带 jitter 的指数退避重试。"""
+
+    def __init__(self, pool_size=HTTP_POOL_SIZE, rate_limit=HTTP_RATE_LIMIT, burst=HTTP_RATE_BURST,
+                 breaker=None, backoff_base=HTTP_BACKOFF_BASE, backoff_max=HTTP_BACKOFF_MAX):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.limiter = TokenBucket(rate_limit, burst) if rate_limit else None
+        self.breaker = breaker or CircuitBreaker()
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def post(self, url, retries=3, use_breaker=True, label="API", raise_on_error=False, **kwargs):
+        """POST 并按需重试。
+
+        - 200 及不可重试的状态码（如 400/401/402）直接返回 Response，由调用方处理
+        - 429/5xx、超时、连接错误：按 Retry-After 或指数退避重试，最多 retries 次
+        - 熔断期间返回 None；重试耗尽时返回最后一次的错误 Response（连接失败则为 None）
+        - raise_on_error=True 时，重试耗尽且没有任何 Response 时抛出最后一次的 Timeout / RequestException
+        """
+        last = None
+        error = None
+        for attempt in range(1, retries + 1):
+            if use_breaker and not self.breaker.allow():
+                print(f"⚠️ [{label}] 熔断中，跳过请求")
+                return last
+            if self.limiter is not None:
+                self.limiter.acquire()
+
+            if last is not None:
+                last.close()
+                last = None
+            retry_after = None
+            try:
+                resp = self.session.post(url, **kwargs)
+                if resp.status_code not in RETRYABLE_STATUS:
+                    if use_breaker:
+                        self.breaker.record_success()
+                    return resp
+                print(f"⚠️ [{label}] 返回错误 {resp.status_code} on attempt {attempt}/{retries}: {resp.text[:500]}")
+                retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+                last = resp
+            except Timeout as e:
+                print(f"⚠️ [{label}] 请求超时 (timeout={kwargs.get('timeout')}s) on attempt {attempt}/{retries}")
+                error = e
+            except RequestException as e:
+                print(f"⚠️ [{label}] 请求异常 on attempt {attempt}/{retries}: {e}")
+                error = e
+
+            if use_breaker:
+                self.breaker.record_failure()
+                if self.breaker.state == "open":
+                    print(f"⚠️ [{label}] 熔断中，停止重试")
+                    break
+            if attempt < retries:
+                delay = retry_after if retry_after is not None else backoff_delay(attempt, self.backoff_base, self.backoff_max)
+                delay = min(delay, self.backoff_max)
+                print(f"⏳ [{label}] {delay:.1f}s 后重试")
+                time.sleep(delay)
+        if raise_on_error and last is None and error is not None:
+            raise error
+        return last
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_http_client():
+    """进程内共享的 HTTPClient。"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HTTPClient()
+    return _client
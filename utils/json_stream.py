@@ -0,0 +1,72 @@
+# utils/json_stream.py
+import json
+
+
+class JSONArrayStreamParser:
+    """增量解析模型流式输出的 JSON 数组，每当一个顶层对象闭合就把它解析出来。
+
+    输入可以按任意位置切分，例如:
+        p = JSONArrayStreamParser()
+        p.feed('[{"symbol": "NV')      -> []
+        p.feed('DA", "action": "BUY"}, {')  -> [{"symbol": "NVDA", "action": "BUY"}]
+
+    - 第一个 '[' 之前的内容（例如 ```json 代码块标记）被忽略
+    - 只输出数组元素中的对象；解析失败的对象记入 errors 并跳过
+    - 数组闭合后 done 为 True，之后的内容全部忽略
+    """
+
+    def __init__(self):
+        self.started = False
+        self.done = False
+        self.errors = []
+        self._depth = 0          # 相对数组内部的嵌套深度，0 表示处于数组元素之间
+        self._in_string = False
+        self._escape = False
+        self._buf = []           # 当前对象的字符
+
+    def feed(self, text):
+        objects = []
+        for ch in text:
+            if self.done:
+                break
+            if not self.started:
+                if ch == "[":
+                    self.started = True
+                continue
+
+            if self._depth > 0:
+                self._buf.append(ch)
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+
+            if ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                if self._depth == 0:
+                    self._buf = [ch]
+                self._depth += 1
+            elif ch in "}]":
+                if self._depth == 0:
+                    # 顶层数组结束
+                    if ch == "]":
+                        self.done = True
+                    continue
+                self._depth -= 1
+                if self._depth == 0:
+                    raw = "".join(self._buf)
+                    self._buf = []
+                    try:
+                        obj = json.loads(raw)
+                    except ValueError as e:
+                        self.errors.append((raw, str(e)))
+                        continue
+                    if isinstance(obj, dict):
+                        objects.append(obj)
+        return objects
@@ -0,0 +1,62 @@
+# utils/llm_cache.py
+from utils.disk_cache import DiskCache
+from config import LLM_CACHE_DIR, LLM_CACHE_MODE, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_MAX_AGE
+
+CACHE_MODES = ("off", "readwrite", "replay")
+
+
+class ReplayCacheMiss(LookupError):
+    """replay 模式下缓存未命中（不允许调用真实 API）。"""
+
+
+class LLMResponseCache:
+    """按请求内容寻址的模型响应缓存。
+
+    key = (model, temperature, max_tokens, system_prompt, user_prompt) 的 sha256，
+    prompt 完全相同的请求直接返回上次的输出。
+
+    mode:
+    - "off":       不读不写
+    - "readwrite": 命中直接返回，未命中调用 API 后写入
+    - "replay":    只读；未命中抛出 ReplayCacheMiss，用于重放历史回测
+    """
+
+    def __init__(self, root=LLM_CACHE_DIR, mode=LLM_CACHE_MODE, max_entries=LLM_CACHE_MAX_ENTRIES, max_age=LLM_CACHE_MAX_AGE):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"未知的缓存模式: {mode}，可选 {CACHE_MODES}")
+        self.mode = mode
+        self.max_age = max_age
+        self.cache = DiskCache(root, max_entries=max_entries) if mode != "off" else None
+        # 启动时清理过期条目（replay 模式下保留全部，避免历史回测无法重放）
+        if self.cache is not None and mode != "replay" and max_age is not None:
+            self.cache.evict(max_age=max_age)
+
+    @property
+    def enabled(self):
+        return self.cache is not None
+
+    @staticmethod
+    def make_key(model, temperature, max_tokens, system_prompt, user_prompt):
+        return [model, temperature, max_tokens, system_prompt, user_prompt]
+
+    def get(self, model, temperature, max_tokens, system_prompt, user_prompt):
+        """返回缓存的模型输出；未命中返回 None（replay 模式下抛出 ReplayCacheMiss）。"""
+        if not self.enabled:
+            return None
+        key = self.make_key(model, temperature, max_tokens, system_prompt, user_prompt)
+        ttl = None if self.mode == "replay" else self.max_age
+        value = self.cache.get(key, ttl=ttl)
+        if value is None and self.mode == "replay":
+            raise ReplayCacheMiss(f"LLM 缓存未命中 (key={DiskCache.make_key(key)[:12]})")
+        return value
+
+    def put(self, response, model, temperature, max_tokens, system_prompt, user_prompt):
+        if not self.enabled or self.mode == "replay":
+            return
+        key = self.make_key(model, temperature, max_tokens, system_prompt, user_prompt)
+        self.cache.set(key, response)
+
+    def stats(self):
+        if not self.enabled:
+            return {"mode": self.mode, "hits": 0, "misses": 0}
+        return dict(self.cache.stats(), mode=self.mode)
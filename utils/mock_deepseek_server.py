@@ -0,0 +1,292 @@
+# utils/mock_deepseek_server.py
+# 本地模拟 DeepSeek /v1/chat/completions 接口（普通 + 流式），用于离线压测客户端、重试逻辑和回测吞吐。
+#
+#   python -m utils.mock_deepseek_server --port 8765 --latency lognormal:-0.5,0.4 --error-rate 0.05
+#   DEEPSEEK_API_URL=http://127.0.0.1:8765 python main.py
+#
+# 延迟分布写法：
+#   fixed:0.5            固定 0.5 秒
+#   uniform:0.2,1.0      [0.2, 1.0] 均匀分布
+#   normal:0.5,0.1       正态分布（截断到 >= 0）
+#   lognormal:-0.5,0.4   对数正态分布，参数为 ln(秒) 的均值和标准差
+#
+# 信号由 (seed, 日期, 股票) 决定：同一个 prompt 多次请求得到相同的输出。
+import re
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+ACTIONS = ["BUY", "SELL", "HOLD"]
+REASONS = {
+    "BUY": ["RSI recovering from oversold, MACD turning positive", "Price reclaimed EMA20 with rising volume"],
+    "SELL": ["RSI overbought on daily and weekly", "MACD histogram rolling over below signal line"],
+    "HOLD": ["Trend intact but momentum flattening", "Mixed signals across timeframes"],
+}
+
+
+def parse_latency(spec):
+    """把延迟分布字符串解析成采样函数 sample(rng) -> 秒。"""
+    if spec is None or spec == "":
+        return lambda rng: 0.0
+    if isinstance(spec, (int, float)):
+        return lambda rng: float(spec)
+    kind, _, args = str(spec).partition(":")
+    params = [float(x) for x in args.split(",") if x.strip()]
+    if kind == "fixed":
+        return lambda rng: params[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(params[0], params[1])
+    if kind == "normal":
+        return lambda rng: max(0.0, rng.gauss(params[0], params[1]))
+    if kind == "lognormal":
+        return lambda rng: rng.lognormvariate(params[0], params[1])
+    raise ValueError(f"未知的延迟分布: {spec}")
+
+
+# ------------------------------ #
+# 从 prompt 中解析日期和股票
+# ------------------------------ #
+def extract_date(user_prompt):
+    m = re.search(r"Today is ([^\s.]+)", user_prompt)
+    return m.group(1) if m else ""
+
+
+def extract_symbols(user_prompt):
+    """支持 compact 表格格式（[daily] 表的第一列）和 JSON 格式（行情对象的顶层 key）。"""
+    lines = user_prompt.splitlines()
+    for i, line in enumerate(lines):
+        if line.strip() == "[daily]":
+            symbols = []
+            for row in lines[i + 2:]:
+                if not row.strip() or row.startswith("["):
+                    break
+                symbols.append(row.split(",", 1)[0].strip())
+            return symbols
+
+    start = user_prompt.find("{")
+    end = user_prompt.find("Current positions")
+    if start != -1 and end != -1:
+        try:
+            data = json.loads(user_prompt[start:user_prompt.rfind("}", start, end) + 1])
+            return [str(sym).upper() for sym in data]
+        except ValueError:
+            pass
+    return []
+
+
+def make_signals(symbols, date, seed=0):
+    signals = []
+    for sym in symbols:
+        digest = hashlib.sha256(f"{seed}|{date}|{sym}".encode("utf-8")).digest()
+        rng = random.Random(digest)
+        action = rng.choice(ACTIONS)
+        signals.append({
+            "symbol": sym,
+            "action": action,
+            "confidence": round(rng.uniform(0.4, 0.95), 2),
+            "reason": rng.choice(REASONS[action]),
+        })
+    return signals
+
+
+# ------------------------------ #
+# 服务
+# ------------------------------ #
+class MockDeepSeekServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), latency=None, chunk_latency=None, chunk_size=16,
+                 error_rate=0.0, error_status=(429, 500, 503), retry_after=1, timeout_rate=0.0,
+                 timeout_seconds=600, seed=0):
+        """
+        latency:        首字节前的延迟分布（见文件头）
+        chunk_latency:  流式输出时每个分片之间的延迟分布
+        chunk_size:     流式输出每个分片的字符数
+        error_rate:     按该概率返回 error_status 中随机一个状态码（429/503 带 Retry-After）
+        timeout_rate:   按该概率挂起 timeout_seconds 秒后再断开，用于触发客户端超时
+        seed:           信号生成和错误注入的随机种子
+        """
+        super().__init__(address, _Handler)
+        self.latency = parse_latency(latency)
+        self.chunk_latency = parse_latency(chunk_latency)
+        self.chunk_size = max(1, int(chunk_size))
+        self.error_rate = error_rate
+        self.error_status = tuple(error_status)
+        self.retry_after = retry_after
+        self.timeout_rate = timeout_rate
+        self.timeout_seconds = timeout_seconds
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.stats = {"requests": 0, "errors": 0, "timeouts": 0, "streams": 0}
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def draw(self):
+        """抽取本次请求的 (故障类型, 延迟)，加锁保证固定种子下结果可复现。"""
+        with self._lock:
+            self.stats["requests"] += 1
+            roll = self.rng.random()
+            delay = self.latency(self.rng)
+            if roll < self.timeout_rate:
+                self.stats["timeouts"] += 1
+                return "timeout", delay
+            if roll < self.timeout_rate + self.error_rate:
+                self.stats["errors"] += 1
+                return self.rng.choice(self.error_status), delay
+            return None, delay
+
+    def chunk_delay(self):
+        with self._lock:
+            return self.chunk_latency(self.rng)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, obj, headers=None):
+        body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, str(v))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.path.rstrip("/") not in ("/v1/chat/completions", "/chat/completions"):
+            self._send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+            return
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": {"message": "invalid JSON body"}})
+            return
+
+        fault, delay = server.draw()
+        if fault == "timeout":
+            time.sleep(server.timeout_seconds)
+            self.close_connection = True
+            return
+        time.sleep(delay)
+        if fault is not None:
+            headers = {"Retry-After": server.retry_after} if fault in (429, 503) else None
+            self._send_json(fault, {"error": {"message": f"injected error {fault}"}}, headers)
+            return
+
+        messages = payload.get("messages") or []
+        user_prompt = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+        system_prompt = next((m.get("content", "") for m in messages if m.get("role") == "system"), "")
+        if user_prompt == "ping":
+            content = "pong"
+        else:
+            signals = make_signals(extract_symbols(user_prompt), extract_date(user_prompt), server.seed)
+            content = json.dumps(signals, ensure_ascii=False)
+
+        model = payload.get("model", "deepseek-chat")
+        created = int(time.time())
+        usage = {
+            "prompt_tokens": (len(system_prompt) + len(user_prompt)) // 4,
+            "completion_tokens": len(content) // 4,
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        if payload.get("stream"):
+            self._stream(content, model, created)
+            return
+
+        self._send_json(200, {
+            "id": f"mock-{created}",
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": usage,
+        })
+
+    def _stream(self, content, model, created):
+        server = self.server
+        with server._lock:
+            server.stats["streams"] += 1
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def event(delta, finish_reason=None):
+            chunk = {
+                "id": f"mock-{created}",
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            self.wfile.write(b"data: " + json.dumps(chunk, ensure_ascii=False).encode("utf-8") + b"\n\n")
+            self.wfile.flush()
+
+        try:
+            event({"role": "assistant", "content": ""})
+            for i in range(0, len(content), server.chunk_size):
+                time.sleep(server.chunk_delay())
+                event({"content": content[i:i + server.chunk_size]})
+            event({}, "stop")
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端提前取消
+            pass
+
+
+def start_mock_server(host="127.0.0.1", port=0, **kwargs):
+    """在后台线程启动模拟服务，返回 server（server.url 为根地址，用完调用 server.shutdown()）。"""
+    server = MockDeepSeekServer((host, port), **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地模拟 DeepSeek chat completions 接口")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", default="fixed:0", help="首字节延迟分布，例如 lognormal:-0.5,0.4")
+    parser.add_argument("--chunk-latency", default="fixed:0", help="流式分片间隔分布")
+    parser.add_argument("--chunk-size", type=int, default=16)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--timeout-rate", type=float, default=0.0)
+    parser.add_argument("--timeout-seconds", type=float, default=600)
+    parser.add_argument("--retry-after", type=float, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = MockDeepSeekServer(
+        (args.host, args.port),
+        latency=args.latency,
+        chunk_latency=args.chunk_latency,
+        chunk_size=args.chunk_size,
+        error_rate=args.error_rate,
+        timeout_rate=args.timeout_rate,
+        timeout_seconds=args.timeout_seconds,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+    print(f"🧪 模拟 DeepSeek 服务已启动: {server.url}/v1/chat/completions")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 已停止")
+        print(server.stats)
@@ -0,0 +1,245 @@
+# utils/tracing.py
+# 轻量级链路追踪：用 span 包住各阶段和子操作，耗时与属性写入 JSONL，可导出为 Chrome trace 格式
+# （chrome://tracing 或 https://ui.perfetto.dev 打开）。
+#
+#   from utils.tracing import span
+#   with span("agent.api_call", symbols=4) as s:
+#       ...
+#       s.set(status=200)
+#
+#   python -m utils.tracing logs/trace.jsonl logs/trace.json    # 导出 Chrome trace
+#
+# 每条记录：{"name", "span_id", "parent_id", "run_id", "start", "dur", "pid", "tid", "attrs"}，
+# start 为 Unix 时间（秒），dur 为秒。父子关系用 contextvars 维护，asyncio.to_thread 中的 span 也能挂到调用方下面。
+import os
+import sys
+import json
+import time
+import uuid
+import atexit
+import threading
+import contextvars
+import functools
+from contextlib import contextmanager
+from config import TRACE_ENABLED, TRACE_PATH, TRACE_FLUSH_EVERY
+
+_current = contextvars.ContextVar("trace_span", default=None)
+_ids = iter(range(1, sys.maxsize))
+_ids_lock = threading.Lock()
+
+
+def _next_id():
+    with _ids_lock:
+        return next(_ids)
+
+
+class Span:
+    __slots__ = ("name", "span_id", "parent_id", "start", "dur", "attrs", "_t0")
+
+    def __init__(self, name, parent_id, attrs):
+        self.name = name
+        self.span_id = _next_id()
+        self.parent_id = parent_id
+        self.attrs = attrs
+        self.start = time.time()
+        self.dur = None
+        self._t0 = time.perf_counter()
+
+    def set(self, **attrs):
+        """补充属性（例如请求完成后的状态码）。"""
+        self.attrs.update(attrs)
+
+
+class _NullSpan:
+    """关闭追踪时返回，set() 什么也不做。"""
+
+    def set(self, **attrs):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class TraceWriter:
+    """按 JSONL 追加写入 span 记录；缓冲 flush_every 条后落盘，进程退出时自动 flush。"""
+
+    def __init__(self, path=TRACE_PATH, flush_every=TRACE_FLUSH_EVERY):
+        # 创建时就转成绝对路径，避免运行中切换工作目录后写到别处
+        self.path = os.path.abspath(path)
+        self.flush_every = flush_every
+        self.run_id = uuid.uuid4().hex[:12]
+        self._buf = []
+        self._lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def write(self, record):
+        record["run_id"] = self.run_id
+        with self._lock:
+            self._buf.append(record)
+            if len(self._buf) >= self.flush_every:
+                self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._buf:
+            return
+        dirpath = os.path.dirname(self.path)
+        if dirpath:
+            os.makedirs(dirpath, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            for record in self._buf:
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        self._buf = []
+
+
+_writer = None
+_enabled = TRACE_ENABLED
+
+
+def get_writer():
+    global _writer
+    if _writer is None:
+        _writer = TraceWriter()
+    return _writer
+
+
+def configure(enabled=None, path=None, flush_every=None):
+    """运行时修改追踪设置（例如基准测试中关闭追踪或改写到临时目录）。"""
+    global _enabled, _writer
+    if enabled is not None:
+        _enabled = enabled
+    if path is not None or flush_every is not None:
+        if _writer is not None:
+            _writer.flush()
+        _writer = TraceWriter(path or TRACE_PATH, flush_every or TRACE_FLUSH_EVERY)
+
+
+def flush():
+    if _writer is not None:
+        _writer.flush()
+
+
+@contextmanager
+def span(name, **attrs):
+    """记录一段操作的耗时；异常会记入 attrs["error"] 并继续抛出。"""
+    if not _enabled:
+        yield _NULL_SPAN
+        return
+
+    parent = _current.get()
+    s = Span(name, parent.span_id if parent is not None else None, attrs)
+    token = _current.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.attrs["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        s.dur = time.perf_counter() - s._t0
+        _current.reset(token)
+        get_writer().write({
+            "name": s.name,
+            "span_id": s.span_id,
+            "parent_id": s.parent_id,
+            "start": s.start,
+            "dur": s.dur,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "attrs": s.attrs,
+        })
+
+
+def traced(name=None, **attrs):
+    """装饰器版本：@traced("preprocess.period")。"""
+    def decorator(func):
+        label = name or f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(label, **attrs):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# ------------------------------ #
+# 导出
+# ------------------------------ #
+def read_spans(path=TRACE_PATH, run_id=None):
+    spans = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if run_id is None or record.get("run_id") == run_id:
+                spans.append(record)
+    return spans
+
+
+def to_chrome_trace(spans):
+    """转成 Chrome trace-event 格式（complete 事件 "ph": "X"，时间单位微秒）。"""
+    events = []
+    for s in spans:
+        args = dict(s.get("attrs") or {})
+        args.update(span_id=s["span_id"], parent_id=s.get("parent_id"), run_id=s.get("run_id"))
+        events.append({
+            "name": s["name"],
+            "cat": s["name"].split(".", 1)[0],
+            "ph": "X",
+            "ts": s["start"] * 1e6,
+            "dur": s["dur"] * 1e6,
+            "pid": s["pid"],
+            "tid": s["tid"],
+            "args": args,
+        })
+    events.sort(key=lambda e: e["ts"])
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def export_chrome_trace(jsonl_path=TRACE_PATH, out_path=None, run_id=None):
+    """把 JSONL 导出为 Chrome trace JSON，返回输出路径。run_id 为 "last" 时只导出最后一次运行。"""
+    spans = read_spans(jsonl_path)
+    if run_id == "last" and spans:
+        run_id = spans[-1].get("run_id")
+    if run_id is not None:
+        spans = [s for s in spans if s.get("run_id") == run_id]
+    out_path = out_path or os.path.splitext(jsonl_path)[0] + ".json"
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(to_chrome_trace(spans), f, ensure_ascii=False, default=str)
+    return out_path
+
+
+def summarize(spans):
+    """按 span 名称汇总：{name: {"count", "total", "max"}}，total/max 为秒。"""
+    out = {}
+    for s in spans:
+        agg = out.setdefault(s["name"], {"count": 0, "total": 0.0, "max": 0.0})
+        agg["count"] += 1
+        agg["total"] += s["dur"]
+        agg["max"] = max(agg["max"], s["dur"])
+    return out
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="把 trace JSONL 导出为 Chrome trace 格式并打印耗时汇总")
+    parser.add_argument("jsonl", nargs="?", default=TRACE_PATH)
+    parser.add_argument("output", nargs="?")
+    parser.add_argument("--run", default="last", help="只导出某次运行的 run_id；all 表示全部")
+    args = parser.parse_args()
+
+    run_id = None if args.run == "all" else args.run
+    out = export_chrome_trace(args.jsonl, args.output, run_id=run_id)
+    spans = read_spans(args.jsonl)
+    if run_id == "last" and spans:
+        run_id = spans[-1].get("run_id")
+    spans = [s for s in spans if run_id is None or s.get("run_id") == run_id]
+    print(f"✅ 已导出 {len(spans)} 个 span -> {out}")
+    for name, agg in sorted(summarize(spans).items(), key=lambda kv: -kv[1]["total"]):
+        print(f"  {name:<28} x{agg['count']:<6} 合计 {agg['total']:9.3f}s  最长 {agg['max']:8.3f}s")
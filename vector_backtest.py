@@ -0,0 +1,231 @@
+# vector_backtest.py
+# 向量化回测：信号已经确定（规则策略、信号带、缓存）时，不需要逐日快照、写 CSV、调用执行器。
+# 输入 (n_days, n_symbols) 的信号矩阵（BUY=1 / SELL=-1 / HOLD=0）和价格索引，
+# 直接在数组上推进持仓、现金、手续费和净值曲线。
+#
+# 仓位与手续费规则与事件驱动回测完全一致（TradeExecutor._calculate_quantity + PortfolioManager）：
+#   - 买入数量 = int(现金 × max_allocation / 价格)；已有持仓时无论买卖都按持仓数量下单
+#   - 每笔费用 = trade_fee + commission_rate × 成交金额，成交时扣除；买入需现金覆盖成本和费用
+#   - 同一天的信号按股票列顺序依次成交（后面的买单看到的是前面成交后的现金）
+#   - 每天收盘按最近已知收盘价估值（还没有收盘价的股票按成本价）
+# 现金在同一天内逐笔变化，所以只有当天有效信号按顺序处理，其余（筛选、估值、净值）都是数组运算。
+#
+#   python vector_backtest.py --symbols tssi bbai --start 2025-06-01 --check
+#   python vector_backtest.py --tape logs/signal_tape.csv --check
+import io
+import time
+import contextlib
+import numpy as np
+import pandas as pd
+from config import SYMBOLS, Min_confidence, TRADE_FEE, COMMISSION_RATE, MAX_ALLOCATION
+from strategies import HOLD, BUY, SELL, RuleBasedStrategy, SignalMatrixStrategy
+from portfolio_manager import PortfolioManager, max_drawdown
+from trade_executor import TradeExecutor
+
+
+def align_prices(prices, days, symbols):
+    """从价格索引中取出与 (days, symbols) 对齐的成交价 / 收盘价矩阵，缺失为 NaN。"""
+    rows = np.array([prices._day_index.get(pd.Timestamp(d).date(), -1) for d in days])
+    cols = np.array([prices._sym_index.get(s.upper(), -1) for s in symbols])
+    fill = np.full((len(days), len(symbols)), np.nan)
+    close = np.full((len(days), len(symbols)), np.nan)
+    ok_r, ok_c = rows >= 0, cols >= 0
+    grid = np.ix_(np.flatnonzero(ok_r), np.flatnonzero(ok_c))
+    fill[grid] = prices.fill_matrix[np.ix_(rows[ok_r], cols[ok_c])]
+    close[grid] = prices.close_matrix[np.ix_(rows[ok_r], cols[ok_c])]
+    return fill, close
+
+
+def run_vectorized(days, symbols, actions, confidence, prices, min_confidence=Min_confidence,
+                   trade_fee=TRADE_FEE, commission_rate=COMMISSION_RATE, max_allocation=MAX_ALLOCATION,
+                   initial_cash=100000):
+    """
+    days / symbols: 信号矩阵的行 / 列；actions: BUY=1 / SELL=-1 / HOLD=0；confidence: 同形状的置信度
+    prices: PriceIndex（成交价口径取决于它的 mode）
+    返回 {"equity", "cash", "qty", "avg_price", "trades", "fees", "final_nav", "max_drawdown"}
+    """
+    actions = np.asarray(actions)
+    confidence = np.asarray(confidence, dtype=float)
+    fill, close = align_prices(prices, days, symbols)
+    n_days, n_syms = actions.shape
+
+    # 估值价：最近一次已知收盘价（向下填充）
+    marks = pd.DataFrame(close).ffill().to_numpy()
+    # 可成交的信号：有动作、置信度达标、当天有日线、有成交价
+    with np.errstate(invalid="ignore"):
+        active = (actions != HOLD) & (confidence >= float(min_confidence)) & ~np.isnan(close) & ~np.isnan(fill)
+
+    qty = np.zeros(n_syms, dtype=np.int64)
+    avg_price = np.zeros(n_syms)
+    cash = initial_cash
+    equity = np.empty(n_days)
+    cash_curve = np.empty(n_days)
+    trades = 0
+    fees = 0.0
+
+    for i in range(n_days):
+        for j in np.flatnonzero(active[i]):
+            price = float(fill[i, j])
+            q = int((cash * max_allocation) / price) if cash > 0 else 0
+            if qty[j] > 0:
+                q = int(qty[j])
+            if q <= 0:
+                continue
+            fee = trade_fee + commission_rate * price * q
+            if actions[i, j] == BUY:
+                cost = price * q
+                if cost + fee > cash:
+                    continue
+                new_qty = qty[j] + q
+                avg_price[j] = (avg_price[j] * qty[j] + price * q) / new_qty
+                qty[j] = new_qty
+                cash -= cost + fee
+            else:
+                if qty[j] <= 0 or qty[j] < q:
+                    continue
+                qty[j] -= q
+                cash += price * q - fee
+                if qty[j] == 0:
+                    avg_price[j] = 0.0
+            trades += 1
+            fees += fee
+
+        mark = np.where(np.isnan(marks[i]), avg_price, marks[i])
+        equity[i] = cash + float(qty @ mark)
+        cash_curve[i] = cash
+
+    return {
+        "equity": equity,
+        "cash": cash_curve,
+        "qty": qty,
+        "avg_price": avg_price,
+        "trades": trades,
+        "fees": fees,
+        "final_nav": float(equity[-1]) if n_days else float(initial_cash),
+        "max_drawdown": max_drawdown(equity),
+    }
+
+
+# ---------------------- #
+# 与事件驱动回测对拍
+# ---------------------- #
+def run_event_driven(strategy, symbols, start_date=None, end_date=None, min_confidence=Min_confidence,
+                     trade_fee=TRADE_FEE, commission_rate=COMMISSION_RATE, max_allocation=MAX_ALLOCATION,
+                     initial_cash=100000):
+    """用 BacktestController 跑同一策略（不写日志），返回控制器。"""
+    from main import BacktestController
+
+    strategy.min_confidence = min_confidence
+    bt = BacktestController(start_date=start_date, end_date=end_date, agent=strategy, symbols=symbols)
+    bt.portfolio = PortfolioManager(initial_cash=initial_cash, log_path=None, trade_fee=trade_fee,
+                                    commission_rate=commission_rate)
+    bt.executor = TradeExecutor(bt.portfolio, min_confidence, max_allocation=max_allocation)
+    with contextlib.redirect_stdout(io.StringIO()):
+        bt.run(refresh_data=False)
+    return bt
+
+
+def cross_check(strategy, symbols, start_date=None, end_date=None, rtol=1e-9, **params):
+    """事件驱动回测与向量化回测跑同一组信号，净值曲线、成交笔数、手续费不一致时抛出 AssertionError。
+
+    strategy 需要提供 signal_matrix()（RuleBasedStrategy / SignalMatrixStrategy），
+    信号矩阵在事件驱动回测的 prepare(panel) 中生成，两边用同一个价格索引。
+    """
+    t0 = time.perf_counter()
+    bt = run_event_driven(strategy, symbols, start_date, end_date, **params)
+    t_event = time.perf_counter() - t0
+
+    days, syms, actions, confidence = strategy.signal_matrix()
+    t0 = time.perf_counter()
+    result = run_vectorized(days, syms, actions, confidence, bt.price_index, **params)
+    t_vector = time.perf_counter() - t0
+
+    event_equity = bt.portfolio.equity
+    assert len(event_equity) == len(result["equity"]), \
+        f"交易日数不一致：事件驱动 {len(event_equity)}，向量化 {len(result['equity'])}"
+    assert len(bt.portfolio.ledger) == result["trades"], \
+        f"成交笔数不一致：事件驱动 {len(bt.portfolio.ledger)}，向量化 {result['trades']}"
+    np.testing.assert_allclose(result["equity"], event_equity, rtol=rtol, err_msg="净值曲线不一致")
+    np.testing.assert_allclose(result["fees"], bt.portfolio.total_fees, rtol=rtol, err_msg="手续费不一致")
+
+    print(f"✅ 对拍通过：{len(days)} 天 × {len(syms)} 只股票，{result['trades']} 笔成交，"
+          f"期末净值 {result['final_nav']:.2f}")
+    print(f"⏱️ 事件驱动 {t_event:.3f}s，向量化 {t_vector:.3f}s")
+    return result
+
+
+# ---------------------- #
+# 信号矩阵来源
+# ---------------------- #
+def load_panel(symbols, start_date=None, end_date=None):
+    """读取 processed/ 数据，返回 (MarketPanel, PriceIndex)，交易日与 BacktestController 相同。"""
+    from main import BacktestController
+    from market_panel import MarketPanel
+    from price_index import PriceIndex
+
+    bt = BacktestController(start_date=start_date, end_date=end_date, agent=RuleBasedStrategy(), symbols=symbols)
+    all_data = bt.load_all_data()
+    days = bt.get_trading_days({sym: d["daily"] for sym, d in all_data.items()})
+    prices = PriceIndex.from_frames({sym: d["daily"] for sym, d in all_data.items()})
+    return MarketPanel(all_data, days), prices
+
+
+def tape_matrix(tape, days, symbols):
+    """sweep.load_tape 的结果 {date: DataFrame[Symbol, Action, Confidence]} -> (actions, confidence) 矩阵。"""
+    actions = np.zeros((len(days), len(symbols)), dtype=np.int8)
+    confidence = np.zeros((len(days), len(symbols)))
+    sym_index = {s.upper(): j for j, s in enumerate(symbols)}
+    codes = {"BUY": BUY, "SELL": SELL}
+    for i, day in enumerate(days):
+        batch = tape.get(day)
+        if batch is None:
+            continue
+        for sym, action, conf in zip(batch["Symbol"], batch["Action"], batch["Confidence"]):
+            j = sym_index.get(sym)
+            if j is not None and action in codes:
+                actions[i, j] = codes[action]
+                confidence[i, j] = conf
+    return actions, confidence
+
+
+def load_strategy(symbols, start_date=None, end_date=None, tape_path=None):
+    """规则策略（默认）或信号带回放策略，以及对应的价格索引。"""
+    panel, prices = load_panel(symbols, start_date, end_date)
+    if tape_path:
+        from sweep import load_tape
+        actions, confidence = tape_matrix(load_tape(tape_path, symbols=symbols), panel.days, panel.symbols)
+        return SignalMatrixStrategy(panel.days, panel.symbols, actions, confidence), prices
+    return RuleBasedStrategy().prepare(panel), prices
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="规则策略 / 信号带的向量化回测（--check 时与事件驱动回测对拍）")
+    parser.add_argument("--symbols", nargs="+", default=SYMBOLS)
+    parser.add_argument("--start")
+    parser.add_argument("--end")
+    parser.add_argument("--min-confidence", type=float, default=Min_confidence)
+    parser.add_argument("--trade-fee", type=float, default=TRADE_FEE)
+    parser.add_argument("--max-allocation", type=float, default=MAX_ALLOCATION)
+    parser.add_argument("--initial-cash", type=float, default=100000)
+    parser.add_argument("--tape", help="用信号带（例如 logs/signal_tape.csv）代替规则策略")
+    parser.add_argument("--check", action="store_true", help="同时跑事件驱动回测并比对结果")
+    args = parser.parse_args()
+
+    params = {
+        "min_confidence": args.min_confidence,
+        "trade_fee": args.trade_fee,
+        "max_allocation": args.max_allocation,
+        "initial_cash": args.initial_cash,
+    }
+    strategy, prices = load_strategy(args.symbols, args.start, args.end, args.tape)
+    if args.check:
+        cross_check(strategy, args.symbols, args.start, args.end, **params)
+    else:
+        days, syms, actions, confidence = strategy.signal_matrix()
+        t0 = time.perf_counter()
+        result = run_vectorized(days, syms, actions, confidence, prices, **params)
+        print(f"📈 {len(days)} 天 × {len(syms)} 只股票：{result['trades']} 笔成交，手续费 {result['fees']:.2f}，"
+              f"期末净值 {result['final_nav']:.2f}，最大回撤 {result['max_drawdown']:.2%}"
+              f"（{time.perf_counter() - t0:.3f}s）")